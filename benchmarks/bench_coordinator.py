@@ -0,0 +1,314 @@
+"""
+Coordinator 离线基准测试
+    用确定性的离线聊天模型（src/mock/chat_model.py）替换 ChatDeepSeek，用进程内的离线待测智能体
+    （src/mock/fake_target.py）替换 src/mock 中的 HTTP 接口，端到端驱动 Coordinator，
+    测量框架自身的吞吐与开销：样本/秒、各阶段耗时与 LLM 调用分位数、峰值 RSS、事件循环延迟。
+    每个规模在独立的临时目录与子进程中运行（峰值 RSS 互不影响），结果可保存为 JSON 基线，用于比较不同提交。
+
+用法:
+    python benchmarks/bench_coordinator.py --sizes 10,100,1000,10000 --save benchmarks/baseline.json
+    python benchmarks/bench_coordinator.py --sizes 10,100 --compare benchmarks/baseline.json
+"""
+import argparse
+import asyncio
+import configparser
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DATASET_DIR = os.path.join(REPO_ROOT, "examples", "lab_agent_test", "datasets")
+BATCH_STAGES = ("describes", "evaluates", "analyze")
+
+
+def write_workdir(workdir: str, size: int, args: argparse.Namespace) -> None:
+    """
+    在 workdir 中生成 size 个样本的数据集，以及指向离线模型、离线待测智能体与这些数据的 config.ini。
+    Args:
+        workdir: 临时工作目录。
+        size: 样本数。
+        args: 命令行参数。
+    """
+    with open(os.path.join(DATASET_DIR, "test.json"), "r", encoding="utf-8") as f:
+        base_samples = json.load(f)
+    samples = []
+    for index in range(size):
+        sample = dict(base_samples[index % len(base_samples)])
+        sample["query"] = f"{sample['query']} #{index}"
+        samples.append(sample)
+    files = {
+        "test.json": samples,
+        "description.json": json.load(open(os.path.join(DATASET_DIR, "description.json"), encoding="utf-8")),
+        "extras_evaluator.json": [{"session_id": f"bench-session-{index}"} for index in range(size)],
+        "extras_profiler.json": {"session_id": "bench-session-profiler"},
+    }
+    for name, data in files.items():
+        with open(os.path.join(workdir, name), "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False)
+
+    config = configparser.ConfigParser()
+    config.read(os.path.join(REPO_ROOT, "config.ini"), encoding="utf-8")
+    results_dir = os.path.join(workdir, "results")
+    overrides = {
+        "prompts": {"prompt_template": os.path.join(REPO_ROOT, "src", "prompts.yaml")},
+        "agent": {
+            "memory_dir": os.path.join(workdir, "memory"),
+            "backup_memory_dir": os.path.join(workdir, "memory", "backup"),
+            "target_api_module": "src.mock.fake_target",
+        },
+        "llm": {
+            "rpm": "0",
+            "tpm": "0",
+            "chat_model_factory": "src.mock.chat_model:create_scripted_chat_model",
+        },
+        "mock": {
+            "llm_latency": str(args.llm_latency),
+            "target_latency": str(args.target_latency),
+            "tool_script": args.tool_script,
+        },
+        "log": {"console": "false"},
+        "agent_api_extras": {
+            "evaluator": os.path.join(workdir, "extras_evaluator.json"),
+            "profiler": os.path.join(workdir, "extras_profiler.json"),
+        },
+        "eval": {
+            "describer_output_file": os.path.join(results_dir, "described_test_samples.json"),
+            "evaluator_output_file": os.path.join(results_dir, "evaluation_results.json"),
+            "analysis_report_file": os.path.join(results_dir, "analysis_report.csv"),
+            "metrics_summary_file": os.path.join(results_dir, "metrics_summary.json"),
+            "metrics_calls_file": os.path.join(results_dir, "metrics_calls.jsonl"),
+            "target_latency_file": os.path.join(results_dir, "target_latency.json"),
+            "checkpoint_dir": os.path.join(results_dir, "checkpoints"),
+            "timeline_file": "",
+            "max_concurrency": str(args.max_concurrency),
+            "pack_max_samples": str(args.pack_max_samples),
+        },
+        "test": {
+            "test_data_file": os.path.join(workdir, "test.json"),
+            "test_description_file": os.path.join(workdir, "description.json"),
+        },
+    }
+    for section, values in overrides.items():
+        if not config.has_section(section):
+            config.add_section(section)
+        for key, value in values.items():
+            config.set(section, key, value)
+    os.makedirs(results_dir, exist_ok=True)
+    with open(os.path.join(workdir, "config.ini"), "w", encoding="utf-8") as f:
+        config.write(f)
+
+
+class LoopLagMonitor:
+    """周期性休眠 interval 秒，记录实际唤醒时间比预期晚了多少，用于衡量事件循环被阻塞的程度。"""
+
+    def __init__(self, interval: float = 0.01):
+        self.interval = interval
+        self.lags: List[float] = []
+        self._task: Optional[asyncio.Task] = None
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            start = loop.time()
+            await asyncio.sleep(self.interval)
+            self.lags.append(max(0.0, loop.time() - start - self.interval))
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> Dict[str, Any]:
+        from src.utils.metrics import percentile
+
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        lags_ms = [lag * 1000 for lag in self.lags]
+        return {
+            "samples": len(lags_ms),
+            "mean_ms": round(sum(lags_ms) / len(lags_ms), 3) if lags_ms else None,
+            "p99_ms": round(percentile(lags_ms, 99), 3) if lags_ms else None,
+            "max_ms": round(max(lags_ms), 3) if lags_ms else None,
+        }
+
+
+def _peak_rss_mb() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux 以 KB 为单位，macOS 以字节为单位
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+async def _bench(size: int, mode: str, workdir: str) -> Dict[str, Any]:
+    from src.eval.coordinator import Coordinator
+    from src.eval.utils.data_loader import DataLoader
+
+    coordinator = Coordinator(DataLoader())
+    monitor = LoopLagMonitor()
+    monitor.start()
+    stages: Dict[str, Dict[str, Any]] = {}
+    start = time.perf_counter()
+    for stage in (BATCH_STAGES if mode == "batch" else ("pipeline",)):
+        stage_start = time.perf_counter()
+        await getattr(coordinator, stage)()
+        seconds = time.perf_counter() - stage_start
+        stages[stage] = {"seconds": round(seconds, 3), "samples_per_second": round(size / seconds, 2)}
+    total_seconds = time.perf_counter() - start
+    loop_lag = await monitor.stop()
+
+    # 各阶段 LLM 调用的分位数耗时由 Coordinator 写入 metrics_summary.json
+    with open(os.path.join(workdir, "results", "metrics_summary.json"), "r", encoding="utf-8") as f:
+        metrics = json.load(f)
+    for stage, summary in metrics.items():
+        if stage in stages:
+            stages[stage]["llm"] = {
+                agent: {key: stats[key] for key in ("calls", "p50", "p95", "p99")}
+                for agent, stats in summary["llm"].items()
+            }
+            stages[stage]["llm_calls"] = summary["totals"]["llm_calls"]
+    return {
+        "samples": size,
+        "seconds": round(total_seconds, 3),
+        "samples_per_second": round(size / total_seconds, 2),
+        "peak_rss_mb": _peak_rss_mb(),
+        "loop_lag": loop_lag,
+        "stages": stages,
+    }
+
+
+def run_single(size: int, mode: str, workdir: str) -> Dict[str, Any]:
+    """子进程入口：在 workdir 中（读取其中的 config.ini）运行一次基准测试。"""
+    os.chdir(workdir)
+    sys.path.insert(0, REPO_ROOT)
+    # Configuration 要求配置 LLM 环境变量；离线模型不会使用它们
+    os.environ.setdefault("DS_API_KEY", "offline")
+    os.environ.setdefault("DS_BASE_URL", "http://offline.invalid")
+    os.environ.setdefault("DS_MODEL", "scripted-chat")
+    return asyncio.run(_bench(size, mode, workdir))
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        completed = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=REPO_ROOT, capture_output=True, text=True, check=True
+        )
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return completed.stdout.strip()
+
+
+def run_sizes(args: argparse.Namespace) -> Dict[str, Any]:
+    results: Dict[str, Any] = {}
+    for size in args.sizes:
+        with tempfile.TemporaryDirectory(prefix=f"agenteval-bench-{size}-") as workdir:
+            write_workdir(workdir, size, args)
+            completed = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), "--single", str(size), "--workdir", workdir,
+                 "--mode", args.mode],
+                stdout=subprocess.PIPE,
+                stderr=None if args.verbose else subprocess.PIPE,
+                text=True,
+            )
+            if completed.returncode != 0:
+                if completed.stderr:
+                    sys.stderr.write(completed.stderr[-4000:])
+                raise SystemExit(f"❌ {size} 个样本的基准测试失败（退出码 {completed.returncode}）")
+            result = json.loads(completed.stdout.strip().splitlines()[-1])
+        results[str(size)] = result
+        print(
+            f"{size:>6} 样本  {result['seconds']:>9.2f}s  {result['samples_per_second']:>9.2f} 样本/秒  "
+            f"峰值 RSS {result['peak_rss_mb']:>8.1f} MB  事件循环延迟 p99 {result['loop_lag']['p99_ms']} ms"
+        )
+    return {
+        "created_at": datetime.now().isoformat(timespec="seconds"),
+        "commit": _git_commit(),
+        "python": platform.python_version(),
+        "mode": args.mode,
+        "params": {
+            "llm_latency": args.llm_latency,
+            "target_latency": args.target_latency,
+            "tool_script": args.tool_script,
+            "max_concurrency": args.max_concurrency,
+            "pack_max_samples": args.pack_max_samples,
+        },
+        "results": results,
+    }
+
+
+def compare(report: Dict[str, Any], baseline: Dict[str, Any], tolerance: float) -> List[str]:
+    """
+    与基线比较，返回超出容差的退化项。
+    Args:
+        report: 本次结果。
+        baseline: 基线结果。
+        tolerance: 允许的相对退化比例，例如 0.2 表示吞吐下降或峰值 RSS 增长超过 20% 视为退化。
+    Returns:
+        退化描述列表。
+    """
+    if report["params"] != baseline.get("params") or report["mode"] != baseline.get("mode"):
+        print(f"⚠️ 基线参数不同：{baseline.get('mode')} {baseline.get('params')}")
+    regressions = []
+    print(f"与基线 {baseline.get('commit')}（{baseline.get('created_at')}）比较：")
+    for size, result in report["results"].items():
+        base = baseline.get("results", {}).get(size)
+        if base is None:
+            continue
+        for key, higher_is_better in (("samples_per_second", True), ("peak_rss_mb", False)):
+            change = (result[key] - base[key]) / base[key] if base[key] else 0.0
+            print(f"{size:>6} 样本  {key:<20}{base[key]:>10} → {result[key]:<10} ({change:+.1%})")
+            if (-change if higher_is_better else change) > tolerance:
+                regressions.append(f"{size} 个样本的 {key} 从 {base[key]} 变为 {result[key]}（{change:+.1%}）")
+    return regressions
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Coordinator 离线基准测试")
+    parser.add_argument("--sizes", type=lambda value: [int(size) for size in value.split(",")],
+                        default=[10, 100, 1000, 10000], help="以逗号分隔的样本数，默认 10,100,1000,10000")
+    parser.add_argument("--mode", choices=("batch", "pipeline"), default="batch",
+                        help="batch 依次执行 describes → evaluates → analyze，pipeline 使用流水线模式")
+    parser.add_argument("--llm-latency", type=float, default=0.0, help="离线模型每次调用的延迟（秒）")
+    parser.add_argument("--target-latency", type=float, default=0.0, help="离线待测智能体每次回复的延迟（秒）")
+    parser.add_argument("--tool-script", default="agent_chat_inference",
+                        help="evaluator 依次调用的工具，以逗号分隔")
+    parser.add_argument("--max-concurrency", type=int, default=4)
+    parser.add_argument("--pack-max-samples", type=int, default=1,
+                        help="打包模式每包的最大样本数，默认 1（与 config.ini 一致，不打包），大于 1 时测量打包模式")
+    parser.add_argument("--save", default=None, help="把结果保存为 JSON 基线")
+    parser.add_argument("--compare", default=None, help="与已有的 JSON 基线比较，出现退化时以非零状态退出")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="比较时允许的相对退化比例")
+    parser.add_argument("--verbose", action="store_true", help="显示子进程的日志与进度条")
+    parser.add_argument("--single", type=int, default=None, help=argparse.SUPPRESS)
+    parser.add_argument("--workdir", default=None, help=argparse.SUPPRESS)
+    return parser
+
+
+def main():
+    args = build_parser().parse_args()
+    if args.single is not None:
+        print(json.dumps(run_single(args.single, args.mode, args.workdir), ensure_ascii=False))
+        return
+
+    report = run_sizes(args)
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"结果已保存到 {args.save}")
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare(report, baseline, args.tolerance)
+        if regressions:
+            raise SystemExit("❌ 性能退化：\n" + "\n".join(regressions))
+
+
+if __name__ == "__main__":
+    main()
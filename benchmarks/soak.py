@@ -0,0 +1,261 @@
+"""
+Coordinator 负载与长稳测试
+    启动本地 OpenAI 兼容 LLM 桩服务（src/mock/llm_server.py），通过 DS_BASE_URL 让真实的 ChatDeepSeek 客户端连接它，
+    待测智能体使用进程内的离线实现（src/mock/fake_target.py）。与 bench_coordinator.py 不同，这里走真实的
+    HTTP 连接池、限流、重试与结构化输出校验路径，并可按概率注入延迟、429、5xx 与格式错误的结构化输出。
+    - load：注入故障跑一轮，检查每个样本都有评估结果与分析结果，输出吞吐与限流器统计；
+    - soak：在 --duration 秒内反复整轮运行，记录每轮的吞吐与当前 RSS，比较首尾四分之一的中位数，
+      内存增长或吞吐下降超过容差即以非零状态退出。
+
+用法:
+    python benchmarks/soak.py load --samples 200 --rate-429 0.05 --rate-5xx 0.02 --rate-malformed 0.05
+    python benchmarks/soak.py soak --duration 3600 --samples 50 --latency 0.2 --latency-sigma 0.5 --save soak.json
+"""
+import argparse
+import asyncio
+import csv
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from typing import Any, Dict, List
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from bench_coordinator import BATCH_STAGES, REPO_ROOT, _git_commit, _peak_rss_mb, write_workdir  # noqa: E402
+
+# 注入给桩服务的设置，对应 llm_server.DEFAULT_SETTINGS
+SERVER_OPTIONS = ("latency", "latency_sigma", "rate_429", "rate_5xx", "rate_malformed", "retry_after")
+
+
+def _current_rss_mb() -> float:
+    """当前常驻内存（MB），长稳测试需要看趋势而不是峰值；非 Linux 平台退化为峰值 RSS。"""
+    try:
+        with open("/proc/self/status", "r", encoding="utf-8") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    return _peak_rss_mb()
+
+
+def _completed_rows(workdir: str) -> Dict[str, int]:
+    results_dir = os.path.join(workdir, "results")
+    with open(os.path.join(results_dir, "evaluation_results.json"), "r", encoding="utf-8") as f:
+        evaluated = len(json.load(f))
+    with open(os.path.join(results_dir, "analysis_report.csv"), "r", encoding="utf-8", newline="") as f:
+        analyzed = max(0, sum(1 for _ in csv.reader(f)) - 1)
+    return {"evaluated": evaluated, "analyzed": analyzed}
+
+
+async def _rounds(size: int, workdir: str, duration: float, max_rounds: int) -> None:
+    from src.eval.coordinator import Coordinator
+    from src.eval.utils.data_loader import DataLoader
+    from src.utils.rate_limit import get_rate_limiter
+
+    deadline = time.monotonic() + duration
+    round_index = 0
+    while round_index < max_rounds and (round_index == 0 or time.monotonic() < deadline):
+        coordinator = Coordinator(DataLoader())
+        start = time.perf_counter()
+        for stage in BATCH_STAGES:
+            # resume 为 False：每轮清空检查点，完整重跑
+            await getattr(coordinator, stage)()
+        seconds = time.perf_counter() - start
+        record = {
+            "round": round_index,
+            "seconds": round(seconds, 3),
+            "samples_per_second": round(size / seconds, 2),
+            "rss_mb": _current_rss_mb(),
+            "rows": _completed_rows(workdir),
+            "limiter": get_rate_limiter().stats(),
+        }
+        # 每轮一行 JSON，父进程逐行读取
+        print(json.dumps(record, ensure_ascii=False), flush=True)
+        round_index += 1
+
+
+def run_child(size: int, workdir: str, duration: float, max_rounds: int) -> None:
+    """子进程入口：在 workdir 中（读取其中的 config.ini）反复运行 Coordinator。"""
+    os.chdir(workdir)
+    sys.path.insert(0, REPO_ROOT)
+    os.environ.setdefault("DS_API_KEY", "stub")
+    os.environ.setdefault("DS_MODEL", "deepseek-chat")
+    asyncio.run(_rounds(size, workdir, duration, max_rounds))
+
+
+def start_server(args: argparse.Namespace) -> "tuple[subprocess.Popen, str]":
+    """以子进程启动桩服务，返回进程与其地址。"""
+    command = [sys.executable, "-m", "src.mock.llm_server", "--port", "0", "--tool-script", args.tool_script]
+    for option in SERVER_OPTIONS:
+        command += [f"--{option.replace('_', '-')}", str(getattr(args, option))]
+    if args.seed is not None:
+        command += ["--seed", str(args.seed)]
+    server = subprocess.Popen(command, cwd=REPO_ROOT, stdout=subprocess.PIPE, text=True)
+    base_url = server.stdout.readline().strip() if server.stdout else ""
+    if not base_url.startswith("http"):
+        server.kill()
+        raise SystemExit("❌ 桩服务启动失败")
+    return server, base_url
+
+
+def server_stats(base_url: str) -> Dict[str, Any]:
+    import httpx
+
+    return httpx.get(f"{base_url}/_stats", timeout=5).json()["stats"]
+
+
+def check_rounds(rounds: List[Dict[str, Any]], size: int, args: argparse.Namespace) -> List[str]:
+    """
+    检查结果，返回问题列表。
+    Args:
+        rounds: 每轮的记录。
+        size: 每轮的样本数。
+        args: 命令行参数。
+    Returns:
+        问题描述列表，为空表示通过。
+    """
+    problems = []
+    for record in rounds:
+        for key, count in record["rows"].items():
+            if count != size:
+                problems.append(f"第 {record['round']} 轮 {key} 只有 {count}/{size} 行")
+    if args.scenario != "soak":
+        return problems
+    # 第一轮包含导入与连接建立，不参与趋势比较
+    steady = rounds[1:]
+    if len(steady) < 4:
+        problems.append(f"只完成了 {len(rounds)} 轮，不足以判断趋势，请增大 --duration 或减小 --samples")
+        return problems
+    quarter = max(1, len(steady) // 4)
+    head, tail = steady[:quarter], steady[-quarter:]
+    for key, higher_is_better in (("samples_per_second", True), ("rss_mb", False)):
+        before = statistics.median(record[key] for record in head)
+        after = statistics.median(record[key] for record in tail)
+        change = (after - before) / before if before else 0.0
+        print(f"{key:<20}首 {quarter} 轮中位数 {before:>10} → 末 {quarter} 轮中位数 {after:<10} ({change:+.1%})")
+        if (-change if higher_is_better else change) > args.tolerance:
+            problems.append(f"{key} 从 {before} 变为 {after}（{change:+.1%}）")
+    return problems
+
+
+def run_scenario(args: argparse.Namespace) -> Dict[str, Any]:
+    server, base_url = start_server(args)
+    rounds: List[Dict[str, Any]] = []
+    try:
+        with tempfile.TemporaryDirectory(prefix=f"agenteval-{args.scenario}-") as workdir:
+            # write_workdir 的离线模型延迟在这里不起作用，延迟由桩服务注入
+            args.llm_latency = 0.0
+            write_workdir(workdir, args.samples, args)
+            _use_stub(workdir, args)
+            env = {**os.environ, "DS_BASE_URL": base_url}
+            duration = args.duration if args.scenario == "soak" else 0
+            max_rounds = sys.maxsize if args.scenario == "soak" else 1
+            child = subprocess.Popen(
+                [sys.executable, os.path.abspath(__file__), "--child", str(args.samples), "--workdir", workdir,
+                 "--duration", str(duration), "--max-rounds", str(max_rounds)],
+                stdout=subprocess.PIPE, stderr=None if args.verbose else subprocess.DEVNULL, text=True, env=env,
+            )
+            assert child.stdout is not None
+            for line in child.stdout:
+                record = json.loads(line)
+                rounds.append(record)
+                limiter = record["limiter"]
+                print(
+                    f"第 {record['round']:>4} 轮  {record['seconds']:>8.2f}s  {record['samples_per_second']:>8.2f} 样本/秒  "
+                    f"RSS {record['rss_mb']:>7.1f} MB  重试 {limiter['retries']}（429 {limiter['rate_limited']}，"
+                    f"5xx {limiter['server_errors']}）失败 {limiter['failures']}",
+                    flush=True,
+                )
+            if child.wait() != 0:
+                raise SystemExit(f"❌ Coordinator 运行失败（退出码 {child.returncode}），可加 --verbose 查看日志")
+        stats = server_stats(base_url)
+    finally:
+        server.terminate()
+        server.wait()
+    print(f"桩服务统计：{stats}")
+    return {
+        "created_at": datetime.now().isoformat(timespec="seconds"),
+        "commit": _git_commit(),
+        "python": platform.python_version(),
+        "scenario": args.scenario,
+        "params": {
+            "samples": args.samples,
+            "duration": args.duration if args.scenario == "soak" else None,
+            "max_concurrency": args.max_concurrency,
+            "pack_max_samples": args.pack_max_samples,
+            **{option: getattr(args, option) for option in SERVER_OPTIONS},
+        },
+        "server": stats,
+        "rounds": rounds,
+    }
+
+
+def _use_stub(workdir: str, args: argparse.Namespace) -> None:
+    """把基准测试的 config.ini 从离线模型改为经由 HTTP 访问桩服务的 ChatDeepSeek。"""
+    import configparser
+
+    path = os.path.join(workdir, "config.ini")
+    config = configparser.ConfigParser()
+    config.read(path, encoding="utf-8")
+    config.set("llm", "chat_model_factory", "")
+    config.set("llm", "rpm", str(args.rpm))
+    config.set("llm", "tpm", "0")
+    with open(path, "w", encoding="utf-8") as f:
+        config.write(f)
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Coordinator 负载与长稳测试（本地 LLM 桩服务）")
+    parser.add_argument("scenario", nargs="?", choices=("load", "soak"), default="load")
+    parser.add_argument("--samples", type=int, default=100, help="每轮的样本数")
+    parser.add_argument("--duration", type=float, default=3600, help="soak 的持续时间（秒），默认 1 小时")
+    parser.add_argument("--tolerance", type=float, default=0.2,
+                        help="soak 允许的首尾相对变化比例（吞吐下降或 RSS 增长）")
+    parser.add_argument("--latency", type=float, default=0.05, help="桩服务延迟中位数（秒）")
+    parser.add_argument("--latency-sigma", type=float, default=0.5, help="桩服务对数正态延迟的 sigma")
+    parser.add_argument("--rate-429", type=float, default=0.02)
+    parser.add_argument("--rate-5xx", type=float, default=0.01)
+    parser.add_argument("--rate-malformed", type=float, default=0.0)
+    parser.add_argument("--retry-after", type=float, default=0.5, help="429 响应的 Retry-After（秒）")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--rpm", type=int, default=0, help="客户端限流的每分钟请求数，0 表示不限制")
+    parser.add_argument("--target-latency", type=float, default=0.0, help="离线待测智能体每次回复的延迟（秒）")
+    parser.add_argument("--tool-script", default="agent_chat_inference",
+                        help="evaluator 依次调用的工具，以逗号分隔")
+    parser.add_argument("--max-concurrency", type=int, default=8)
+    parser.add_argument("--pack-max-samples", type=int, default=1,
+                        help="打包模式每包的最大样本数，默认 1（与 config.ini 一致，不打包），大于 1 时测量打包模式")
+    parser.add_argument("--save", default=None, help="把结果保存为 JSON")
+    parser.add_argument("--verbose", action="store_true", help="显示子进程的日志与进度条")
+    parser.add_argument("--child", type=int, default=None, help=argparse.SUPPRESS)
+    parser.add_argument("--workdir", default=None, help=argparse.SUPPRESS)
+    parser.add_argument("--max-rounds", type=int, default=1, help=argparse.SUPPRESS)
+    return parser
+
+
+def main():
+    args = build_parser().parse_args()
+    if args.child is not None:
+        run_child(args.child, args.workdir, args.duration, args.max_rounds)
+        return
+
+    report = run_scenario(args)
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"结果已保存到 {args.save}")
+    problems = check_rounds(report["rounds"], args.samples, args)
+    if problems:
+        raise SystemExit("❌ 未通过：\n" + "\n".join(problems))
+    print("✅ 通过")
+
+
+if __name__ == "__main__":
+    main()
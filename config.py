@@ -1,12 +1,19 @@
 import configparser
 import json
 import os
-from typing import Any, Dict
+import threading
+from typing import Any, Dict, Optional
 from dotenv import load_dotenv
 import yaml
 
+# 配置与提示词在进程内只解析一次，修改文件后调用 reload_config() 重新加载
+_cache_lock = threading.Lock()
+_config: Optional[configparser.ConfigParser] = None
+_prompt_templates: Optional[dict] = None
+_configuration: Optional["Configuration"] = None
 
-def load_config():
+
+def _read_config() -> configparser.ConfigParser:
     config = configparser.ConfigParser()
     config_file_path = './config.ini'
     if not os.path.exists(config_file_path):
@@ -16,17 +23,50 @@ def load_config():
     return config
 
 
+def load_config() -> configparser.ConfigParser:
+    """返回进程内共享的 config.ini 解析结果，调用方不应修改返回的对象。"""
+    global _config
+    with _cache_lock:
+        if _config is None:
+            _config = _read_config()
+        return _config
+
+
 def load_prompt_templates() -> dict:
+    """返回进程内共享的提示词模板，调用方不应修改返回的对象。"""
+    global _prompt_templates
     config = load_config()
-    prompt_template_path = config.get('prompts', 'prompt_template')
-    if not os.path.exists(prompt_template_path):
-        raise FileNotFoundError(f"配置文件未找到: {prompt_template_path}")
-
-    with open(prompt_template_path, 'r', encoding='utf-8') as f:
-        # 使用 safe_load 防止执行任意代码，更安全
-        prompts = yaml.safe_load(f)
-    
-    return prompts
+    with _cache_lock:
+        if _prompt_templates is None:
+            prompt_template_path = config.get('prompts', 'prompt_template')
+            if not os.path.exists(prompt_template_path):
+                raise FileNotFoundError(f"配置文件未找到: {prompt_template_path}")
+
+            with open(prompt_template_path, 'r', encoding='utf-8') as f:
+                # 使用 safe_load 防止执行任意代码，更安全
+                _prompt_templates = yaml.safe_load(f)
+        return _prompt_templates
+
+
+def get_configuration() -> "Configuration":
+    """返回进程内共享的 LLM 配置（.env 只读取一次）。"""
+    global _configuration
+    with _cache_lock:
+        if _configuration is None:
+            _configuration = Configuration()
+        return _configuration
+
+
+def reload_config() -> None:
+    """
+    清空已缓存的 config.ini、提示词模板与 LLM 配置，下次访问时重新读取。
+    注意：各智能体模块导入时读取的系统提示词常量不会随之更新。
+    """
+    global _config, _prompt_templates, _configuration
+    with _cache_lock:
+        _config = None
+        _prompt_templates = None
+        _configuration = None
 
 class Configuration:
     """读取 .env"""
@@ -1,33 +1,93 @@
+import json
+from typing import AsyncIterator, Optional
+
 import requests
 
-def agent_api_health_check() -> dict:
-    url = "http://127.0.0.1:8001/health/"
+from src.tools.target_client import get_target_http_client, target_timeouts
+from src.utils.logger import logger
+
+BASE_URL = "http://127.0.0.1:8001"
+# 服务的流式接口（SSE，每行 "data: {"delta": "..."}"，以 "data: [DONE]" 结束）；
+# 返回 404 / 405 时认为服务不支持流式输出，之后改用 /chat
+STREAM_PATH = "/chat/stream"
+_stream_supported: Optional[bool] = None
+# 同步调用共用一个 Session，复用 keep-alive 连接
+_session = requests.Session()
+
 
-    resp = requests.get(url, timeout=500)
-    if resp.status_code == 200:
+def _parse_health(status_code: int, text: str) -> dict:
+    if status_code == 200:
         return {"status":200, "message":"智能体正常"}
     else:
-        return {"status":resp.status_code, "message":"智能体异常", "details": resp.text}
+        return {"status":status_code, "message":"智能体异常", "details": text}
+
+
+def agent_api_health_check() -> dict:
+    resp = _session.get(f"{BASE_URL}/health/", timeout=target_timeouts())
+    return _parse_health(resp.status_code, resp.text)
+
 
 def agent_api_inference(query: str, session_id: str) -> str:
-    url = "http://127.0.0.1:8001/chat"
-    headers = {
-        "Content-Type": "application/json"
+    payload = {
+        "query": query,
+        "session_id": session_id
     }
 
+    response = _session.post(url=f"{BASE_URL}/chat", json=payload, timeout=target_timeouts())
+
+    response.raise_for_status()
+    result = response.json()
+    # print(result)
+    return result.get("log", "")
+
+
+async def aagent_api_health_check() -> dict:
+    resp = await get_target_http_client().get(f"{BASE_URL}/health/")
+    return _parse_health(resp.status_code, resp.text)
+
+
+async def aagent_api_inference(query: str, session_id: str) -> str:
     payload = {
         "query": query,
         "session_id": session_id
     }
 
-    response = requests.post(
-        url=url,
-        json=payload,
-        headers=headers,
-        timeout=30000
-    )
+    response = await get_target_http_client().post(f"{BASE_URL}/chat", json=payload)
 
     response.raise_for_status()
     result = response.json()
-    # print(result)
-    return result.get("log", "")
\ No newline at end of file
+    return result.get("log", "")
+
+
+async def aagent_api_stream(query: str, session_id: str) -> AsyncIterator[str]:
+    global _stream_supported
+    if _stream_supported is False:
+        yield await aagent_api_inference(query, session_id)
+        return
+
+    payload = {
+        "query": query,
+        "session_id": session_id
+    }
+
+    async with get_target_http_client().stream("POST", f"{BASE_URL}{STREAM_PATH}", json=payload) as response:
+        if response.status_code in (404, 405):
+            logger.info(f"{BASE_URL}{STREAM_PATH} 不可用（{response.status_code}），改用非流式接口")
+            _stream_supported = False
+        else:
+            response.raise_for_status()
+            _stream_supported = True
+            async for line in response.aiter_lines():
+                if not line.startswith("data:"):
+                    continue
+                data = line[len("data:"):].strip()
+                if data == "[DONE]":
+                    return
+                try:
+                    delta = json.loads(data)
+                except json.JSONDecodeError:
+                    yield data
+                    continue
+                yield delta.get("delta", "") if isinstance(delta, dict) else str(delta)
+            return
+    yield await aagent_api_inference(query, session_id)
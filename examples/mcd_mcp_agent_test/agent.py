@@ -1,14 +1,17 @@
 from langchain_mcp_adapters.client import MultiServerMCPClient
 import asyncio
-from typing import Any, Dict, Optional
+from typing import Any, AsyncIterator, Dict, Optional
 
 from loguru import logger
 from langchain.agents import create_agent
-from langchain_deepseek import ChatDeepSeek
 from langchain_core.messages import HumanMessage, BaseMessage
 from config import Configuration
+from src.agents.cache import get_agent, tool_names
+from src.tools.inprocess_target import MCPToolCache, stream_tokens, streaming_chat_model
 from src.utils.memory import FileMemory
-from src.utils.callback import SyncCallbackHandler
+from src.utils.callback import get_trace_handler
+from src.utils.metrics import ainvoke_with_metrics
+from src.utils.rate_limit import RateLimitMiddleware
 import json
 import os
 MCDAgent_SYSTEM_PROMPT = "你是麦当劳的智能助手，专注于帮助用户完成各种任务。你拥有访问多种工具的能力，可以根据用户的需求选择合适的工具来提供帮助。请确保在回答用户问题时，充分利用可用的工具，以提供准确和有用的信息。"
@@ -31,6 +34,8 @@ def load_mcp_config():
 
 servers = load_mcp_config()
 mcp_client = MultiServerMCPClient(servers)
+# MCP 会话与工具列表按事件循环缓存，过期后重新列出
+mcp_tools = MCPToolCache(mcp_client)
 
 class MCDAgent:
     """Profiler Agent ，无状态调用 Agent 并管理对话历史。"""
@@ -51,26 +56,15 @@ class MCDAgent:
 
         initial_messages = []
 
-        mcd_tools = await mcp_client.get_tools()
-
-        llm = ChatDeepSeek(
-            model=self.config.model, # type: ignore
-            api_key=self.config.api_key, # type: ignore
-            base_url=self.config.base_url,
-            callbacks=[SyncCallbackHandler()],
-        )
-        agent = create_agent(
-            model=llm,
-            tools=mcd_tools,
-            system_prompt=MCDAgent_SYSTEM_PROMPT,
-        )
+        agent = await self._agent()
 
         user_message = HumanMessage(input_data.get("input", ""))
 
-        agent_response = await agent.ainvoke({
+        # 作为待测智能体在评估进程内运行时，其 LLM 调用单独记为 target
+        agent_response = await ainvoke_with_metrics(agent, {
             "messages": initial_messages + [user_message] # type: ignore
         },
-        config={"callbacks": [SyncCallbackHandler()]}
+        "target", config, callbacks=[get_trace_handler()]
         )
 
         messages_to_save = [
@@ -81,6 +75,32 @@ class MCDAgent:
 
         return {"messages": agent_response["messages"]}
 
+    def astream(self, input_data: Dict[str, Any], config: Optional[Dict[str, Any]] = None) -> AsyncIterator[str]:
+        """
+        流式调用 麦当劳 Agent，逐个产出模型输出的 token；调用工具之前输出的文本之后跟着 STREAM_RESET，
+        经 consume_stream 读取得到的回复与 ainvoke 的最终消息一致。
+        Args:
+            input_data: 包含输入数据的字典，必须包含 "input" 键。
+            config: 可选的配置字典，用于覆盖默认配置。
+        Returns:
+            token（或 STREAM_RESET）的异步迭代器；完整结束时与 ainvoke 一样保存对话历史，提前中止时取消调用。
+        """
+        return stream_tokens(lambda: self.ainvoke(input_data, config))
+
+    async def _agent(self):
+        # 工具集不变时复用缓存的 LLM 客户端与编译好的智能体；模型以流式调用，供 astream 逐个产出 token
+        version, mcd_tools = await mcp_tools.get_tools()
+        return get_agent(
+            self.config,
+            ("mcd", version, MCDAgent_SYSTEM_PROMPT, tool_names(mcd_tools)),
+            lambda llm: create_agent(
+                model=streaming_chat_model(llm),
+                middleware=[RateLimitMiddleware()],
+                tools=mcd_tools,
+                system_prompt=MCDAgent_SYSTEM_PROMPT,
+            ),
+        )
+
 async def main():
     config = Configuration()
     mcd_agent = MCDAgent(config)
@@ -1,18 +1,29 @@
-import asyncio
+from typing import AsyncIterator, Optional
+
 from examples.mcd_mcp_agent_test.agent import MCDAgent
-mcd_agent = MCDAgent()
+from src.tools.inprocess_target import InProcessTarget
 
-def agent_api_health_check() -> dict:
+mcd_agent = MCDAgent()
 
-    return {"status":200, "message":"智能体正常"}
 
-def agent_api_inference(query: str) -> str:
-    input_data = {
-        "input": query
-    }
-    response = asyncio.run(mcd_agent.ainvoke(input_data))
+async def _answer(query: str, session_id: Optional[str] = None) -> str:
+    # 每次查询都是独立对话，不使用 session_id
+    response = await mcd_agent.ainvoke({"input": query})
     return response["messages"][-1].content
 
+
+def _stream(query: str, session_id: Optional[str] = None) -> AsyncIterator[str]:
+    return mcd_agent.astream({"input": query})
+
+
+# 智能体在评估进程内运行：异步入口直接在评估的事件循环中执行，可并发评估多个样本
+target = InProcessTarget(_answer, stream=_stream)
+agent_api_inference = target.agent_api_inference
+aagent_api_inference = target.aagent_api_inference
+aagent_api_stream = target.aagent_api_stream
+agent_api_health_check = target.agent_api_health_check
+aagent_api_health_check = target.aagent_api_health_check
+
 if __name__ == "__main__":
     # 测试健康检查接口
     health_status = agent_api_health_check()
@@ -21,4 +32,4 @@ if __name__ == "__main__":
     # 测试推理接口
     test_query = "你可以干什么"
     inference_response = agent_api_inference(test_query)
-    print(f"Inference Response: {inference_response}")
\ No newline at end of file
+    print(f"Inference Response: {inference_response}")
@@ -1,5 +1,190 @@
+import argparse
+import asyncio
+import os
+import subprocess
+import sys
+
+# worker 进程与命令行启动时需要导入的入口模块，import-time 命令逐个在全新解释器中测量其导入耗时
+IMPORT_TIME_MODULES = ("config", "src.agents", "src.eval.coordinator", "src.eval.runner")
+
+TIMELINE_HELP = "把本次运行的阶段、样本、LLM 与工具调用时间线导出为 Chrome Trace JSON，默认读取 [eval] timeline_file"
+CASSETTE_HELP = "录制（record）或回放（replay）待测智能体的回复，默认读取 [eval] cassette_mode"
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="AgentEval 命令行入口")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    profile_parser = subparsers.add_parser("profile", help="分析待测智能体")
+    profile_parser.add_argument("--query", default="请分析这个智能体的设计目的和使用的工具。")
+    profile_parser.add_argument("--recursion-limit", type=int, default=25)
+    profile_parser.add_argument("--timeline", default=None, help=TIMELINE_HELP)
+    profile_parser.add_argument("--cassette", choices=("off", "record", "replay"), default=None, help=CASSETTE_HELP)
+
+    for command, help_text in (
+        ("describes", "描述测试样本"),
+        ("evaluates", "评估测试样本"),
+        ("analyze", "分析评估结果并生成报告"),
+        ("pipeline", "以流水线模式执行 describes → evaluates → analyze"),
+        ("build", "增量重建，只重新计算输入发生变化的行"),
+    ):
+        stage_parser = subparsers.add_parser(command, help=help_text)
+        # build 总是复用检查点日志中输入哈希未变的行，不需要 --resume
+        if command != "build":
+            stage_parser.add_argument("--resume", action="store_true", help="跳过检查点日志中已完成的样本")
+        stage_parser.add_argument("--max-concurrency", type=int, default=None)
+        stage_parser.add_argument("--timeline", default=None, help=TIMELINE_HELP)
+        stage_parser.add_argument("--cassette", choices=("off", "record", "replay"), default=None, help=CASSETTE_HELP)
+
+    rerun_parser = subparsers.add_parser("rerun", help="只重新评估上一次报告中未通过或置信度过低的样本")
+    rerun_parser.add_argument(
+        "--test-result", action="append", dest="test_results", default=None,
+        help="需要重新评估的测试结果，可重复指定，默认为 失败/部分通过/未知",
+    )
+    rerun_parser.add_argument("--min-confidence", type=float, default=None)
+    rerun_parser.add_argument("--report-file", default=None, help="上一次的分析报告，默认为配置中的 analysis_report_file")
+    rerun_parser.add_argument("--max-concurrency", type=int, default=None)
+    rerun_parser.add_argument("--timeline", default=None, help=TIMELINE_HELP)
+    rerun_parser.add_argument("--cassette", choices=("off", "record", "replay"), default=None, help=CASSETTE_HELP)
+
+    run_parser = subparsers.add_parser("run", help="多进程分片执行整个测试集并合并结果")
+    run_parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="本机 worker 进程数")
+    run_parser.add_argument("--queue", default=None, help="任务队列文件，默认读取 [runner] queue_file")
+    run_parser.add_argument("--max-concurrency", type=int, default=None, help="每个 worker 同时执行的会话数")
+    run_parser.add_argument("--reset", action="store_true", help="清空队列中已有的任务与结果")
+
+    worker_parser = subparsers.add_parser("worker", help="加入已有队列领取任务（可在其他共享存储的机器上运行）")
+    worker_parser.add_argument("--queue", default=None, help="任务队列文件，默认读取 [runner] queue_file")
+    worker_parser.add_argument("--max-concurrency", type=int, default=None, help="同时执行的会话数")
+    worker_parser.add_argument(
+        "--rate-share", type=int, default=1, help="共用 [llm] rpm / tpm 配额的 worker 总数，本进程的限额为配置值的 1/N"
+    )
+
+    merge_parser = subparsers.add_parser("merge", help="将队列中的结果合并为标准产物")
+    merge_parser.add_argument("--queue", default=None, help="任务队列文件，默认读取 [runner] queue_file")
+
+    import_time_parser = subparsers.add_parser("import-time", help="测量入口模块的导入耗时并检查是否超出预算")
+    import_time_parser.add_argument("--budget", type=float, default=None, help="单个模块的导入耗时预算（秒），默认读取 [runner] import_budget")
+
+    load_parser = subparsers.add_parser("load", help="不经过 evaluator，逐级加压调用待测智能体，输出吞吐、延迟与饱和点")
+    load_parser.add_argument("--mode", choices=("rps", "concurrency"), default=None, help="默认读取 [loadgen] mode")
+    load_parser.add_argument("--start", type=float, default=None, help="第一个阶梯的每秒到达数或并发数")
+    load_parser.add_argument("--end", type=float, default=None, help="最后一个阶梯的每秒到达数或并发数")
+    load_parser.add_argument("--steps", type=int, default=None)
+    load_parser.add_argument("--duration", type=float, default=None, help="总时长（秒）")
+    load_parser.add_argument("--sessions", type=int, default=None, help="轮流使用的 session_id 数，0 表示每个请求使用新会话")
+    load_parser.add_argument("--max-inflight", type=int, default=None)
+    load_parser.add_argument("--source", choices=("test", "described"), default=None)
+    load_parser.add_argument("--stream", action="store_true", default=None, help="以流式调用并记录首字延迟")
+    load_parser.add_argument("--report-file", default=None)
+
+    return parser
+
+
+async def run(args: argparse.Namespace):
+    from src.eval.coordinator import Coordinator
+    from src.eval.utils.analysis import RERUN_TEST_RESULTS
+    from src.eval.utils.data_loader import DataLoader
+
+    if args.command == "profile":
+        coordinator = Coordinator(DataLoader())
+        return await coordinator.profile(args.recursion_limit, args.query)
+
+    coordinator = Coordinator(DataLoader(), max_concurrency=args.max_concurrency)
+    if args.command == "describes":
+        return await coordinator.describes(resume=args.resume)
+    if args.command == "evaluates":
+        return await coordinator.evaluates(resume=args.resume)
+    if args.command == "analyze":
+        return await coordinator.analyze(resume=args.resume)
+    if args.command == "build":
+        return await coordinator.build()
+    if args.command == "rerun":
+        return await coordinator.rerun(
+            test_results=args.test_results or RERUN_TEST_RESULTS,
+            min_confidence=args.min_confidence,
+            report_file=args.report_file,
+        )
+    return await coordinator.pipeline(resume=args.resume)
+
+
+def run_sharded_command(args: argparse.Namespace):
+    from src.eval.runner import merge_results, open_queue, run_sharded, run_worker
+    from src.utils.rate_limit import configure_rate_limiter
+
+    if args.command == "run":
+        return run_sharded(args.workers, args.queue, args.max_concurrency, reset=args.reset)
+    if args.command == "worker":
+        configure_rate_limiter(args.rate_share)
+        return asyncio.run(run_worker(open_queue(args.queue), concurrency=args.max_concurrency))
+    return merge_results(open_queue(args.queue))
+
+
+def coordinator_command(args: argparse.Namespace):
+    """执行编排器命令；开启时间线时，运行结束（包括中途失败）后写出已记录的部分。"""
+    from src.utils.cassette import get_cassette, set_cassette_mode
+    from src.utils.logger import logger
+    from src.utils.timeline import enable_timeline, get_timeline
+
+    if args.timeline:
+        enable_timeline(args.timeline)
+    if args.cassette:
+        set_cassette_mode(args.cassette)
+    try:
+        return asyncio.run(run(args))
+    finally:
+        timeline = get_timeline()
+        if timeline is not None:
+            logger.info(f"时间线已写入 {timeline.save()}")
+        cassette = get_cassette()
+        if cassette is not None:
+            logger.info(f"待测智能体磁带 {cassette.file_path}: {cassette.stats()}")
+
+
+def load_command(args: argparse.Namespace) -> str:
+    from src.eval.loadgen import run_load
+
+    return asyncio.run(run_load(
+        mode=args.mode, start=args.start, end=args.end, steps=args.steps, duration=args.duration,
+        sessions=args.sessions, max_inflight=args.max_inflight, source=args.source, stream=args.stream,
+        report_file=args.report_file,
+    ))
+
+
+def import_time_command(args: argparse.Namespace) -> str:
+    """在全新解释器中逐个导入入口模块并计时，任一模块超出预算时以非零状态退出。"""
+    from config import load_config
+
+    budget = args.budget
+    if budget is None:
+        budget = load_config().getfloat("runner", "import_budget", fallback=3.0)
+    lines, over_budget = [], []
+    for module in IMPORT_TIME_MODULES:
+        code = f"import time; start = time.perf_counter(); import {module}; print(time.perf_counter() - start)"
+        completed = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True)
+        seconds = float(completed.stdout.strip().splitlines()[-1])
+        if seconds > budget:
+            over_budget.append(module)
+        lines.append(f"{module:<24}{seconds:8.3f}s{'  ❌' if seconds > budget else ''}")
+    report = "\n".join(lines + [f"预算 {budget:.3f}s"])
+    if over_budget:
+        raise SystemExit(f"{report}\n❌ 导入耗时超出预算: {', '.join(over_budget)}")
+    return report
+
+
 def main():
-    print("Hello from agenteval!")
+    args = build_parser().parse_args()
+    if args.command == "import-time":
+        result = import_time_command(args)
+    elif args.command in ("run", "worker", "merge"):
+        result = run_sharded_command(args)
+    elif args.command == "load":
+        result = load_command(args)
+    else:
+        result = coordinator_command(args)
+    if isinstance(result, str):
+        print(result)
+
 
 if __name__ == "__main__":
     main()
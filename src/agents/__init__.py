@@ -1,6 +1,26 @@
-from .evaluator.agent import EvaluatorAgent
-from .profiler.agent import ProfilerAgent
-from .describer.agent import DescriberAgent
-from .analyst.agent import AnalystAgent
+from importlib import import_module
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from .evaluator.agent import EvaluatorAgent
+    from .profiler.agent import ProfilerAgent
+    from .describer.agent import DescriberAgent
+    from .analyst.agent import AnalystAgent
 
 __all__ = ["EvaluatorAgent", "ProfilerAgent", "DescriberAgent", "AnalystAgent"]
+
+# 按需导入各智能体模块，只用到其中一个智能体的进程不必加载其余模块及其工具依赖
+_AGENT_MODULES = {
+    "EvaluatorAgent": ".evaluator.agent",
+    "ProfilerAgent": ".profiler.agent",
+    "DescriberAgent": ".describer.agent",
+    "AnalystAgent": ".analyst.agent",
+}
+
+
+def __getattr__(name: str):
+    if name in _AGENT_MODULES:
+        value = getattr(import_module(_AGENT_MODULES[name], __name__), name)
+        globals()[name] = value
+        return value
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -1,23 +1,28 @@
 import asyncio
-from typing import Any, Dict, Optional
+from typing import Any, Dict, List, Optional
 import json
 from loguru import logger
 from langchain.agents import create_agent
-from langchain_deepseek import ChatDeepSeek
 from langchain_core.messages import HumanMessage
 
-from config import Configuration, load_prompt_templates
-from src.utils.callback import SyncCallbackHandler
+from config import Configuration, get_configuration, load_prompt_templates
+from src.utils.callback import get_trace_handler
+from src.utils.rate_limit import RateLimitMiddleware
+from src.utils.response_cache import ResponseCacheMiddleware
+from src.utils.usage import UsageMiddleware
+from src.utils.metrics import ainvoke_with_metrics
+from src.agents.cache import get_agent
 from config import load_config
-from src.agents.analyst.schema import AnalystAgentResponse
+from src.agents.analyst.schema import AnalystAgentPackResponse, AnalystAgentResponse
+from src.agents.packing import check_pack_size, format_pack
 from datetime import datetime
 
 AnalystAgent_SYSTEM_PROMPT = load_prompt_templates()["analyst"]["system_prompt"]
 class AnalystAgent:
     """Analyst Agent ，无状态调用 Agent 并管理对话历史。"""
 
-    def __init__(self, config: Configuration = Configuration()) -> None:
-        self.config = config
+    def __init__(self, config: Optional[Configuration] = None) -> None:
+        self.config = config or get_configuration()
 
     async def ainvoke(self, input_data: Dict[str, Any], config: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
         """
@@ -32,31 +37,63 @@ class AnalystAgent:
 
         initial_messages = []
 
-        llm = ChatDeepSeek(
-            model=self.config.model, # type: ignore
-            api_key=self.config.api_key, # type: ignore
-            base_url=self.config.base_url,
-            callbacks=[SyncCallbackHandler()],
-        )
-        agent = create_agent(
-            model=llm,
-            tools=[],
-            system_prompt=AnalystAgent_SYSTEM_PROMPT,
-            response_format=AnalystAgentResponse
+        # 复用缓存的 LLM 客户端与编译好的智能体，只在首次调用时创建
+        agent = get_agent(
+            self.config,
+            ("analyst", AnalystAgent_SYSTEM_PROMPT, AnalystAgentResponse.__name__),
+            lambda llm: create_agent(
+                model=llm,
+                middleware=[ResponseCacheMiddleware("analyst"), RateLimitMiddleware(), UsageMiddleware("analyst")],
+                tools=[],
+                system_prompt=AnalystAgent_SYSTEM_PROMPT,
+                response_format=AnalystAgentResponse
+            ),
         )
 
         user_message = HumanMessage(input_data.get("input", ""))
-        agent_response = await agent.ainvoke({
+        agent_response = await ainvoke_with_metrics(agent, {
             "messages": initial_messages + [user_message] # type: ignore
         },
-        config={"callbacks": [SyncCallbackHandler()]}
+        "analyst", config, callbacks=[get_trace_handler()]
         )
         structured = agent_response["structured_response"]
-        structed_output = structured.model_dump_json()
-        structed_json_output = json.loads(structed_output)
-        # 加入时间戳
-        structed_json_output['evaluation_time'] = datetime.now().isoformat()
-        return {"messages": structed_json_output}
+        return {"messages": _to_output(structured)}
+
+    async def ainvoke_packed(self, inputs: List[str]) -> List[Dict[str, Any]]:
+        """
+        打包模式：一次调用分析多个样本。
+        Args:
+            inputs: 样本输入列表。
+        Returns:
+            与 inputs 顺序一致的分析结果列表；返回条数不符时抛出 PackError。
+        """
+        agent = get_agent(
+            self.config,
+            ("analyst_packed", AnalystAgent_SYSTEM_PROMPT, AnalystAgentPackResponse.__name__),
+            lambda llm: create_agent(
+                model=llm,
+                middleware=[ResponseCacheMiddleware("analyst_packed"), RateLimitMiddleware(), UsageMiddleware("analyst_packed")],
+                tools=[],
+                system_prompt=AnalystAgent_SYSTEM_PROMPT,
+                response_format=AnalystAgentPackResponse
+            ),
+        )
+        agent_response = await ainvoke_with_metrics(agent, {
+            "messages": [HumanMessage(format_pack(inputs))] # type: ignore
+        },
+        "analyst_packed", None, callbacks=[get_trace_handler()]
+        )
+        results = check_pack_size(agent_response["structured_response"].results, len(inputs))
+        return [_to_output(structured) for structured in results]
+
+
+def _to_output(structured: AnalystAgentResponse) -> Dict[str, Any]:
+    structed_output = structured.model_dump_json()
+    structed_json_output = json.loads(structed_output)
+    # 加入时间戳
+    structed_json_output['evaluation_time'] = datetime.now().isoformat()
+    return structed_json_output
+
 
 async def main():
     # config = Configuration()
@@ -57,4 +57,12 @@ class AnalystAgentResponse(BaseModel):
     # evaluation_time : 时间戳 datetime.datetime.now().isoformat()
     #
     # ━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
-    
\ No newline at end of file
+    
+
+class AnalystAgentPackResponse(BaseModel):
+    """Analyst Agent 打包模式的输出格式"""
+
+    results: List[AnalystAgentResponse] = Field(
+        ...,
+        description="与输入样本一一对应的分析结果，顺序与样本编号一致"
+    )
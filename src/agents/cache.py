@@ -0,0 +1,133 @@
+"""
+智能体与 LLM 客户端缓存
+    同一进程内复用 ChatDeepSeek 客户端（共享带 keep-alive 连接池的 httpx.AsyncClient）与编译好的 LangGraph 智能体，
+    每个样本只需要付出模型调用本身的开销。httpx.AsyncClient 绑定事件循环，因此缓存按事件循环隔离。
+"""
+import asyncio
+import threading
+import weakref
+from importlib import import_module
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+import httpx
+from langchain_core.language_models import BaseChatModel
+
+from config import Configuration, load_config
+from src.utils.callback import get_trace_handler
+from src.utils.timeline import timeline_callbacks
+from src.utils.metrics import get_metrics_collector
+
+# 创建智能体时会嵌套获取 LLM 客户端，因此使用可重入锁
+_lock = threading.RLock()
+# 事件循环 → 该循环内的缓存；没有运行中的事件循环时使用 _default_cache
+_loop_caches: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[Hashable, Any]]" = weakref.WeakKeyDictionary()
+_default_cache: Dict[Hashable, Any] = {}
+
+
+def _cache() -> Dict[Hashable, Any]:
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        return _default_cache
+    cache = _loop_caches.get(loop)
+    if cache is None:
+        cache = _loop_caches[loop] = {}
+    return cache
+
+
+def _cached(key: Hashable, factory: Callable[[], Any]) -> Any:
+    with _lock:
+        cache = _cache()
+        if key not in cache:
+            cache[key] = factory()
+        return cache[key]
+
+
+def _model_key(config: Configuration) -> Tuple:
+    return (config.model, config.base_url, config.api_key)
+
+
+def get_http_async_client() -> httpx.AsyncClient:
+    """获取当前事件循环内共享的 httpx.AsyncClient，连接池参数读取自 config.ini 的 [llm] 段。"""
+
+    def build() -> httpx.AsyncClient:
+        config = load_config()
+        limits = httpx.Limits(
+            max_connections=config.getint("llm", "max_connections", fallback=100),
+            max_keepalive_connections=config.getint("llm", "max_keepalive_connections", fallback=20),
+            keepalive_expiry=config.getfloat("llm", "keepalive_expiry", fallback=60.0),
+        )
+        timeout = httpx.Timeout(
+            config.getfloat("llm", "request_timeout", fallback=300.0),
+            connect=config.getfloat("llm", "connect_timeout", fallback=10.0),
+        )
+        return httpx.AsyncClient(limits=limits, timeout=timeout)
+
+    return _cached(("http_async_client",), build)
+
+
+def _chat_model_factory() -> Optional[Callable[..., BaseChatModel]]:
+    """读取 [llm] chat_model_factory（"模块:函数"），未配置时返回 None。"""
+    target = load_config().get("llm", "chat_model_factory", fallback="").strip()
+    if not target:
+        return None
+    module_name, _, attr = target.partition(":")
+    return getattr(import_module(module_name), attr)
+
+
+def get_chat_model(config: Configuration) -> BaseChatModel:
+    """
+    获取复用连接池的 ChatDeepSeek 客户端，相同模型配置只创建一次。
+    配置了 [llm] chat_model_factory 时改为调用该函数创建模型（例如基准测试中的离线假模型），
+    函数接收 config 与 callbacks 两个关键字参数。
+    """
+
+    def build() -> BaseChatModel:
+        # 指标回调同时挂在模型上：Python 3.10 下节点内的模型调用不会继承外层 RunnableConfig 的回调
+        callbacks = [get_trace_handler(), get_metrics_collector(), *timeline_callbacks()]
+        factory = _chat_model_factory()
+        if factory is not None:
+            return factory(config=config, callbacks=callbacks)
+
+        # langchain_deepseek（连同 openai SDK）导入较慢，推迟到首次创建客户端时
+        from langchain_deepseek import ChatDeepSeek
+
+        return ChatDeepSeek(
+            model=config.model,  # type: ignore
+            api_key=config.api_key,  # type: ignore
+            # ChatDeepSeek 的地址字段是 api_base，传 base_url 会被忽略而连到官方地址
+            api_base=config.base_url,  # type: ignore
+            callbacks=callbacks,
+            # 重试由共享限流器统一处理，避免客户端各自重试绕过限流
+            max_retries=0,
+            http_async_client=get_http_async_client(),
+        )
+
+    return _cached(("chat_model",) + _model_key(config), build)
+
+
+def get_agent(config: Configuration, key: Hashable, build: Callable[[BaseChatModel], Any]) -> Any:
+    """
+    获取编译好的智能体，只在缓存未命中时调用 build 创建。
+    Args:
+        config: LLM 配置。
+        key: 智能体的标识，应包含工具、系统提示词、结构化输出格式等决定智能体行为的内容。
+        build: 接收 LLM 客户端并返回智能体的函数。
+    Returns:
+        编译好的智能体。
+    """
+    return _cached(("agent", key) + _model_key(config), lambda: build(get_chat_model(config)))
+
+
+def tool_names(tools) -> Tuple[str, ...]:
+    return tuple(getattr(tool, "name", str(tool)) for tool in tools)
+
+
+def clear_cache(loop: Optional[asyncio.AbstractEventLoop] = None) -> None:
+    """清空缓存（例如修改提示词或配置后需要重建智能体时）。"""
+    with _lock:
+        if loop is None:
+            _loop_caches.clear()
+            _default_cache.clear()
+        else:
+            _loop_caches.pop(loop, None)
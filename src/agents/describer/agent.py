@@ -1,26 +1,44 @@
 import asyncio
-from typing import Any, Dict, Optional
+import os
+from typing import Any, Dict, List, Optional
 import json
 from loguru import logger
 from langchain.agents import create_agent
-from langchain_deepseek import ChatDeepSeek
 from langchain_core.messages import HumanMessage
 
-from config import Configuration, load_prompt_templates
-from src.utils.callback import SyncCallbackHandler
+from config import Configuration, get_configuration, load_prompt_templates
+from src.utils.callback import get_trace_handler
+from src.utils.rate_limit import RateLimitMiddleware
+from src.utils.response_cache import ResponseCacheMiddleware
+from src.utils.usage import UsageMiddleware
+from src.utils.metrics import ainvoke_with_metrics
+from src.agents.cache import get_agent
+from src.agents.describer.schema import DescriberPackResponse
+from src.agents.packing import check_pack_size, format_pack
 from config import load_config
 
 DescriberAgent_SYSTEM_PROMPT = load_prompt_templates()["describer"]["system_prompt"]
 
+# 描述文件 (路径, 修改时间, 大小) → 完整系统提示词
+_full_system_prompt_cache: Dict[Any, str] = {}
+
 def get_full_system_prompt() -> str:
+    """
+    生成填入测试描述的完整系统提示词。
+    结果按描述文件的修改时间缓存，同一次运行中每个样本使用字节完全一致的提示词，保证服务端前缀缓存命中。
+    """
     _config = load_config()
     test_description_file = _config.get("test","test_description_file")
     if test_description_file:
         try:
-            with open(test_description_file, "r", encoding="utf-8") as f:
-                description_content = f.read()
-            full_prompt = DescriberAgent_SYSTEM_PROMPT.replace("{test_description}", description_content)
-            return full_prompt
+            stat = os.stat(test_description_file)
+            cache_key = (test_description_file, stat.st_mtime_ns, stat.st_size)
+            if cache_key not in _full_system_prompt_cache:
+                with open(test_description_file, "r", encoding="utf-8") as f:
+                    description_content = f.read()
+                _full_system_prompt_cache.clear()
+                _full_system_prompt_cache[cache_key] = DescriberAgent_SYSTEM_PROMPT.replace("{test_description}", description_content)
+            return _full_system_prompt_cache[cache_key]
         except Exception as e:
             logger.error(f"Failed to load test description file: {e}")
     return DescriberAgent_SYSTEM_PROMPT.replace("{test_description}", "No description available.")
@@ -28,8 +46,8 @@ def get_full_system_prompt() -> str:
 class DescriberAgent:
     """Describer Agent ，无状态调用 Agent 并管理对话历史。"""
 
-    def __init__(self, config: Configuration = Configuration()) -> None:
-        self.config = config
+    def __init__(self, config: Optional[Configuration] = None) -> None:
+        self.config = config or get_configuration()
 
     async def ainvoke(self, input_data: Dict[str, Any], config: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
         """
@@ -44,26 +62,54 @@ class DescriberAgent:
 
         initial_messages = []
 
-        llm = ChatDeepSeek(
-            model=self.config.model, # type: ignore
-            api_key=self.config.api_key, # type: ignore
-            base_url=self.config.base_url,
-            callbacks=[SyncCallbackHandler()],
-        )
-        agent = create_agent(
-            model=llm,
-            tools=[],
-            system_prompt=get_full_system_prompt(),
+        system_prompt = get_full_system_prompt()
+        # 复用缓存的 LLM 客户端与编译好的智能体，只在首次调用时创建
+        agent = get_agent(
+            self.config,
+            ("describer", system_prompt),
+            lambda llm: create_agent(
+                model=llm,
+                middleware=[ResponseCacheMiddleware("describer"), RateLimitMiddleware(), UsageMiddleware("describer")],
+                tools=[],
+                system_prompt=system_prompt,
+            ),
         )
 
         user_message = HumanMessage(input_data.get("input", ""))
-        agent_response = await agent.ainvoke({
+        agent_response = await ainvoke_with_metrics(agent, {
             "messages": initial_messages + [user_message] # type: ignore
         },
-        config={"callbacks": [SyncCallbackHandler()]}
+        "describer", config, callbacks=[get_trace_handler()]
         )
         return {"messages": agent_response["messages"]}
 
+    async def ainvoke_packed(self, inputs: List[str]) -> List[str]:
+        """
+        打包模式：一次调用描述多个样本。
+        Args:
+            inputs: 样本输入列表。
+        Returns:
+            与 inputs 顺序一致的描述文本列表；返回条数不符时抛出 PackError。
+        """
+        system_prompt = get_full_system_prompt()
+        agent = get_agent(
+            self.config,
+            ("describer_packed", system_prompt, DescriberPackResponse.__name__),
+            lambda llm: create_agent(
+                model=llm,
+                middleware=[ResponseCacheMiddleware("describer_packed"), RateLimitMiddleware(), UsageMiddleware("describer_packed")],
+                tools=[],
+                system_prompt=system_prompt,
+                response_format=DescriberPackResponse,
+            ),
+        )
+        agent_response = await ainvoke_with_metrics(agent, {
+            "messages": [HumanMessage(format_pack(inputs))] # type: ignore
+        },
+        "describer_packed", None, callbacks=[get_trace_handler()]
+        )
+        return check_pack_size(agent_response["structured_response"].descriptions, len(inputs))
+
 async def main():
     # config = Configuration()
     describer_agent = DescriberAgent()
@@ -0,0 +1,11 @@
+from pydantic import BaseModel, Field
+from typing import List
+
+
+class DescriberPackResponse(BaseModel):
+    """Describer Agent 打包模式的输出格式"""
+
+    descriptions: List[str] = Field(
+        ...,
+        description="与输入样本一一对应的描述性文本，顺序与样本编号一致"
+    )
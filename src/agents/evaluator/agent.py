@@ -3,21 +3,26 @@ from typing import Any, Dict, Optional
 
 from loguru import logger
 from langchain.agents import create_agent
-from langchain_deepseek import ChatDeepSeek
 from langchain_core.messages import HumanMessage, BaseMessage
 
-from config import Configuration, load_prompt_templates
+from config import Configuration, get_configuration, load_prompt_templates
 from src.agents.evaluator.tools.module import evaluator_tools_list
-from src.utils.memory import FileMemory
-from src.utils.callback import SyncCallbackHandler
+from src.utils.memory import FileMemory, MemoryCompactionMiddleware
+from src.utils.callback import get_trace_handler
+from src.utils.cassette import cassette_scope
+from src.utils.rate_limit import RateLimitMiddleware
+from src.utils.response_cache import ResponseCacheMiddleware
+from src.utils.usage import UsageMiddleware
+from src.utils.metrics import ainvoke_with_metrics
+from src.agents.cache import get_agent, tool_names
 
 EvaluatorAgent_SYSTEM_PROMPT = load_prompt_templates()["evaluator"]["system_prompt"]
 
 class EvaluatorAgent:
     """Evaluator Agent ，无状态调用 Agent 并管理对话历史。"""
 
-    def __init__(self, config: Configuration = Configuration()) -> None:
-        self.config = config
+    def __init__(self, config: Optional[Configuration] = None) -> None:
+        self.config = config or get_configuration()
 
     async def ainvoke(self, input_data: Dict[str, Any], config: Optional[Dict[str, Any]] = None, agent_api_extras: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
         """
@@ -33,16 +38,16 @@ class EvaluatorAgent:
 
         initial_messages = []
 
-        llm = ChatDeepSeek(
-            model=self.config.model, # type: ignore
-            api_key=self.config.api_key, # type: ignore
-            base_url=self.config.base_url,
-            callbacks=[SyncCallbackHandler()],
-        )
-        agent = create_agent(
-            model=llm,
-            tools=evaluator_tools_list,
-            system_prompt=EvaluatorAgent_SYSTEM_PROMPT,
+        # 复用缓存的 LLM 客户端与编译好的智能体，只在首次调用时创建
+        agent = get_agent(
+            self.config,
+            ("evaluator", EvaluatorAgent_SYSTEM_PROMPT, tool_names(evaluator_tools_list)),
+            lambda llm: create_agent(
+                model=llm,
+                middleware=[MemoryCompactionMiddleware("evaluator"), ResponseCacheMiddleware("evaluator"), RateLimitMiddleware(), UsageMiddleware("evaluator")],
+                tools=evaluator_tools_list,
+                system_prompt=EvaluatorAgent_SYSTEM_PROMPT,
+            ),
         )
 
         user_message = HumanMessage(input_data.get("input", ""))
@@ -51,11 +56,13 @@ class EvaluatorAgent:
         if not agent_api_extras:
             agent_api_extras = {}
         
-        agent_response = await agent.ainvoke({
-            "messages": initial_messages + [user_message] # type: ignore
-        },
-        config={"callbacks": [SyncCallbackHandler()], "configurable": {"agent_api_extras": agent_api_extras} }
-        )
+        # 录制 / 回放待测智能体调用时按本次调用内的轮次区分重复的查询
+        with cassette_scope():
+            agent_response = await ainvoke_with_metrics(agent, {
+                "messages": initial_messages + [user_message] # type: ignore
+            },
+            "evaluator", config, callbacks=[get_trace_handler()], configurable={"agent_api_extras": agent_api_extras}
+            )
 
         messages_to_save = [
             BaseMessage(content=msg.content, type=msg.type)
@@ -0,0 +1,102 @@
+"""
+多样本打包
+    describer / analyst 的单个样本远小于每次都要重发的系统提示词，打包模式在一次调用中发送多个样本，
+    由结构化输出返回与样本一一对应的结果列表。默认关闭，由 config.ini 的 [eval] pack_max_samples 开启。
+    - 智能体侧：format_pack 拼接用户消息，check_pack_size 校验返回条数；
+    - 编排侧：make_packs 按 token 预算分组，run_pack 执行一个包，返回格式不正确时拆分重试。
+"""
+from typing import Any, Awaitable, Callable, List, Sequence
+
+from langchain.agents.structured_output import StructuredOutputError
+from langchain_core.exceptions import OutputParserException
+from langchain_core.messages import HumanMessage
+from langchain_core.messages.utils import count_tokens_approximately
+from pydantic import ValidationError
+
+from src.utils.logger import logger
+
+
+class PackError(ValueError):
+    """打包调用的返回结果与样本无法一一对应。"""
+
+
+# 打包调用返回格式不正确时抛出的异常，调用方应拆分后重试
+MALFORMED_PACK_ERRORS = (PackError, StructuredOutputError, OutputParserException, ValidationError)
+
+
+def format_pack(inputs: Sequence[str]) -> str:
+    """
+    将多个样本拼成一条用户消息。系统提示词保持不变，打包说明与样本内容都放在用户消息中，不影响前缀缓存。
+    Args:
+        inputs: 样本输入列表。
+    Returns:
+        用户消息文本。
+    """
+    parts = [
+        f"以下共有 {len(inputs)} 个相互独立的样本，请分别按要求处理每个样本，"
+        f"按编号顺序返回恰好 {len(inputs)} 条结果，不要合并、遗漏或互相参照。"
+    ]
+    for number, item in enumerate(inputs, start=1):
+        parts.append(f"### 样本 {number}\n{item}")
+    return "\n\n".join(parts)
+
+
+def check_pack_size(results: List, expected: int) -> List:
+    """校验返回条数与样本数一致，否则抛出 PackError。"""
+    if len(results) != expected:
+        raise PackError(f"打包调用返回 {len(results)} 条结果，期望 {expected} 条")
+    return results
+
+
+def make_packs(indices: Sequence[int], texts: Sequence[str], token_budget: int, max_samples: int) -> List[List[int]]:
+    """
+    按原始顺序把样本装入若干个包，每个包的样本内容不超过 token_budget（估算值），样本数不超过 max_samples。
+    单个样本超出预算时单独成包。
+    Args:
+        indices: 样本下标。
+        texts: 与 indices 对应的样本输入文本。
+        token_budget: 每个包中样本内容的 token 预算。
+        max_samples: 每个包的最大样本数。
+    Returns:
+        样本下标分组列表。
+    """
+    packs: List[List[int]] = []
+    current: List[int] = []
+    current_tokens = 0
+    for index, text in zip(indices, texts):
+        tokens = count_tokens_approximately([HumanMessage(text)])
+        if current and (len(current) >= max_samples or current_tokens + tokens > token_budget):
+            packs.append(current)
+            current, current_tokens = [], 0
+        current.append(index)
+        current_tokens += tokens
+    if current:
+        packs.append(current)
+    return packs
+
+
+async def run_pack(
+    items: List[Any],
+    invoke_pack: Callable[[List[Any]], Awaitable[List[Any]]],
+    invoke_one: Callable[[Any], Awaitable[Any]],
+) -> List[Any]:
+    """
+    执行一个包；返回格式不正确时对半拆分后分别重试，直到退回逐个样本调用。
+    Args:
+        items: 包内的样本。
+        invoke_pack: 打包调用，返回与 items 一一对应的结果。
+        invoke_one: 单样本调用。
+    Returns:
+        与 items 顺序一致的结果列表。
+    """
+    if len(items) == 1:
+        return [await invoke_one(items[0])]
+    try:
+        return await invoke_pack(items)
+    except MALFORMED_PACK_ERRORS as e:
+        middle = len(items) // 2
+        logger.warning(f"打包调用（{len(items)} 个样本）返回格式不正确，拆分为 {middle} + {len(items) - middle} 重试: {e}")
+        return (
+            await run_pack(items[:middle], invoke_pack, invoke_one)
+            + await run_pack(items[middle:], invoke_pack, invoke_one)
+        )
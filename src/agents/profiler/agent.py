@@ -3,13 +3,18 @@ from typing import Any, Dict, Optional
 
 from loguru import logger
 from langchain.agents import create_agent
-from langchain_deepseek import ChatDeepSeek
 from langchain_core.messages import HumanMessage, BaseMessage
 
-from config import Configuration, load_prompt_templates
+from config import Configuration, get_configuration, load_prompt_templates
 from src.agents.profiler.tools.module import profiler_tools_list
-from src.utils.memory import FileMemory
-from src.utils.callback import SyncCallbackHandler
+from src.utils.memory import FileMemory, MemoryCompactionMiddleware
+from src.utils.callback import get_trace_handler
+from src.utils.cassette import cassette_scope
+from src.utils.rate_limit import RateLimitMiddleware
+from src.utils.response_cache import ResponseCacheMiddleware
+from src.utils.usage import UsageMiddleware
+from src.utils.metrics import ainvoke_with_metrics
+from src.agents.cache import get_agent, tool_names
 
 from langchain.agents.middleware import TodoListMiddleware
 
@@ -18,8 +23,8 @@ ProfilerAgent_SYSTEM_PROMPT = load_prompt_templates()["profiler"]["system_prompt
 class ProfilerAgent:
     """Profiler Agent ，无状态调用 Agent 并管理对话历史。"""
 
-    def __init__(self, config: Configuration = Configuration()) -> None:
-        self.config = config
+    def __init__(self, config: Optional[Configuration] = None) -> None:
+        self.config = config or get_configuration()
 
     async def ainvoke(self, input_data: Dict[str, Any],recursion_limit: int = 25, config: Optional[Dict[str, Any]] = None, agent_api_extras: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
 
@@ -37,22 +42,21 @@ class ProfilerAgent:
 
         initial_messages = []
 
-        llm = ChatDeepSeek(
-            model=self.config.model, # type: ignore
-            api_key=self.config.api_key, # type: ignore
-            base_url=self.config.base_url,
-            callbacks=[SyncCallbackHandler()],
-        )
-        agent = create_agent(
-            model=llm,
-            tools=profiler_tools_list,
-            middleware=[TodoListMiddleware(            
-                system_prompt=(
-                "在开始处理复杂任务时，先用 write_todos 工具创建一个待办清单；"
-                "执行过程中根据进展更新待办清单，包括补充新任务或删除无效任务。"
-            )
-            )],
-            system_prompt=ProfilerAgent_SYSTEM_PROMPT,
+        # 复用缓存的 LLM 客户端与编译好的智能体，只在首次调用时创建
+        agent = get_agent(
+            self.config,
+            ("profiler", ProfilerAgent_SYSTEM_PROMPT, tool_names(profiler_tools_list)),
+            lambda llm: create_agent(
+                model=llm,
+                tools=profiler_tools_list,
+                middleware=[MemoryCompactionMiddleware("profiler"), ResponseCacheMiddleware("profiler"), RateLimitMiddleware(), TodoListMiddleware(
+                    system_prompt=(
+                    "在开始处理复杂任务时，先用 write_todos 工具创建一个待办清单；"
+                    "执行过程中根据进展更新待办清单，包括补充新任务或删除无效任务。"
+                )
+                ), UsageMiddleware("profiler")],
+                system_prompt=ProfilerAgent_SYSTEM_PROMPT,
+            ),
         )
 
         user_message = HumanMessage(input_data.get("input", ""))
@@ -61,12 +65,14 @@ class ProfilerAgent:
         if not agent_api_extras:
             agent_api_extras = {}
         
-        agent_response = await agent.ainvoke({
-            "messages": initial_messages + [user_message] # type: ignore
-        },
-        config={"callbacks": [SyncCallbackHandler()], "configurable": {"agent_api_extras": agent_api_extras},
-                "recursion_limit":recursion_limit}
-        )
+        # 录制 / 回放待测智能体调用时按本次调用内的轮次区分重复的查询
+        with cassette_scope():
+            agent_response = await ainvoke_with_metrics(agent, {
+                "messages": initial_messages + [user_message] # type: ignore
+            },
+            "profiler", config, callbacks=[get_trace_handler()],
+            configurable={"agent_api_extras": agent_api_extras}, recursion_limit=recursion_limit
+            )
 
         messages_to_save = [
             BaseMessage(content=msg.content, type=msg.type)
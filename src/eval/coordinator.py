@@ -2,20 +2,320 @@
 eval.orchestrator 编排器，协调各阶段的执行流程
 """
 import asyncio
-import tqdm
 import json
 import os
-from src.eval.utils.analysis import batch_analyze, merge_origin_inputs_with_results, get_csv_report
-from config import load_config
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Sequence, Tuple
+from src.eval.utils.analysis import (
+    RERUN_TEST_RESULTS,
+    analyze_one,
+    failure_row,
+    failure_text,
+    get_csv_report,
+    is_failure,
+    merge_origin_inputs_with_results,
+    parse_csv_report,
+    select_rerun_indices,
+    target_latency_by_sample,
+    target_latency_summary,
+)
+from src.eval.utils.checkpoint import CheckpointJournal, input_hash, sample_ids
+from src.eval.utils.concurrency import bounded_gather, session_affine_gather
+from config import get_configuration, load_config
 from src.agents import (
+    AnalystAgent,
     EvaluatorAgent,
     ProfilerAgent,
     DescriberAgent,
 )
+from src.agents.analyst.agent import AnalystAgent_SYSTEM_PROMPT
+from src.agents.analyst.schema import AnalystAgentResponse
+from src.agents.describer.agent import get_full_system_prompt
+from src.agents.evaluator.agent import EvaluatorAgent_SYSTEM_PROMPT
+from src.agents.evaluator.tools.module import evaluator_tools_list
+from src.agents.packing import make_packs, run_pack
+from src.utils.logger import logger
+from src.utils.rate_limit import get_rate_limiter
+from src.utils.response_cache import get_response_cache
+from src.utils.usage import get_usage_tracker
+from src.utils.metrics import MetricsCollector, get_metrics_collector, sample_scope
+from src.utils.timeline import get_timeline, span, traced_stage
+
+# 未配置 session_id 的样本与待测智能体接口的默认会话一致，彼此串行
+DEFAULT_SESSION_ID = "test_default_session"
+
+# 各阶段调用的智能体，阶段结束时汇总其 LLM 用量（进程内累计）
+STAGE_AGENTS = {
+    "describes": ("describer", "describer_packed"),
+    "evaluates": ("evaluator",),
+    "analyze": ("analyst", "analyst_packed"),
+    "rerun": ("evaluator", "analyst"),
+    "pipeline": ("profiler", "describer", "evaluator", "analyst"),
+}
+
+
+def _session_key(item_tuple):
+    extras_config = item_tuple[-1]
+    return (extras_config or {}).get("session_id", DEFAULT_SESSION_ID)
+
+
 class Coordinator:
-    def __init__(self, data_loader):
+    def __init__(self, data_loader, max_concurrency: Optional[int] = None):
+        """
+        Args:
+            data_loader: 数据加载器。
+            max_concurrency: 各阶段同时在途的最大 LLM 请求数，为 None 时读取 config.ini 的 [eval] max_concurrency。
+        """
         self.data_loader = data_loader
+        if max_concurrency is None:
+            max_concurrency = load_config().getint("eval", "max_concurrency", fallback=1)
+        self.max_concurrency = max(1, max_concurrency)
+        # 智能体无状态，在各阶段、各样本之间复用同一实例（其 LLM 客户端与编译好的图由 src.agents.cache 缓存）
+        self.describer = DescriberAgent()
+        # 本阶段执行失败的样本：(阶段, 样本 ID, 错误)，阶段结束时输出并清空
+        self._failures: List[Tuple[str, str, str]] = []
+        self.evaluator = EvaluatorAgent()
+        self.analyst = AnalystAgent()
+
+    def _stage_concurrency(self, option: str) -> int:
+        """读取流水线模式下某一阶段的并发上限，未配置时使用 max_concurrency。"""
+        return max(1, load_config().getint("eval", option, fallback=self.max_concurrency))
+
+    @staticmethod
+    def _pack_config() -> Tuple[int, int]:
+        """读取打包模式配置：每包最大样本数（不大于 1 时关闭）与每包样本内容的 token 预算。"""
+        config_ini = load_config()
+        return (
+            config_ini.getint("eval", "pack_max_samples", fallback=1),
+            config_ini.getint("eval", "pack_token_budget", fallback=4000),
+        )
+
+    async def _packed_gather(
+        self,
+        journal: CheckpointJournal,
+        completed: Dict[str, Any],
+        ids: List[str],
+        row_hashes: List[str],
+        inputs: Sequence[Any],
+        invoke_pack: Callable[[List[Any]], Awaitable[List[Any]]],
+        invoke_one: Callable[[Any], Awaitable[Any]],
+        desc: str,
+    ) -> List[Any]:
+        """
+        打包模式下执行一个阶段：复用检查点中仍有效的结果，其余样本按 token 预算装包后并发调用，结果逐个写入日志。
+        上游已经失败的样本不参与打包，与逐个调用时一样直接记为失败占位（分析结果为“未知”）。
+        Args:
+            inputs: 每个样本的输入。
+            invoke_pack: 打包调用，返回与输入一一对应的结果。
+            invoke_one: 单样本调用，包返回格式不正确并拆分到单个样本时使用。
+            desc: 进度条描述。
+        Returns:
+            与 inputs 顺序一致的结果列表。
+        """
+        max_samples, token_budget = self._pack_config()
+        stage = os.path.splitext(os.path.basename(journal.file_path))[0]
+        results: List[Any] = [None] * len(inputs)
+        pending = []
+        for index, (sample_id, row_hash) in enumerate(zip(ids, row_hashes)):
+            record = completed.get(sample_id)
+            if record is not None and record["hash"] == row_hash:
+                results[index] = record["result"]
+            elif is_failure(inputs[index]):
+                results[index] = failure_row(inputs[index]) if stage == "analyze" else inputs[index]
+            else:
+                pending.append(index)
+        packs = make_packs(pending, [str(inputs[index]) for index in pending], token_budget, max_samples)
+        logger.info(f"{desc}: {len(pending)} 个样本打包为 {len(packs)} 次调用")
+
+        async def run(pack: List[int]):
+            with sample_scope(",".join(ids[index] for index in pack)), span(desc, "sample", samples=len(pack)):
+                try:
+                    outputs = await run_pack([inputs[index] for index in pack], invoke_pack, invoke_one)
+                except Exception as e:
+                    # 与 _checkpointed 一致：包内样本记为执行失败，不中断整批任务
+                    logger.error(f"{stage}: {len(pack)} 个样本的打包调用失败: {type(e).__name__}: {e}")
+                    self._failures += [(stage, ids[index], f"{type(e).__name__}: {e}") for index in pack]
+                    text = failure_text(stage, e)
+                    outputs = [failure_row(text) if stage == "analyze" else text for _ in pack]
+            for index, output in zip(pack, outputs):
+                if not is_failure(output):
+                    journal.append(ids[index], output, row_hashes[index])
+                results[index] = output
+
+        await bounded_gather(packs, run, self.max_concurrency, desc=desc)
+        return results
+
+    def _load_evaluator_extras(self, sample_count: int) -> List[Dict[str, Any]]:
+        config_ini = load_config()
+        extras_evaluator_config = config_ini.get("agent_api_extras", "evaluator")
+        if not extras_evaluator_config or not os.path.exists(extras_evaluator_config):
+            raise FileNotFoundError(f"agent api 接口额外参数未找到: {extras_evaluator_config}")
+
+        with open(extras_evaluator_config, "r", encoding="utf-8") as f:
+            extras_evaluator_config = json.load(f)
+
+        if len(extras_evaluator_config) != sample_count:
+            raise ValueError("❌ evaluator agent_api_extras 配置数量与测试样本数量不匹配，请检查配置文件内容。")
+        return extras_evaluator_config
+
+    def _journal(self, stage: str, resume: bool) -> Tuple[CheckpointJournal, Dict[str, Any]]:
+        """
+        打开某一阶段的检查点日志。
+        Args:
+            stage: 阶段名称，对应日志文件名。
+            resume: 为 True 时读取已完成的结果，否则清空日志重新开始。
+        Returns:
+            检查点日志与已完成记录（样本 ID → {"result", "hash"}）。
+        """
+        journal = CheckpointJournal(self.data_loader.get_checkpoint_file(stage))
+        if not resume:
+            journal.reset()
+            return journal, {}
+        completed = journal.load()
+        logger.info(f"{stage}: 从检查点恢复 {len(completed)} 条已完成结果")
+        return journal, completed
+
+    async def _checkpointed(
+        self,
+        journal: CheckpointJournal,
+        completed: Dict[str, Any],
+        sample_id: str,
+        row_hash: str,
+        compute: Callable[[], Awaitable[Any]],
+    ) -> Any:
+        """
+        输入哈希未变的已完成样本直接返回日志中的结果，否则执行 compute 并立即写入日志。
+        compute 抛出异常时不中断整批任务：记录该样本的失败并返回失败占位结果（不写入日志），阶段结束时汇总输出。
+        """
+        record = completed.get(sample_id)
+        if record is not None and record["hash"] == row_hash:
+            return record["result"]
+        stage = os.path.splitext(os.path.basename(journal.file_path))[0]
+        with sample_scope(sample_id), span(stage, "sample", sample_id=sample_id):
+            result = await self._guarded(stage, sample_id, compute)
+        if not is_failure(result):
+            journal.append(sample_id, result, row_hash)
+        return result
+
+    async def _guarded(self, stage: str, sample_id: str, compute: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        执行一个样本的某一阶段，compute 抛出异常时记录该样本的失败并返回失败占位结果
+        （analyze 阶段为“未知”行，其余阶段为失败说明文本），阶段结束时由 _log_stage_stats 汇总输出。
+        """
+        try:
+            return await compute()
+        except Exception as e:
+            logger.error(f"{stage}: 样本 {sample_id} 执行失败: {type(e).__name__}: {e}")
+            self._failures.append((stage, sample_id, f"{type(e).__name__}: {e}"))
+            text = failure_text(stage, e)
+            return failure_row(text) if stage == "analyze" else text
+
+    def _row_hashes(self, stage: str, inputs: List[Any], upstream: List[Optional[str]]) -> List[str]:
+        """
+        计算某一阶段每一行产物的输入哈希：样本输入、提示词模板、模型名称与上游行哈希。
+        Args:
+            stage: 阶段名称。
+            inputs: 每一行除上游产物之外的直接输入。
+            upstream: 每一行对应的上游行哈希。
+        Returns:
+            与 inputs 顺序一致的哈希列表。
+        """
+        if stage == "describes":
+            template: Any = get_full_system_prompt()
+        elif stage == "evaluates":
+            template = [EvaluatorAgent_SYSTEM_PROMPT, [tool.name for tool in evaluator_tools_list]]
+        else:
+            template = [AnalystAgent_SYSTEM_PROMPT, AnalystAgentResponse.model_json_schema()]
+        model = get_configuration().model
+        return [input_hash(stage, item, template, model, up) for item, up in zip(inputs, upstream)]
+
+    def _upstream_hashes(self, option: str, ids: List[str]) -> List[Optional[str]]:
+        """按样本 ID 读取上游产物的行哈希，缺失时为 None。"""
+        stamped = {row["id"]: row["hash"] for row in self.data_loader.load_row_hashes(option)}
+        return [stamped.get(sample_id) for sample_id in ids]
+
+    def _stamp(self, option: str, ids: List[str], row_hashes: List[str]) -> None:
+        self.data_loader.save_row_hashes(
+            option, [{"id": sample_id, "hash": row_hash} for sample_id, row_hash in zip(ids, row_hashes)]
+        )
+
+    @staticmethod
+    def _log_reuse(stage: str, completed: Dict[str, Any], ids: List[str], row_hashes: List[str]) -> None:
+        fresh = sum(
+            1 for sample_id, row_hash in zip(ids, row_hashes)
+            if completed.get(sample_id, {}).get("hash") == row_hash
+        )
+        logger.info(f"{stage}: 复用 {fresh} 行，需要重新计算 {len(ids) - fresh} 行")
+
+    def _log_stage_stats(self, stage: str) -> None:
+        """输出阶段结束时的限流与用量统计，并把本阶段的调用指标写入分析报告所在目录。"""
+        logger.info(f"{stage}: LLM 限流统计 {get_rate_limiter().stats()}")
+        if self._failures:
+            logger.error(
+                f"{stage}: {len(self._failures)} 个样本执行失败，结果记为失败占位（分析结果为“未知”），"
+                f"未写入检查点，--resume 或 rerun 时会重新执行:\n"
+                + "\n".join(f"  [{name}] {sample_id}: {error}" for name, sample_id, error in self._failures)
+            )
+            self._failures = []
+        records = get_metrics_collector().drain()
+        summary = MetricsCollector.summarize(records)
+        self.data_loader.save_metrics(stage, summary, records)
+        latency = target_latency_by_sample(records)
+        if latency:
+            self.data_loader.save_target_latency(latency)
+        logger.info(f"{stage}: 调用指标 {summary['totals']}")
+        timeline = get_timeline()
+        if timeline is not None:
+            logger.info(f"{stage}: 时间线已写入 {timeline.save()}")
+        usage = get_usage_tracker()
+        response_cache = get_response_cache()
+        for agent in STAGE_AGENTS.get(stage, ()):
+            stats = usage.stats(agent)
+            if stats["calls"]:
+                logger.info(f"{stage}: {agent} 用量与前缀缓存命中 {stats}")
+            if response_cache is not None and response_cache.stats(agent)["hit_rate"] is not None:
+                logger.info(f"{stage}: {agent} LLM 响应缓存 {response_cache.stats(agent)}")
+
+    def _save_report(self, rows: List[Dict[str, Any]], ids: List[str]) -> str:
+        """
+        把每个样本调用待测智能体的耗时统计并入报告的行，保存 CSV 报告，并把整次运行的耗时汇总写入 metrics_summary_file。
+        本阶段尚未汇总的调用记录（rerun / pipeline 在同一阶段内评估）优先于 target_latency_file 中的统计。
+        Returns:
+            CSV 报告字符串。
+        """
+        latency = {
+            **self.data_loader.load_target_latency(),
+            **target_latency_by_sample(get_metrics_collector().records()),
+        }
+        for row, sample_id in zip(rows, ids):
+            row.update(latency.get(sample_id, {}))
+        csv_report = get_csv_report(rows)
+        self.data_loader.save_analysis_report(csv_report)
+        summary = target_latency_summary(rows)
+        if summary is not None:
+            self.data_loader.save_metrics("target_latency", summary, [])
+        return csv_report
+
+    def _load_described_with_ids(self) -> Tuple[List[Any], List[str]]:
+        """加载描述后的样本及其对应的样本 ID（由 test.json 中的原始样本计算）。"""
+        described_samples = self.data_loader.load_described_data()
+        origin_inputs = self.data_loader.load_test_data()
+        if len(described_samples) != len(origin_inputs):
+            raise ValueError("❌ 描述后的样本数量与测试样本数量不匹配，请重新执行 describes。")
+        return described_samples, sample_ids(origin_inputs)
+
+    async def _describe_one(self, item) -> str:
+        response = await self.describer.ainvoke({"input": str(item)})
+        return response["messages"][-1].content
 
+    async def _evaluate_one(self, item_tuple) -> str:
+        item, extras_config = item_tuple
+        # 描述已经失败的样本不再调用 evaluator
+        if is_failure(item):
+            return item
+        response = await self.evaluator.ainvoke({"input": str(item)}, agent_api_extras=extras_config)
+        return response["messages"][-1].content
+
+    @traced_stage("profile")
     async def profile(self,recursion_limit:int = 25, query: str = "请分析这个智能体的设计目的和使用的工具。"):
         """
         对待测智能体进行分析。
@@ -35,70 +335,366 @@ class Coordinator:
             extras_profile_config = json.load(f)
         return await profiler.ainvoke({"input": query}, recursion_limit=recursion_limit, agent_api_extras=extras_profile_config)
 
-    async def describes(self):
+    @traced_stage("describes")
+    async def describes(self, resume: bool = False):
         """
         对格式化的测试样本进行描述，转述为自然语言。
         Args:
+            resume: 为 True 时跳过检查点日志中输入哈希未变的已完成样本，只描述缺失或过期的部分。
         Returns:
             包含自然语言描述的测试列表。
         """
         test_description = self.data_loader.load_test_data()
-        described_samples = []
         # print(test_description)
-        for item in tqdm.tqdm(test_description, desc="Describing"):
-            describer = DescriberAgent()
-            response = await describer.ainvoke({"input": str(item)})
-            described_test_sample = response["messages"][-1].content
-            described_samples.append(described_test_sample)
+        ids = sample_ids(test_description)
+        row_hashes = self._row_hashes("describes", test_description, [None] * len(ids))
+        journal, completed = self._journal("describes", resume)
+        self._log_reuse("describes", completed, ids, row_hashes)
+
+        async def describe(index: int):
+            return await self._checkpointed(
+                journal, completed, ids[index], row_hashes[index],
+                lambda: self._describe_one(test_description[index]),
+            )
+
+        if self._pack_config()[0] > 1:
+            described_samples = await self._packed_gather(
+                journal, completed, ids, row_hashes, test_description,
+                lambda items: self.describer.ainvoke_packed([str(item) for item in items]),
+                self._describe_one,
+                desc="Describing",
+            )
+        else:
+            described_samples = await bounded_gather(
+                range(len(test_description)), describe, self.max_concurrency, desc="Describing"
+            )
         self.data_loader.save_described_data(described_samples)
+        self._stamp("describer_output_file", ids, row_hashes)
+        self._log_stage_stats("describes")
         return described_samples
     
-    async def evaluates(self):
+    @traced_stage("evaluates")
+    async def evaluates(self, resume: bool = False):
         """
         对自然语言形式的测试样本进行与智能体交互的评估。
         Args:
+            resume: 为 True 时跳过检查点日志中输入哈希未变的已完成样本，只评估缺失或过期的部分。
         Returns:
             包含评估结果的列表。
         """
-        test_description = self.data_loader.load_described_data()
-        evaluated_results = []
-        config_ini = load_config()
-        extras_profile_config = config_ini.get("agent_api_extras", "evaluator")
-        if not extras_profile_config or not os.path.exists(extras_profile_config):
-            raise FileNotFoundError(f"agent api 接口额外参数未找到: {extras_profile_config}")
-        
-        with open(extras_profile_config, "r", encoding="utf-8") as f:
-            extras_profile_config = json.load(f)
+        test_description, ids = self._load_described_with_ids()
+        extras_evaluator_config = self._load_evaluator_extras(len(test_description))
+        row_hashes = self._row_hashes(
+            "evaluates", extras_evaluator_config, self._upstream_hashes("describer_output_file", ids)
+        )
+        journal, completed = self._journal("evaluates", resume)
+        self._log_reuse("evaluates", completed, ids, row_hashes)
 
-        if len(extras_profile_config) != len(test_description):
-            raise ValueError("❌ evaluator agent_api_extras 配置数量与测试样本数量不匹配，请检查配置文件内容。")
-    
-        for item_tuple in tqdm.tqdm(zip(test_description, extras_profile_config), desc="Evaluating"):
-            item, extras_config = item_tuple
-            evaluator = EvaluatorAgent()
-            response = await evaluator.ainvoke({"input": str(item)}, agent_api_extras=extras_config)
-            evaluated_result = response["messages"][-1].content
-            evaluated_results.append(evaluated_result)
+        async def evaluate(item_tuple):
+            index, extras_config = item_tuple
+            return await self._checkpointed(
+                journal, completed, ids[index], row_hashes[index],
+                lambda: self._evaluate_one((test_description[index], extras_config)),
+            )
+
+        # 不同 session_id 之间并发，同一 session_id 内按顺序串行，避免破坏多轮会话状态
+        evaluated_results = await session_affine_gather(
+            list(enumerate(extras_evaluator_config)),
+            evaluate,
+            _session_key,
+            self.max_concurrency,
+            desc="Evaluating",
+        )
         self.data_loader.save_evaluated_results(evaluated_results)
+        self._stamp("evaluator_output_file", ids, row_hashes)
+        self._log_stage_stats("evaluates")
         return evaluated_results
 
-    async def analyze(self):
+    @traced_stage("analyze")
+    async def analyze(self, resume: bool = False):
         """
         分析评估结果并生成报告。
         Args:
+            resume: 为 True 时跳过检查点日志中输入哈希未变的已完成样本，只分析缺失或过期的部分。
         Returns:
             包含分析报告的CSV字符串。
         """
         evaluated_results = self.data_loader.load_evaluated_results()
         origin_inputs = self.data_loader.load_test_data()
+        if len(evaluated_results) != len(origin_inputs):
+            raise ValueError("❌ 评估结果数量与测试样本数量不匹配，请重新执行 evaluates。")
+        ids = sample_ids(origin_inputs)
+        row_hashes = self._row_hashes(
+            "analyze", [None] * len(ids), self._upstream_hashes("evaluator_output_file", ids)
+        )
+        journal, completed = self._journal("analyze", resume)
+        self._log_reuse("analyze", completed, ids, row_hashes)
+        analyst = self.analyst
+
+        async def analyze(index: int):
+            return await self._checkpointed(
+                journal, completed, ids[index], row_hashes[index], lambda: analyze_one(analyst, evaluated_results[index])
+            )
 
-        analyzed_results = await batch_analyze(evaluated_results)
+        if self._pack_config()[0] > 1:
+            analyzed_results = await self._packed_gather(
+                journal, completed, ids, row_hashes, evaluated_results,
+                lambda items: analyst.ainvoke_packed([str(item) for item in items]),
+                lambda item: analyze_one(analyst, item),
+                desc="Analyzing",
+            )
+        else:
+            analyzed_results = await bounded_gather(
+                range(len(evaluated_results)), analyze, self.max_concurrency, desc="Analyzing"
+            )
         # print("Analyzed Results:", analyzed_results)
         merged_results = merge_origin_inputs_with_results(origin_inputs, analyzed_results)
-        csv_report = get_csv_report(merged_results)
+        csv_report = self._save_report(merged_results, ids)
         # print("CSV Report:\n", csv_report)
-        self.data_loader.save_analysis_report(csv_report)
+        self._stamp("analysis_report_file", ids, row_hashes)
+        self._log_stage_stats("analyze")
         return csv_report
+
+    @traced_stage("build")
+    async def build(self):
+        """
+        增量重建：与 make 类似，依次执行 describes → evaluates → analyze，
+        只重新计算输入哈希（样本、提示词模板、模型名称、上游行哈希）发生变化的行，其余行直接复用检查点日志。
+        Returns:
+            包含分析报告的CSV字符串。
+        """
+        await self.describes(resume=True)
+        await self.evaluates(resume=True)
+        return await self.analyze(resume=True)
+
+    @traced_stage("rerun")
+    async def rerun(
+        self,
+        test_results: Sequence[str] = RERUN_TEST_RESULTS,
+        min_confidence: Optional[float] = None,
+        report_file: Optional[str] = None,
+    ):
+        """
+        只重新评估上一次报告中失败、部分通过、未知或置信度过低的样本，并将新结果合并回完整报告。
+        describe 阶段复用检查点日志中输入未变的描述，evaluate 与 analyze 阶段对选中的样本强制重跑。
+        Args:
+            test_results: 需要重新评估的测试结果。
+            min_confidence: 置信度低于该值的样本也会重新评估，默认读取 [eval] rerun_min_confidence。
+            report_file: 上一次的分析报告，默认为 analysis_report_file。
+        Returns:
+            合并后的完整CSV报告字符串。
+        """
+        if min_confidence is None:
+            min_confidence = load_config().getfloat("eval", "rerun_min_confidence", fallback=None)
+        previous_rows = parse_csv_report(self.data_loader.load_analysis_report(report_file))
+        test_data = self.data_loader.load_test_data()
+        if len(previous_rows) != len(test_data):
+            raise ValueError("❌ 上一次报告的行数与测试样本数量不匹配，无法按行合并。")
+
+        indices = select_rerun_indices(previous_rows, test_results, min_confidence)
+        logger.info(f"rerun: {len(indices)}/{len(test_data)} 个样本需要重新评估")
+        if not indices:
+            return get_csv_report(previous_rows)
+
+        count = len(test_data)
+        ids = sample_ids(test_data)
+        extras_list = self._load_evaluator_extras(count)
+        described = self.data_loader.load_described_data()
+        evaluated = self.data_loader.load_evaluated_results()
+        if len(described) != count or len(evaluated) != count:
+            raise ValueError("❌ 描述或评估结果数量与测试样本数量不匹配，请先完整运行一次评估。")
+
+        describe_hashes = self._upstream_hashes("describer_output_file", ids)
+        evaluate_hashes = self._upstream_hashes("evaluator_output_file", ids)
+        analyze_hashes = self._upstream_hashes("analysis_report_file", ids)
+        subset_describe = self._row_hashes("describes", [test_data[i] for i in indices], [None] * len(indices))
+        for index, row_hash in zip(indices, subset_describe):
+            describe_hashes[index] = row_hash
+        subset_evaluate = self._row_hashes(
+            "evaluates", [extras_list[i] for i in indices], [describe_hashes[i] for i in indices]
+        )
+        for index, row_hash in zip(indices, subset_evaluate):
+            evaluate_hashes[index] = row_hash
+        subset_analyze = self._row_hashes("analyze", [None] * len(indices), subset_evaluate)
+        for index, row_hash in zip(indices, subset_analyze):
+            analyze_hashes[index] = row_hash
+
+        # 不清空日志：describe 复用未过期的记录，evaluate / analyze 对选中样本强制重跑
+        describe_journal, described_done = self._journal("describes", resume=True)
+        evaluate_journal, _ = self._journal("evaluates", resume=True)
+        analyze_journal, _ = self._journal("analyze", resume=True)
+
+        async def describe(index: int):
+            described[index] = await self._checkpointed(
+                describe_journal, described_done, ids[index], describe_hashes[index],
+                lambda: self._describe_one(test_data[index]),
+            )
+
+        async def evaluate(item_tuple):
+            index, extras_config = item_tuple
+            evaluated[index] = await self._checkpointed(
+                evaluate_journal, {}, ids[index], evaluate_hashes[index],
+                lambda: self._evaluate_one((described[index], extras_config)),
+            )
+
+        analyst = self.analyst
+
+        async def analyze(index: int):
+            row = await self._checkpointed(
+                analyze_journal, {}, ids[index], analyze_hashes[index],
+                lambda: analyze_one(analyst, evaluated[index]),
+            )
+            row["query"] = test_data[index].get("query", "")
+            previous_rows[index] = row
+
+        await bounded_gather(indices, describe, self.max_concurrency, desc="Describing")
+        await session_affine_gather(
+            [(index, extras_list[index]) for index in indices],
+            evaluate,
+            _session_key,
+            self.max_concurrency,
+            desc="Evaluating",
+        )
+        await bounded_gather(indices, analyze, self.max_concurrency, desc="Analyzing")
+
+        self.data_loader.save_described_data(described)
+        self._stamp("describer_output_file", ids, describe_hashes)
+        self.data_loader.save_evaluated_results(evaluated)
+        self._stamp("evaluator_output_file", ids, evaluate_hashes)
+        csv_report = self._save_report(previous_rows, ids)
+        self._stamp("analysis_report_file", ids, analyze_hashes)
+        self._log_stage_stats("rerun")
+        return csv_report
+
+    @traced_stage("pipeline")
+    async def pipeline(
+        self,
+        profile_query: Optional[str] = None,
+        recursion_limit: int = 25,
+        describer_concurrency: Optional[int] = None,
+        evaluator_concurrency: Optional[int] = None,
+        analyst_concurrency: Optional[int] = None,
+        queue_size: Optional[int] = None,
+        on_row: Optional[Callable[[int, Dict[str, Any]], None]] = None,
+        resume: bool = False,
+    ):
+        """
+        流水线模式：每个样本依次流经 describer → evaluator → analyst，阶段之间通过有界队列衔接，
+        不再等待上一阶段全部完成。profile 与 describe 同时进行，evaluate 在 profile 完成后开始。
+        Args:
+            profile_query: 不为 None 时同时运行 profiler，并在评估前等待其生成目标智能体文档。
+            recursion_limit: profiler 递归调用的最大深度。
+            describer_concurrency: describer 阶段并发上限，默认读取 [eval] describer_concurrency。
+            evaluator_concurrency: evaluator 阶段同时评估的会话数，默认读取 [eval] evaluator_concurrency。
+            analyst_concurrency: analyst 阶段并发上限，默认读取 [eval] analyst_concurrency。
+            queue_size: 阶段间缓冲区容量，下游处理不过来时上游暂停，默认读取 [eval] pipeline_queue_size。
+            on_row: 每得到一行分析结果时的回调，参数为样本下标与该行结果。
+            resume: 为 True 时各阶段跳过检查点日志中输入哈希未变的已完成样本。
+        Returns:
+            包含分析报告的CSV字符串。
+        """
+        test_data = self.data_loader.load_test_data()
+        extras_list = self._load_evaluator_extras(len(test_data))
+        describer_concurrency = describer_concurrency or self._stage_concurrency("describer_concurrency")
+        evaluator_concurrency = evaluator_concurrency or self._stage_concurrency("evaluator_concurrency")
+        analyst_concurrency = analyst_concurrency or self._stage_concurrency("analyst_concurrency")
+        queue_size = queue_size or self._stage_concurrency("pipeline_queue_size")
+
+        count = len(test_data)
+        ids = sample_ids(test_data)
+        describe_hashes = self._row_hashes("describes", test_data, [None] * count)
+        evaluate_hashes = self._row_hashes("evaluates", extras_list, describe_hashes)
+        analyze_hashes = self._row_hashes("analyze", [None] * count, evaluate_hashes)
+        describe_journal, described_done = self._journal("describes", resume)
+        evaluate_journal, evaluated_done = self._journal("evaluates", resume)
+        analyze_journal, analyzed_done = self._journal("analyze", resume)
+        described: List[Any] = [None] * count
+        evaluated: List[Any] = [None] * count
+        analyzed: List[Any] = [None] * count
+
+        loop = asyncio.get_running_loop()
+        described_futures = [loop.create_future() for _ in range(count)]
+        # describe → evaluate 的有界缓冲：已描述但尚未进入评估的样本数不超过 queue_size
+        describe_buffer = asyncio.Semaphore(queue_size)
+        evaluator_slots = asyncio.Semaphore(evaluator_concurrency)
+        analyze_queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        source = iter(range(count))
+        analyst = self.analyst
+
+        profile_task = None
+        if profile_query is not None:
+            profile_task = asyncio.create_task(self.profile(recursion_limit, profile_query))
+
+        async def describe_worker():
+            # 多个 worker 共享同一迭代器，按下标顺序领取样本
+            for index in source:
+                await describe_buffer.acquire()
+                described[index] = await self._checkpointed(
+                    describe_journal, described_done, ids[index], describe_hashes[index],
+                    lambda: self._describe_one(test_data[index]),
+                )
+                described_futures[index].set_result(None)
+
+        async def evaluate_session(indices: List[int]):
+            for index in indices:
+                await described_futures[index]
+                if profile_task is not None:
+                    await profile_task
+                async with evaluator_slots:
+                    describe_buffer.release()
+                    evaluated[index] = await self._checkpointed(
+                        evaluate_journal, evaluated_done, ids[index], evaluate_hashes[index],
+                        lambda: self._evaluate_one((described[index], extras_list[index])),
+                    )
+                await analyze_queue.put(index)
+
+        async def analyze_worker():
+            while True:
+                index = await analyze_queue.get()
+                if index is None:
+                    return
+                row = await self._checkpointed(
+                    analyze_journal, analyzed_done, ids[index], analyze_hashes[index],
+                    lambda: analyze_one(analyst, evaluated[index]),
+                )
+                row["query"] = test_data[index].get("query", "")
+                analyzed[index] = row
+                logger.info(f"pipeline: 样本 {index} 分析完成 ({row.get('test_result')})")
+                if on_row is not None:
+                    on_row(index, row)
+
+        sessions: Dict[Any, List[int]] = {}
+        for index, item_tuple in enumerate(zip(described, extras_list)):
+            sessions.setdefault(_session_key(item_tuple), []).append(index)
+
+        async def produce():
+            await asyncio.gather(
+                *(describe_worker() for _ in range(describer_concurrency)),
+                *(evaluate_session(indices) for indices in sessions.values()),
+            )
+            for _ in range(analyst_concurrency):
+                await analyze_queue.put(None)
+
+        tasks = [asyncio.create_task(produce())]
+        tasks += [asyncio.create_task(analyze_worker()) for _ in range(analyst_concurrency)]
+        if profile_task is not None:
+            tasks.append(profile_task)
+        try:
+            await asyncio.gather(*tasks)
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            raise
+
+        self.data_loader.save_described_data(described)
+        self._stamp("describer_output_file", ids, describe_hashes)
+        self.data_loader.save_evaluated_results(evaluated)
+        self._stamp("evaluator_output_file", ids, evaluate_hashes)
+        csv_report = self._save_report(analyzed, ids)
+        self._stamp("analysis_report_file", ids, analyze_hashes)
+        self._log_stage_stats("pipeline")
+        return csv_report
+
 async def main():
     from src.eval.utils.data_loader import DataLoader
 
@@ -0,0 +1,368 @@
+"""
+待测智能体压测
+    不经过 evaluator LLM，直接回放 describes 阶段生成的描述（或 test.json 中的查询）调用待测智能体接口
+    （aagent_api_inference / agent_api_inference），
+    逐级加压找出待测智能体的饱和点：
+    - rps 模式（开环）：按到达率发出请求，不等待之前的请求完成；同时在途的请求超过 max_inflight 时记为 dropped；
+    - concurrency 模式（闭环）：固定数量的客户端各自连续发送请求。
+    负载从 start 线性爬升到 end，分为 steps 个阶梯，每个阶梯持续 duration / steps 秒。请求轮流使用 sessions 个
+    不同的 session_id（0 表示每个请求使用新会话），查询按顺序循环使用。
+    每个阶梯输出发出的请求数、成功吞吐、延迟 p50 / p90 / p99、首字延迟（stream 开启且接口提供 aagent_api_stream 时）
+    与按类型的错误统计，并估计饱和点：
+    - rps 模式：成功吞吐低于到达率的 SATURATION_THROUGHPUT_RATIO，或失败率超过 SATURATION_ERROR_RATE 的第一个阶梯；
+    - concurrency 模式：吞吐相比之前的最好结果提升不足 SATURATION_MIN_GAIN，或失败率超过 SATURATION_ERROR_RATE 的第一个阶梯。
+"""
+import asyncio
+import json
+import os
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from config import load_config
+from src.tools.agent_inference import failure_status, target_api
+from src.tools.target_stream import consume_stream, stream_limits
+from src.utils.logger import logger
+from src.utils.metrics import percentile
+
+MODES = ("rps", "concurrency")
+SOURCES = ("test", "described")
+SATURATION_THROUGHPUT_RATIO = 0.9
+SATURATION_ERROR_RATE = 0.05
+SATURATION_MIN_GAIN = 0.05
+
+
+def load_queries(source: str = "described") -> List[str]:
+    """
+    读取压测使用的查询。
+    Args:
+        source: test 使用 test.json 中各样本的 query；described 使用 described_test_samples.json 中的描述原文。
+    Returns:
+        查询列表。
+    """
+    from src.eval.utils.data_loader import DataLoader
+
+    if source not in SOURCES:
+        raise ValueError(f"未知的查询来源: {source}，可选 {SOURCES}")
+    data_loader = DataLoader()
+    if source == "test":
+        queries = [str(item.get("query", "")) for item in data_loader.load_test_data()]
+    else:
+        queries = [item if isinstance(item, str) else json.dumps(item, ensure_ascii=False)
+                   for item in data_loader.load_described_data()]
+    queries = [query for query in queries if query.strip()]
+    if not queries:
+        raise ValueError("❌ 没有可用于压测的查询")
+    return queries
+
+
+def ramp_levels(start: float, end: float, steps: int) -> List[float]:
+    """从 start 线性爬升到 end 的各阶梯负载。"""
+    if steps <= 1:
+        return [end]
+    return [round(start + (end - start) * index / (steps - 1), 3) for index in range(steps)]
+
+
+class LoadGenerator:
+    """按阶梯加压调用待测智能体并记录每个请求的结果。"""
+
+    def __init__(
+        self,
+        queries: List[str],
+        mode: str = "rps",
+        levels: Optional[List[float]] = None,
+        step_seconds: float = 10.0,
+        sessions: int = 0,
+        max_inflight: int = 256,
+        stream: bool = False,
+    ):
+        """
+        Args:
+            queries: 循环使用的查询。
+            mode: rps（开环，阶梯负载为每秒到达数）或 concurrency（闭环，阶梯负载为并发客户端数）。
+            levels: 各阶梯的负载。
+            step_seconds: 每个阶梯的持续时间（秒）。
+            sessions: 轮流使用的 session_id 数，0 表示每个请求使用新会话。
+            max_inflight: rps 模式下同时在途请求的上限，也是调用同步接口的线程数。
+            stream: 接口提供 aagent_api_stream 时以流式调用并记录首字延迟。
+        """
+        if mode not in MODES:
+            raise ValueError(f"未知的压测模式: {mode}，可选 {MODES}")
+        self.queries = queries
+        self.mode = mode
+        self.levels = levels or [1.0]
+        if mode == "concurrency":
+            self.levels = [float(max(1, round(level))) for level in self.levels]
+        self.step_seconds = step_seconds
+        self.sessions = sessions
+        self.max_inflight = max_inflight
+        self.stream = stream
+        self.run_tag = uuid.uuid4().hex[:8]
+        self.results: List[Dict[str, Any]] = []
+        self._sent = 0
+        self._inflight = 0
+        self._start = 0.0
+        self._target: Any = None
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    def _session_id(self, index: int) -> str:
+        return f"loadgen-{self.run_tag}-{index % self.sessions if self.sessions else index}"
+
+    async def _call(self, step: int, scheduled_at: float) -> None:
+        index = self._sent
+        self._sent += 1
+        query, session_id = self.queries[index % len(self.queries)], self._session_id(index)
+        result: Dict[str, Any] = {"step": step, "scheduled_at": round(scheduled_at - self._start, 4)}
+        # 闭环模式的在途请求数由客户端数决定，只有开环模式需要丢弃超出上限的请求
+        if self.mode == "rps" and self._inflight >= self.max_inflight:
+            result.update(status="dropped", finished_at=result["scheduled_at"])
+            self.results.append(result)
+            return
+
+        self._inflight += 1
+        start = time.perf_counter()
+        result["lag"] = round(start - scheduled_at, 4)
+        try:
+            target = self._target
+            if self.stream and hasattr(target, "aagent_api_stream"):
+                _, stats = await consume_stream(
+                    target.aagent_api_stream(query=query, session_id=session_id), *stream_limits()
+                )
+                result.update(ttft=stats["ttft"], truncated=stats["truncated"])
+            elif hasattr(target, "aagent_api_inference"):
+                await target.aagent_api_inference(query=query, session_id=session_id)
+            else:
+                await asyncio.get_running_loop().run_in_executor(
+                    self._executor, lambda: target.agent_api_inference(query=query, session_id=session_id)
+                )
+            result["status"] = "ok"
+        except Exception as e:
+            result.update(status=failure_status(e), error=type(e).__name__)
+        finally:
+            self._inflight -= 1
+        finished = time.perf_counter()
+        result.update(latency=finished - start, finished_at=round(finished - self._start, 4))
+        self.results.append(result)
+
+    async def _run_rps(self) -> None:
+        tasks = []
+        for step, rate in enumerate(self.levels):
+            if rate <= 0:
+                await asyncio.sleep(max(0.0, self._start + (step + 1) * self.step_seconds - time.perf_counter()))
+                continue
+            step_start = self._start + step * self.step_seconds
+            for k in range(max(1, round(rate * self.step_seconds))):
+                scheduled_at = step_start + k / rate
+                delay = scheduled_at - time.perf_counter()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                tasks.append(asyncio.create_task(self._call(step, scheduled_at)))
+            tasks = [task for task in tasks if not task.done()]
+        await asyncio.gather(*tasks)
+
+    async def _run_concurrency(self) -> None:
+        end = self._start + len(self.levels) * self.step_seconds
+        state = {"step": 0, "level": 0}
+
+        async def client(slot: int):
+            # 编号不小于当前阶梯并发数的客户端暂停，等待下一个阶梯
+            while time.perf_counter() < end:
+                if slot >= state["level"]:
+                    await asyncio.sleep(0.05)
+                    continue
+                await self._call(state["step"], time.perf_counter())
+                # 立即失败的调用不会挂起，让出事件循环以免其他客户端与阶梯切换无法执行
+                await asyncio.sleep(0)
+
+        clients = [asyncio.create_task(client(slot)) for slot in range(int(max(self.levels)))]
+        for step, level in enumerate(self.levels):
+            state["step"], state["level"] = step, int(level)
+            await asyncio.sleep(max(0.0, self._start + (step + 1) * self.step_seconds - time.perf_counter()))
+        await asyncio.gather(*clients)
+
+    async def run(self) -> List[Dict[str, Any]]:
+        """执行全部阶梯，等待在途请求完成后返回每个请求的结果。"""
+        self._target = target_api()
+        workers = self.max_inflight if self.mode == "rps" else int(max(self.levels))
+        self._executor = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="loadgen")
+        self._start = time.perf_counter()
+        try:
+            if self.mode == "rps":
+                await self._run_rps()
+            else:
+                await self._run_concurrency()
+        finally:
+            self._executor.shutdown(wait=False)
+        return self.results
+
+    def summarize(self) -> Dict[str, Any]:
+        """
+        按阶梯汇总结果。
+        Returns:
+            {"steps": [每个阶梯的统计], "saturation": 饱和点估计, "totals": 总计}。
+        """
+        steps = []
+        for step, level in enumerate(self.levels):
+            window_start, window_end = step * self.step_seconds, (step + 1) * self.step_seconds
+            issued = [result for result in self.results if result["step"] == step]
+            ok = [result for result in issued if result["status"] == "ok"]
+            # 吞吐按完成时间落在本阶梯时间窗内的成功请求计算
+            completed = sum(
+                1 for result in self.results
+                if result["status"] == "ok" and window_start <= result["finished_at"] < window_end
+            )
+            errors: Dict[str, int] = {}
+            for result in issued:
+                if result["status"] != "ok":
+                    key = result["status"] if result["status"] == "dropped" else f"{result['status']}:{result['error']}"
+                    errors[key] = errors.get(key, 0) + 1
+            latencies = [result["latency"] for result in ok]
+            ttfts = [result["ttft"] for result in ok if result.get("ttft") is not None]
+            steps.append({
+                "step": step,
+                "level": level,
+                "sent": len(issued),
+                "ok": len(ok),
+                "throughput": round(completed / self.step_seconds, 3),
+                "error_rate": round(1 - len(ok) / len(issued), 4) if issued else None,
+                "errors": errors,
+                "p50": _round(percentile(latencies, 50)),
+                "p90": _round(percentile(latencies, 90)),
+                "p99": _round(percentile(latencies, 99)),
+                "max": _round(max(latencies) if latencies else None),
+                "ttft_p50": _round(percentile(ttfts, 50)),
+                "lag_p99": _round(percentile([result["lag"] for result in issued if "lag" in result], 99)),
+            })
+
+        ok_total = sum(step["ok"] for step in steps)
+        return {
+            "steps": steps,
+            "saturation": self._saturation(steps),
+            "totals": {
+                "sent": len(self.results),
+                "ok": ok_total,
+                "error_rate": round(1 - ok_total / len(self.results), 4) if self.results else None,
+                "p50": _round(percentile([result["latency"] for result in self.results if result["status"] == "ok"], 50)),
+                "p99": _round(percentile([result["latency"] for result in self.results if result["status"] == "ok"], 99)),
+            },
+        }
+
+    def _saturation(self, steps: List[Dict[str, Any]]) -> Dict[str, Any]:
+        best = 0.0
+        for index, step in enumerate(steps):
+            if not step["sent"]:
+                continue
+            reasons = []
+            if step["error_rate"] is not None and step["error_rate"] > SATURATION_ERROR_RATE:
+                reasons.append(f"失败率 {step['error_rate']:.1%}")
+            if self.mode == "rps" and step["throughput"] < step["level"] * SATURATION_THROUGHPUT_RATIO:
+                reasons.append(f"成功吞吐 {step['throughput']}/s 低于到达率 {step['level']}/s")
+            if self.mode == "concurrency" and index > 0 and best and step["throughput"] < best * (1 + SATURATION_MIN_GAIN):
+                reasons.append(f"吞吐 {step['throughput']}/s 相比之前最好的 {best}/s 没有明显提升")
+            if reasons:
+                sustained = next((steps[i]["level"] for i in range(index - 1, -1, -1) if steps[i]["sent"]), None)
+                return {"step": index, "level": step["level"], "sustained_level": sustained, "reasons": reasons}
+            best = max(best, step["throughput"])
+        return {"step": None, "level": None, "sustained_level": steps[-1]["level"] if steps else None, "reasons": []}
+
+
+def _round(value: Optional[float]) -> Optional[float]:
+    return round(value, 3) if value is not None else None
+
+
+def format_summary(summary: Dict[str, Any], mode: str) -> str:
+    unit = "req/s" if mode == "rps" else "并发"
+    lines = [f"{'负载':>10}  {'发出':>6}  {'成功':>6}  {'吞吐/s':>8}  {'失败率':>7}  {'p50':>7}  {'p90':>7}  {'p99':>7}  错误"]
+    for step in summary["steps"]:
+        error_rate = f"{step['error_rate']:.1%}" if step["error_rate"] is not None else "-"
+        lines.append(
+            f"{step['level']:>6} {unit:<3}  {step['sent']:>6}  {step['ok']:>6}  {step['throughput']:>8}  {error_rate:>7}  "
+            f"{step['p50'] if step['p50'] is not None else '-':>7}  {step['p90'] if step['p90'] is not None else '-':>7}  "
+            f"{step['p99'] if step['p99'] is not None else '-':>7}  {step['errors'] or ''}"
+        )
+    saturation = summary["saturation"]
+    if saturation["step"] is None:
+        lines.append(f"未达到饱和，最高负载 {saturation['sustained_level']} {unit} 仍可承受")
+    else:
+        sustained = saturation["sustained_level"]
+        lines.append(
+            f"饱和点：{saturation['level']} {unit}（{'；'.join(saturation['reasons'])}），"
+            + (f"可承受的最高负载约为 {sustained} {unit}" if sustained is not None else "第一个阶梯即已饱和")
+        )
+    return "\n".join(lines)
+
+
+async def run_load(
+    mode: Optional[str] = None,
+    start: Optional[float] = None,
+    end: Optional[float] = None,
+    steps: Optional[int] = None,
+    duration: Optional[float] = None,
+    sessions: Optional[int] = None,
+    max_inflight: Optional[int] = None,
+    source: Optional[str] = None,
+    stream: Optional[bool] = None,
+    report_file: Optional[str] = None,
+) -> str:
+    """
+    压测待测智能体，参数为 None 时读取 config.ini 的 [loadgen]。
+    Args:
+        mode: rps 或 concurrency。
+        start: 第一个阶梯的负载（每秒到达数或并发数）。
+        end: 最后一个阶梯的负载。
+        steps: 阶梯数。
+        duration: 总时长（秒）。
+        sessions: 轮流使用的 session_id 数，0 表示每个请求使用新会话。
+        max_inflight: rps 模式下同时在途请求的上限。
+        source: 查询来源，described（默认）或 test。
+        stream: 是否以流式调用并记录首字延迟。
+        report_file: 报告（每个阶梯的统计与每个请求的结果）的 JSON 文件路径。
+    Returns:
+        每个阶梯的统计表与饱和点估计。
+    Raises:
+        ValueError: steps 小于 1、duration 不大于 0 或 max_inflight 小于 1。
+    """
+    config = load_config()
+    mode = mode or config.get("loadgen", "mode", fallback="rps").strip()
+    start = start if start is not None else config.getfloat("loadgen", "start_level", fallback=1.0)
+    end = end if end is not None else config.getfloat("loadgen", "end_level", fallback=10.0)
+    steps = steps if steps is not None else config.getint("loadgen", "steps", fallback=5)
+    duration = duration if duration is not None else config.getfloat("loadgen", "duration", fallback=60.0)
+    sessions = sessions if sessions is not None else config.getint("loadgen", "sessions", fallback=0)
+    max_inflight = max_inflight if max_inflight is not None else config.getint("loadgen", "max_inflight", fallback=256)
+    source = source or config.get("loadgen", "source", fallback="described").strip()
+    stream = stream if stream is not None else config.getboolean("loadgen", "stream", fallback=False)
+    report_file = report_file or config.get(
+        "loadgen", "report_file", fallback="./data/eval_results/loadgen_report.json"
+    )
+    if steps < 1:
+        raise ValueError(f"❌ 压测阶梯数 steps 至少为 1，当前为 {steps}")
+    if duration <= 0:
+        raise ValueError(f"❌ 压测总时长 duration 必须大于 0 秒，当前为 {duration}")
+    if max_inflight < 1:
+        raise ValueError(f"❌ 同时在途请求上限 max_inflight 至少为 1，当前为 {max_inflight}")
+
+    generator = LoadGenerator(
+        load_queries(source), mode, ramp_levels(start, end, steps), duration / steps, sessions, max_inflight, stream
+    )
+    logger.info(f"压测开始：{mode} 模式，负载 {generator.levels}，每个阶梯 {generator.step_seconds:g} 秒")
+    results = await generator.run()
+    summary = generator.summarize()
+
+    output_dir = os.path.dirname(report_file)
+    if output_dir:
+        os.makedirs(output_dir, exist_ok=True)
+    with open(report_file, "w", encoding="utf-8") as f:
+        json.dump({
+            "created_at": datetime.now().isoformat(timespec="seconds"),
+            "params": {
+                "mode": mode, "levels": generator.levels, "step_seconds": generator.step_seconds,
+                "sessions": sessions, "max_inflight": max_inflight, "source": source, "stream": stream,
+            },
+            **summary,
+            "requests": results,
+        }, f, ensure_ascii=False, indent=2)
+    logger.info(f"压测报告已写入 {report_file}")
+    return format_summary(summary, mode)
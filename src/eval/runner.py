@@ -0,0 +1,257 @@
+"""
+eval.runner 分片运行器
+    将 test.json 按会话切分为任务写入共享的 SQLite 队列，由多个 worker 进程（可以位于多台共享存储的机器上）
+    领取执行，最后把各 worker 的结果合并为标准的 evaluation_results.json 与 analysis_report.csv。
+"""
+import asyncio
+import hashlib
+import json
+import multiprocessing
+import os
+import socket
+import traceback
+from typing import Any, Dict, List, Optional
+
+from config import load_config
+from src.eval.coordinator import Coordinator, _session_key
+from src.eval.utils.analysis import TARGET_LATENCY_HEADER, analyze_one, target_latency_by_sample
+from src.eval.utils.checkpoint import sample_ids
+from src.eval.utils.data_loader import DataLoader
+from src.eval.utils.work_queue import LeaseLost, WorkQueue
+from src.utils.logger import logger
+from src.utils.rate_limit import configure_rate_limiter
+from src.utils.usage import get_usage_tracker
+from src.utils.metrics import MetricsCollector, get_metrics_collector, sample_scope
+
+
+def _runner_config():
+    config = load_config()
+    return {
+        "queue_file": config.get("runner", "queue_file", fallback="./data/eval_results/work_queue.sqlite"),
+        "lease_seconds": config.getfloat("runner", "lease_seconds", fallback=600.0),
+        "max_attempts": config.getint("runner", "max_attempts", fallback=3),
+    }
+
+
+def open_queue(queue_file: Optional[str] = None) -> WorkQueue:
+    """打开配置中的任务队列，queue_file 为 None 时读取 [runner] queue_file。"""
+    runner_config = _runner_config()
+    queue_file = DataLoader().get_queue_file(queue_file or runner_config["queue_file"])
+    return WorkQueue(queue_file, max_attempts=runner_config["max_attempts"])
+
+
+def _session_groups(extras_list: List[Dict[str, Any]]) -> List[List[int]]:
+    """按 session_id 将样本下标分组，同一会话的样本作为一个任务串行执行。"""
+    groups: Dict[Any, List[int]] = {}
+    for index, extras_config in enumerate(extras_list):
+        groups.setdefault(_session_key((index, extras_config)), []).append(index)
+    return list(groups.values())
+
+
+def queue_fingerprint(test_data: List[Dict[str, Any]], groups: List[List[int]]) -> str:
+    """测试集指纹：各样本的 ID（内容哈希）与任务分组，测试集或 session_id 变化后队列不能继续使用。"""
+    payload = json.dumps([sample_ids(test_data), groups], ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def prepare_queue(queue: WorkQueue, reset: bool = False) -> int:
+    """
+    按 session_id 将测试样本分组后写入队列，同一会话的样本作为一个任务串行执行。
+    Returns:
+        任务数量。
+    Raises:
+        ValueError: reset 为 False 且队列中已有的任务由不同的测试集生成。
+    """
+    data_loader = DataLoader()
+    coordinator = Coordinator(data_loader)
+    test_data = data_loader.load_test_data()
+    groups = _session_groups(coordinator._load_evaluator_extras(len(test_data)))
+    queue.initialize(groups, reset=reset, fingerprint=queue_fingerprint(test_data, groups))
+    return len(groups)
+
+
+async def run_worker(
+    queue: WorkQueue,
+    worker_id: Optional[str] = None,
+    concurrency: Optional[int] = None,
+    lease_seconds: Optional[float] = None,
+    poll_seconds: float = 5.0,
+) -> int:
+    """
+    持续领取并执行任务，直到队列中没有待执行或可接管的任务。
+    每个样本依次经过 describe → evaluate → analyze，结果立即写回队列；任务被重新领取时跳过已完成的样本。
+    单个样本执行失败时与 Coordinator 一致写入失败占位结果（分析结果为“未知”），可在合并后用 rerun 重新评估。
+    续约失败（租约已被其他 worker 接管）时取消正在执行的任务，结果只由新的持有者写入。
+    队列操作在线程池中执行，不阻塞事件循环。
+    Args:
+        queue: 任务队列。
+        worker_id: worker 标识，默认使用 主机名-进程号。
+        concurrency: 本进程同时执行的任务（会话）数，默认使用 [eval] max_concurrency。
+        lease_seconds: 租约时长，默认读取 [runner] lease_seconds。
+        poll_seconds: 其他 worker 仍持有租约时的轮询间隔。
+    Returns:
+        本 worker 完成的任务数。
+    """
+    worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}"
+    lease_seconds = lease_seconds or _runner_config()["lease_seconds"]
+    data_loader = DataLoader()
+    coordinator = Coordinator(data_loader, max_concurrency=concurrency)
+    test_data = data_loader.load_test_data()
+    extras_list = coordinator._load_evaluator_extras(len(test_data))
+    await asyncio.to_thread(queue.check_fingerprint, queue_fingerprint(test_data, _session_groups(extras_list)))
+    ids = sample_ids(test_data)
+    analyst = coordinator.analyst
+    completed_tasks = 0
+
+    async def keep_lease(task_id: int, work: "asyncio.Task[None]") -> None:
+        while True:
+            await asyncio.sleep(lease_seconds / 3)
+            if not await asyncio.to_thread(queue.renew, task_id, worker_id, lease_seconds):
+                logger.warning(f"{worker_id}: 任务 {task_id} 的租约已被接管，停止执行")
+                work.cancel()
+                return
+
+    async def run_task(task_id: int, indices: List[int]):
+        done = set(await asyncio.to_thread(queue.finished_indices, indices))
+        for index in indices:
+            if index in done:
+                continue
+            since = get_metrics_collector().count()
+            sample_id = ids[index]
+            # 单个样本失败时写入失败占位结果，不让整个任务（会话）重新排队
+            with sample_scope(sample_id):
+                described = await coordinator._guarded(
+                    "describes", sample_id, lambda: coordinator._describe_one(test_data[index])
+                )
+                evaluated = await coordinator._guarded(
+                    "evaluates", sample_id, lambda: coordinator._evaluate_one((described, extras_list[index]))
+                )
+                analyzed = await coordinator._guarded("analyze", sample_id, lambda: analyze_one(analyst, evaluated))
+            analyzed["query"] = test_data[index].get("query", "")
+            # 耗时统计随结果写回队列，合并时写入 target_latency_file
+            analyzed.update(target_latency_by_sample(get_metrics_collector().records(since)).get(ids[index], {}))
+            await asyncio.to_thread(queue.save_result, index, described, evaluated, analyzed, task_id, worker_id)
+
+    async def loop():
+        nonlocal completed_tasks
+        while True:
+            claimed = await asyncio.to_thread(queue.claim, worker_id, lease_seconds)
+            if claimed is None:
+                progress = await asyncio.to_thread(queue.progress)
+                if progress["leased"] == 0 and progress["pending"] == 0:
+                    return
+                # 其他 worker 仍在执行，等待其完成或租约过期后接管
+                await asyncio.sleep(poll_seconds)
+                continue
+            task_id, indices = claimed
+            work = asyncio.create_task(run_task(task_id, indices))
+            heartbeat = asyncio.create_task(keep_lease(task_id, work))
+            try:
+                await work
+            except asyncio.CancelledError:
+                if not heartbeat.done() or heartbeat.cancelled():
+                    # worker 本身被取消
+                    work.cancel()
+                    raise
+                # 租约已被接管：任务由新的持有者执行，本 worker 不再 complete / fail
+            except LeaseLost:
+                logger.warning(f"{worker_id}: 任务 {task_id} 的租约已被接管，结果未写入")
+            except Exception:
+                logger.error(f"{worker_id}: 任务 {task_id} 执行失败\n{traceback.format_exc()}")
+                await asyncio.to_thread(queue.fail, task_id, worker_id, traceback.format_exc(limit=3))
+            else:
+                await asyncio.to_thread(queue.complete, task_id, worker_id)
+                completed_tasks += 1
+            finally:
+                heartbeat.cancel()
+
+    await asyncio.gather(*(loop() for _ in range(coordinator.max_concurrency)))
+    logger.info(f"{worker_id}: 完成 {completed_tasks} 个任务")
+    if coordinator._failures:
+        logger.error(
+            f"{worker_id}: {len(coordinator._failures)} 个样本执行失败，结果记为失败占位:\n"
+            + "\n".join(f"  [{name}] {sample_id}: {error}" for name, sample_id, error in coordinator._failures)
+        )
+    logger.info(f"{worker_id}: LLM 用量与前缀缓存命中 {get_usage_tracker().stats()}")
+    logger.info(f"{worker_id}: 调用指标 {MetricsCollector.summarize(get_metrics_collector().drain())}")
+    return completed_tasks
+
+
+def worker_main(queue_file: str, concurrency: Optional[int] = None, rate_share: int = 1) -> None:
+    """
+    worker 进程入口。
+    Args:
+        rate_share: 共用 [llm] rpm / tpm 配额的 worker 数，本进程的限额为配置值的 1/rate_share。
+    """
+    configure_rate_limiter(rate_share)
+    asyncio.run(run_worker(open_queue(queue_file), concurrency=concurrency))
+
+
+def merge_results(queue: WorkQueue) -> str:
+    """
+    将队列中各 worker 的结果按 test.json 顺序合并，写出标准产物。
+    Returns:
+        包含分析报告的CSV字符串。
+    """
+    data_loader = DataLoader()
+    coordinator = Coordinator(data_loader)
+    test_data = data_loader.load_test_data()
+    count = len(test_data)
+    extras_list = coordinator._load_evaluator_extras(count)
+    queue.check_fingerprint(queue_fingerprint(test_data, _session_groups(extras_list)))
+    results = queue.results()
+    missing = [index for index in range(len(test_data)) if index not in results]
+    if missing:
+        raise RuntimeError(f"❌ 仍有 {len(missing)} 个样本没有结果（{queue.progress()}），无法合并: {missing[:20]}")
+
+    ids = sample_ids(test_data)
+    describe_hashes = coordinator._row_hashes("describes", test_data, [None] * count)
+    evaluate_hashes = coordinator._row_hashes("evaluates", extras_list, describe_hashes)
+    analyze_hashes = coordinator._row_hashes("analyze", [None] * count, evaluate_hashes)
+
+    data_loader.save_described_data([results[index]["described"] for index in range(count)])
+    coordinator._stamp("describer_output_file", ids, describe_hashes)
+    data_loader.save_evaluated_results([results[index]["evaluated"] for index in range(count)])
+    coordinator._stamp("evaluator_output_file", ids, evaluate_hashes)
+    analyzed = [results[index]["analyzed"] for index in range(count)]
+    data_loader.save_target_latency({
+        ids[index]: {column: row[column] for column in TARGET_LATENCY_HEADER}
+        for index, row in enumerate(analyzed) if "target_calls" in row
+    })
+    csv_report = coordinator._save_report(analyzed, ids)
+    coordinator._stamp("analysis_report_file", ids, analyze_hashes)
+    return csv_report
+
+
+def run_sharded(
+    workers: int,
+    queue_file: Optional[str] = None,
+    concurrency: Optional[int] = None,
+    reset: bool = False,
+) -> str:
+    """
+    在本机启动 workers 个 worker 进程执行整个测试集，完成后合并结果。
+    各 worker 平分 [llm] rpm / tpm 配额，合计不超过配置的限额。
+    其他机器可以通过 `python main.py worker --queue <同一队列文件> --rate-share <总 worker 数>` 加入。
+    Returns:
+        包含分析报告的CSV字符串。
+    """
+    queue = open_queue(queue_file)
+    task_count = prepare_queue(queue, reset=reset)
+    logger.info(f"队列 {queue.file_path}: {task_count} 个任务，启动 {workers} 个 worker 进程，平分 LLM 限流配额")
+
+    context = multiprocessing.get_context("spawn")
+    processes = [
+        context.Process(
+            target=worker_main, args=(queue.file_path, concurrency, workers), name=f"agenteval-worker-{i}"
+        )
+        for i in range(workers)
+    ]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+    failed = [process.name for process in processes if process.exitcode != 0]
+    if failed:
+        logger.warning(f"worker 进程异常退出: {failed}，其任务会在租约过期后由其他 worker 接管")
+    return merge_results(queue)
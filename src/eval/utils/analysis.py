@@ -1,22 +1,72 @@
+from typing import Any, Dict, List, Optional
+
 from src.agents import AnalystAgent
+from src.eval.utils.concurrency import bounded_gather
+from src.utils.logger import logger
+from src.utils.metrics import percentile
 import pandas as pd
 import io
 
+# 每个样本评估过程中调用待测智能体（agent_chat_inference，不含回放）的次数、失败次数（含超时）、超时次数、
+# 总耗时、单次最长耗时与流式调用的平均首字延迟
+TARGET_LATENCY_HEADER = [
+    "target_calls", "target_errors", "target_timeouts", "target_seconds", "target_max_seconds", "target_ttft"
+]
+TARGET_LATENCY_DESCRIPTION = [
+    "待测调用次数", "待测失败次数", "待测超时次数", "待测耗时(秒)", "待测单次最长耗时(秒)", "待测首字延迟(秒)"
+]
 CSV_HEADER = [
-    "query", "test_result", "score", "reason", "improvement_areas", "confidence", "strengths", "evaluation_time"
+    "query", "test_result", "score", "reason", "improvement_areas", "confidence", "strengths", "evaluation_time",
+    *TARGET_LATENCY_HEADER,
 ]
 CSV_DESCRIPTION = [
-    "测试语句", "测试结果", "评分", "评分理由", "改进建议", "置信度", "优点", "评测时间"
+    "测试语句", "测试结果", "评分", "评分理由", "改进建议", "置信度", "优点", "评测时间",
+    *TARGET_LATENCY_DESCRIPTION,
 ]
+# 默认需要重新评估的测试结果
+RERUN_TEST_RESULTS = ("失败", "部分通过", "未知")
+# 执行失败（重试耗尽或不可重试的错误）的样本：描述与评估结果为以该前缀开头的说明，分析结果的测试结果记为“未知”，
+# 不写入检查点日志，--resume 与 rerun 时会重新执行
+FAILURE_PREFIX = "❌ 执行失败"
+
+
+def failure_text(stage: str, error: BaseException) -> str:
+    return f"{FAILURE_PREFIX}（{stage}）: {type(error).__name__}: {error}"
+
+
+def failure_row(reason: str) -> Dict[str, Any]:
+    """执行失败的样本在分析报告中的行。"""
+    return {
+        "test_result": "未知", "score": '', "reason": reason, "improvement_areas": [], "confidence": '',
+        "strengths": [], "evaluation_time": '',
+    }
+
 
-async def batch_analyze(samples):
+def is_failure(result: Any) -> bool:
+    """判断描述、评估或分析结果是否为执行失败的占位结果。"""
+    if isinstance(result, dict):
+        result = result.get("reason")
+    return isinstance(result, str) and result.startswith(FAILURE_PREFIX)
+
+
+async def analyze_one(analyst, item):
+    # 评估已经失败的样本不再调用 analyst
+    if is_failure(item):
+        return failure_row(item)
+    response = await analyst.ainvoke({"input": str(item)})
+    return response["messages"]
+
+async def batch_analyze(samples, max_concurrency: int = 1):
     analyst = AnalystAgent()
-    analyzed_results = []
-    for item in samples:
-        response = await analyst.ainvoke({"input": str(item)})
-        answer = response["messages"]
-        analyzed_results.append(answer)
-    return analyzed_results
+
+    async def run(item):
+        return await analyze_one(analyst, item)
+
+    results = await bounded_gather(samples, run, max_concurrency, desc="Analyzing", return_exceptions=True)
+    return [
+        failure_row(failure_text("analyze", result)) if isinstance(result, Exception) else result
+        for result in results
+    ]
 
 def merge_origin_inputs_with_results(origin_inputs, results):
     merged = []
@@ -27,20 +77,111 @@ def merge_origin_inputs_with_results(origin_inputs, results):
     
     return merged
 
+def target_latency_by_sample(records: List[Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+    """
+    按样本汇总调用指标中的待测智能体调用记录。
+    Args:
+        records: MetricsCollector 的记录。
+    Returns:
+        样本 ID → TARGET_LATENCY_HEADER 各列的值。
+    """
+    grouped: Dict[str, List[Dict[str, Any]]] = {}
+    for record in records:
+        if record["kind"] == "target" and record["name"] == "agent_chat_inference" and record.get("sample_id"):
+            grouped.setdefault(record["sample_id"], []).append(record)
+
+    latency = {}
+    for sample_id, calls in grouped.items():
+        ttfts = [call["ttft"] for call in calls if call.get("ttft") is not None]
+        latency[sample_id] = {
+            "target_calls": len(calls),
+            "target_errors": sum(1 for call in calls if call["status"] != "ok"),
+            "target_timeouts": sum(1 for call in calls if call["status"] == "timeout"),
+            "target_seconds": round(sum(call["wall_seconds"] for call in calls), 3),
+            "target_max_seconds": round(max(call["wall_seconds"] for call in calls), 3),
+            "target_ttft": round(sum(ttfts) / len(ttfts), 3) if ttfts else '',
+        }
+    return latency
+
+
+def _number(value: Any) -> Optional[float]:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def target_latency_summary(results_list, slowest: int = 5) -> Optional[Dict[str, Any]]:
+    """
+    按报告中的待测智能体耗时列计算整次运行的汇总。
+    Args:
+        results_list: 报告的行（与 CSV_HEADER 字段一致）。
+        slowest: 列出耗时最长的样本数。
+    Returns:
+        样本数、调用数、失败数（含超时）与超时数、失败率、按样本耗时的 p50 / p90 / p99 / 最大值以及最慢的样本；
+        没有任何行带有耗时时返回 None。
+    """
+    timed = []
+    for row in results_list:
+        calls, seconds = _number(row.get("target_calls")), _number(row.get("target_seconds"))
+        if calls and seconds is not None:
+            timed.append((row, calls, seconds))
+    if not timed:
+        return None
+
+    seconds = [item[2] for item in timed]
+    calls = sum(item[1] for item in timed)
+    errors = sum(_number(row.get("target_errors")) or 0 for row, _, _ in timed)
+    timeouts = sum(_number(row.get("target_timeouts")) or 0 for row, _, _ in timed)
+    return {
+        "samples": len(timed),
+        "calls": int(calls),
+        "errors": int(errors),
+        "timeouts": int(timeouts),
+        "error_rate": round(errors / calls, 4),
+        "p50": percentile(seconds, 50),
+        "p90": percentile(seconds, 90),
+        "p99": percentile(seconds, 99),
+        "max": max(seconds),
+        "slowest": [
+            {"query": row.get("query", ""), "target_seconds": value}
+            for row, _, value in sorted(timed, key=lambda item: item[2], reverse=True)[:slowest]
+        ],
+    }
+
+
+def format_target_latency_summary(summary: Dict[str, Any]) -> str:
+    lines = [
+        f"待测智能体耗时（{summary['samples']} 个样本，按样本合计）: p50 {summary['p50']}s / p90 {summary['p90']}s / "
+        f"p99 {summary['p99']}s / 最大 {summary['max']}s；{summary['calls']} 次调用中失败 {summary['errors']} 次"
+        f"（其中超时 {summary['timeouts']} 次），失败率 {summary['error_rate']:.2%}",
+        "最慢的样本:",
+    ]
+    lines += [f"  {item['target_seconds']:>8}s  {str(item['query'])[:60]}" for item in summary["slowest"]]
+    return "\n".join(lines)
+
+
 def get_csv_report(results_list):
+    """
+    生成 CSV 报告；行中带有待测智能体耗时列时，同时在日志中输出整次运行的耗时分位数、最慢的样本与失败率。
+    """
     if not results_list:
         return ""
+
+    summary = target_latency_summary(results_list)
+    if summary is not None:
+        logger.info(format_target_latency_summary(summary))
     
     # 转换为 DataFrame
     df = pd.DataFrame(results_list)
     
-    # 处理列表类型字段
+    # 处理列表类型字段（空列表写为空字符串，不能交给 pd.notna 判断）
     list_columns = ['improvement_areas', 'strengths']
     for col in list_columns:
         if col in df.columns:
             df[col] = df[col].apply(
                 lambda x: '; '.join(str(item) for item in x) 
-                if isinstance(x, list) and x 
+                if isinstance(x, list) 
                 else x if pd.notna(x) 
                 else ''
             )
@@ -55,4 +196,48 @@ def get_csv_report(results_list):
     output = io.StringIO()
     df.to_csv(output, index=False, header=CSV_DESCRIPTION, encoding='utf-8')
     
-    return output.getvalue()
\ No newline at end of file
+    return output.getvalue()
+
+def _parse_number(value: str):
+    """把报告中的数值还原为 int 或 float，整数保持为 int（"8" 不会变成 8.0），无法解析时返回空字符串。"""
+    for cast in (int, float):
+        try:
+            return cast(value)
+        except ValueError:
+            pass
+    return ''
+
+def parse_csv_report(csv_report):
+    """
+    将 get_csv_report 生成的 CSV 字符串还原为结果字典列表（与 CSV_HEADER 字段一致）。
+    """
+    if not csv_report.strip():
+        return []
+    df = pd.read_csv(io.StringIO(csv_report), dtype=str, keep_default_na=False)
+    df = df.rename(columns=dict(zip(CSV_DESCRIPTION, CSV_HEADER)))
+    df = df.reindex(columns=CSV_HEADER, fill_value='')
+
+    results = []
+    for row in df.to_dict(orient="records"):
+        for col in ['improvement_areas', 'strengths']:
+            row[col] = [item for item in row[col].split('; ') if item] if row[col] else []
+        for col in ['score', 'confidence']:
+            row[col] = _parse_number(row[col])
+        results.append(row)
+    return results
+
+def select_rerun_indices(results_list, test_results=RERUN_TEST_RESULTS, min_confidence=None):
+    """
+    挑选需要重新评估的行：测试结果属于 test_results，或置信度低于 min_confidence（置信度缺失也会被选中）。
+    Returns:
+        需要重新评估的行下标列表。
+    """
+    indices = []
+    for index, row in enumerate(results_list):
+        confidence = row.get("confidence", '')
+        low_confidence = min_confidence is not None and (
+            not isinstance(confidence, (int, float)) or confidence < min_confidence
+        )
+        if row.get("test_result") in test_results or low_confidence:
+            indices.append(index)
+    return indices
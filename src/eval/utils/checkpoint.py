@@ -0,0 +1,117 @@
+"""检查点日志模块"""
+
+import hashlib
+import json
+import os
+import threading
+from typing import Any, Dict, List, Optional
+
+from src.utils.logger import logger
+
+try:
+    import fcntl
+except ImportError:  # Windows 下没有 fcntl，只保证进程内的写入互斥
+    fcntl = None
+
+
+def sample_ids(samples: List[Any]) -> List[str]:
+    """
+    为测试样本生成稳定的 ID：取样本内容的哈希，重复样本按出现次序追加序号。
+    样本在 test.json 中的位置变化不会影响其 ID。
+    Args:
+        samples: 测试样本列表。
+    Returns:
+        与 samples 顺序一致的 ID 列表。
+    """
+    ids = []
+    seen: Dict[str, int] = {}
+    for sample in samples:
+        content = json.dumps(sample, ensure_ascii=False, sort_keys=True)
+        digest = hashlib.sha1(content.encode("utf-8")).hexdigest()[:16]
+        occurrence = seen.get(digest, 0)
+        seen[digest] = occurrence + 1
+        ids.append(digest if occurrence == 0 else f"{digest}-{occurrence}")
+    return ids
+
+
+def input_hash(*parts: Any) -> str:
+    """
+    计算一行产物的输入哈希，任一输入变化都会得到不同的哈希。
+    Args:
+        parts: 参与计算的输入，例如样本、提示词模板、模型名称与上游行哈希。
+    Returns:
+        十六进制哈希字符串。
+    """
+    content = json.dumps(parts, ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()[:24]
+
+
+class CheckpointJournal:
+    """
+    追加写入的阶段检查点日志（JSON Lines）。
+    每完成一个样本写入一行 {"id": ..., "hash": ..., "result": ...}，进程中断后可据此跳过已完成的样本，
+    输入哈希不一致的记录视为过期。
+    写入时加进程内锁与文件锁，允许多个协程、多个进程同时写同一个日志。
+    """
+
+    def __init__(self, file_path: str):
+        self.file_path = file_path
+        self._lock = threading.Lock()
+        output_dir = os.path.dirname(file_path)
+        if output_dir:
+            os.makedirs(output_dir, exist_ok=True)
+
+    def load(self) -> Dict[str, Any]:
+        """
+        读取日志中已完成的结果，同一 ID 以最后一条记录为准。
+        进程崩溃时最后一行可能只写了一半（可能截断在多字节字符中间），无法解析的行会被跳过。
+        Returns:
+            样本 ID 到记录的字典，记录包含 "result" 与 "hash"。
+        """
+        records: Dict[str, Any] = {}
+        if not os.path.exists(self.file_path):
+            return records
+        with open(self.file_path, "r", encoding="utf-8", errors="replace") as f:
+            for line_no, line in enumerate(f, start=1):
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    record = json.loads(line)
+                    records[record["id"]] = {"result": record["result"], "hash": record.get("hash")}
+                except (ValueError, KeyError, TypeError):
+                    logger.warning(f"跳过损坏的检查点记录 {self.file_path}:{line_no}")
+        return records
+
+    def append(self, sample_id: str, result: Any, row_hash: Optional[str] = None) -> None:
+        """
+        追加一条完成记录并落盘。
+        Args:
+            sample_id: 样本 ID。
+            result: 该样本在本阶段的结果，需可 JSON 序列化。
+            row_hash: 产生该结果的输入哈希。
+        """
+        record = {"id": sample_id, "hash": row_hash, "result": result}
+        line = json.dumps(record, ensure_ascii=False) + "\n"
+        data = line.encode("utf-8")
+        with self._lock:
+            fd = os.open(self.file_path, os.O_RDWR | os.O_APPEND | os.O_CREAT, 0o644)
+            try:
+                if fcntl is not None:
+                    fcntl.flock(fd, fcntl.LOCK_EX)
+                # 上次写入被中断时文件末尾没有换行，先补齐，避免新记录与残行粘连
+                size = os.fstat(fd).st_size
+                if size > 0 and os.pread(fd, 1, size - 1) != b"\n":
+                    data = b"\n" + data
+                os.write(fd, data)
+                os.fsync(fd)
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(fd, fcntl.LOCK_UN)
+                os.close(fd)
+
+    def reset(self) -> None:
+        """清空日志，开始新一轮记录。"""
+        with self._lock:
+            with open(self.file_path, "w", encoding="utf-8"):
+                pass
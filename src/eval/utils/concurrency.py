@@ -0,0 +1,88 @@
+"""并发执行模块"""
+
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Optional, Sequence
+
+import tqdm
+
+
+async def bounded_gather(
+    items: Sequence[Any],
+    worker: Callable[[Any], Awaitable[Any]],
+    max_concurrency: int = 1,
+    desc: Optional[str] = None,
+    return_exceptions: bool = False,
+) -> List[Any]:
+    """
+    以有界并发的方式对每个元素执行 worker，结果按输入顺序返回。
+    Args:
+        items: 待处理的元素序列。
+        worker: 异步处理函数，接收单个元素。
+        max_concurrency: 同时在途的最大请求数，小于 1 时按 1 处理。
+        desc: 进度条描述，为 None 时不显示进度条。
+        return_exceptions: 为 True 时单个元素抛出的异常作为其结果返回，其余元素照常执行；
+            为 False 时第一个异常向上抛出。
+    Returns:
+        与 items 顺序一致的结果列表。
+    """
+    semaphore = asyncio.Semaphore(max(1, max_concurrency))
+    results: List[Any] = [None] * len(items)
+    progress = tqdm.tqdm(total=len(items), desc=desc) if desc else None
+
+    async def run(index: int, item: Any) -> None:
+        async with semaphore:
+            try:
+                results[index] = await worker(item)
+            except Exception as e:
+                if not return_exceptions:
+                    raise
+                results[index] = e
+        if progress is not None:
+            progress.update(1)
+
+    try:
+        await asyncio.gather(*(run(i, item) for i, item in enumerate(items)))
+    finally:
+        if progress is not None:
+            progress.close()
+    return results
+
+
+async def session_affine_gather(
+    items: Sequence[Any],
+    worker: Callable[[Any], Awaitable[Any]],
+    session_key: Callable[[Any], Hashable],
+    max_concurrency: int = 1,
+    desc: Optional[str] = None,
+) -> List[Any]:
+    """
+    按会话亲和性调度：不同会话之间并发执行，同一会话内的元素按输入顺序串行执行。
+    Args:
+        items: 待处理的元素序列。
+        worker: 异步处理函数，接收单个元素。
+        session_key: 从元素中提取会话键的函数，键相同的元素共享会话状态。
+        max_concurrency: 同时执行的最大会话数，小于 1 时按 1 处理。
+        desc: 进度条描述，为 None 时不显示进度条。
+    Returns:
+        与 items 顺序一致的结果列表。
+    """
+    # 按首次出现顺序分组，组内保留原始顺序
+    groups: Dict[Hashable, List[int]] = {}
+    for index, item in enumerate(items):
+        groups.setdefault(session_key(item), []).append(index)
+
+    results: List[Any] = [None] * len(items)
+    progress = tqdm.tqdm(total=len(items), desc=desc) if desc else None
+
+    async def run_session(indices: List[int]) -> None:
+        for index in indices:
+            results[index] = await worker(items[index])
+            if progress is not None:
+                progress.update(1)
+
+    try:
+        await bounded_gather(list(groups.values()), run_session, max_concurrency)
+    finally:
+        if progress is not None:
+            progress.close()
+    return results
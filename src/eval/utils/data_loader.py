@@ -2,7 +2,7 @@
 
 import json
 import os
-from typing import Any, Dict, List
+from typing import Any, Dict, List, Optional
 
 import config
 
@@ -79,6 +79,70 @@ class DataLoader:
         evaluator_output_file = self.config.get('eval', 'evaluator_output_file')
         return self._load_json_file(evaluator_output_file)
 
+    def load_analysis_report(self, report_file: Optional[str] = None) -> str:
+        """加载 CSV 分析报告，默认读取配置中的 analysis_report_file"""
+        report_file = report_file or self.config.get('eval', 'analysis_report_file')
+        resolved_path = self._resolve_path(report_file)
+        if not os.path.exists(resolved_path):
+            raise FileNotFoundError(f"文件未找到: {resolved_path}")
+        with open(resolved_path, 'r', encoding='utf-8') as f:
+            return f.read()
+
+    def save_row_hashes(self, option: str, row_hashes: List[Dict[str, str]]):
+        """保存产物每一行的样本 ID 与输入哈希，与产物文件并列存放"""
+        artifact_file = self.config.get('eval', option)
+        self._dump_json_file(row_hashes, f"{artifact_file}.hashes.json")
+
+    def load_row_hashes(self, option: str) -> List[Dict[str, str]]:
+        """加载产物每一行的样本 ID 与输入哈希，不存在时返回空列表"""
+        artifact_file = self.config.get('eval', option)
+        if not os.path.exists(self._resolve_path(f"{artifact_file}.hashes.json")):
+            return []
+        return self._load_json_file(f"{artifact_file}.hashes.json")
+
+    def get_checkpoint_file(self, stage: str) -> str:
+        """获取某一阶段检查点日志的路径"""
+        checkpoint_dir = self.config.get('eval', 'checkpoint_dir', fallback='./data/eval_results/checkpoints')
+        return os.path.join(self._resolve_path(checkpoint_dir), f"{stage}.jsonl")
+
+    def get_queue_file(self, queue_file: str) -> str:
+        """获取分片运行任务队列文件的绝对路径"""
+        return self._resolve_path(queue_file)
+
+    def save_metrics(self, stage: str, summary: Dict[str, Any], records: List[Dict[str, Any]]):
+        """
+        保存某一阶段的调用指标：汇总按阶段合并写入 metrics_summary_file，逐次调用记录追加到 metrics_calls_file。
+        两个文件默认与分析报告位于同一目录。
+        """
+        report_dir = os.path.dirname(self.config.get('eval', 'analysis_report_file'))
+        summary_file = self.config.get('eval', 'metrics_summary_file', fallback=os.path.join(report_dir, 'metrics_summary.json'))
+        calls_file = self.config.get('eval', 'metrics_calls_file', fallback=os.path.join(report_dir, 'metrics_calls.jsonl'))
+        os.makedirs(os.path.dirname(self._resolve_path(summary_file)), exist_ok=True)
+
+        summaries = self._load_json_file(summary_file) if os.path.exists(self._resolve_path(summary_file)) else {}
+        summaries[stage] = summary
+        self._dump_json_file(summaries, summary_file)
+        with open(self._resolve_path(calls_file), 'a', encoding='utf-8') as f:
+            for record in records:
+                f.write(json.dumps({"stage": stage, **record}, ensure_ascii=False) + "\n")
+
+    def _target_latency_file(self) -> str:
+        report_dir = os.path.dirname(self.config.get('eval', 'analysis_report_file'))
+        return self.config.get('eval', 'target_latency_file', fallback=os.path.join(report_dir, 'target_latency.json'))
+
+    def save_target_latency(self, latency: Dict[str, Dict[str, Any]]):
+        """按样本 ID 更新每个样本调用待测智能体的耗时统计，未出现的样本保留上一次的统计"""
+        latency_file = self._target_latency_file()
+        os.makedirs(os.path.dirname(self._resolve_path(latency_file)), exist_ok=True)
+        self._dump_json_file({**self.load_target_latency(), **latency}, latency_file)
+
+    def load_target_latency(self) -> Dict[str, Dict[str, Any]]:
+        """加载每个样本调用待测智能体的耗时统计，不存在时返回空字典"""
+        latency_file = self._target_latency_file()
+        if not os.path.exists(self._resolve_path(latency_file)):
+            return {}
+        return self._load_json_file(latency_file)
+
     def save_analysis_report(self, csv_report: str):
         """保存分析报告为 CSV 文件"""
         analysis_report_file = self.config.get('eval', 'analysis_report_file')
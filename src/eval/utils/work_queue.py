@@ -0,0 +1,215 @@
+"""基于 SQLite 的租约式任务队列"""
+
+import json
+import os
+import sqlite3
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+PENDING = "pending"
+LEASED = "leased"
+DONE = "done"
+FAILED = "failed"
+
+
+class LeaseLost(RuntimeError):
+    """任务的租约已被其他 worker 接管。"""
+
+
+class WorkQueue:
+    """
+    多进程、多机器共享的任务队列，存放在一个 SQLite 文件中（可以放在共享存储上）。
+    每个任务是一组必须串行执行的样本下标（同一 session_id 的样本）。
+    worker 领取任务时获得有时限的租约，需要定期续约；租约过期的任务会被其他 worker 重新领取，
+    因此 worker 进程或机器宕机后其任务不会丢失。每个样本的结果完成后立即写入队列文件。
+    队列记录生成任务时测试集的指纹，测试集变化后不能继续使用旧队列。
+    各方法是阻塞调用，在事件循环中应通过 asyncio.to_thread 调用。
+    """
+
+    def __init__(self, file_path: str, max_attempts: int = 3):
+        self.file_path = file_path
+        self.max_attempts = max_attempts
+        output_dir = os.path.dirname(file_path)
+        if output_dir:
+            os.makedirs(output_dir, exist_ok=True)
+
+    @contextmanager
+    def _transaction(self) -> Iterator[sqlite3.Connection]:
+        # 每次操作使用独立连接，避免跨进程 / 跨线程共享连接；BEGIN IMMEDIATE 保证领取任务的原子性
+        conn = sqlite3.connect(self.file_path, timeout=60, isolation_level=None)
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield conn
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+        finally:
+            conn.close()
+
+    def initialize(self, groups: List[List[int]], reset: bool = False, fingerprint: Optional[str] = None) -> None:
+        """
+        创建队列并写入任务；队列中已有任务且 reset 为 False 时保持不变，便于中断后继续。
+        Args:
+            groups: 任务列表，每个任务是一组需要串行执行的样本下标。
+            reset: 为 True 时清空已有任务与结果。
+            fingerprint: 测试集指纹；队列中已有任务时必须与生成任务时的指纹一致。
+        Raises:
+            ValueError: reset 为 False 且已有任务由不同的测试集生成。
+        """
+        with self._transaction() as conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS tasks ("
+                "task_id INTEGER PRIMARY KEY, indices TEXT NOT NULL, status TEXT NOT NULL, "
+                "worker TEXT, lease_expires REAL, attempts INTEGER NOT NULL DEFAULT 0, error TEXT)"
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS results ("
+                "sample_index INTEGER PRIMARY KEY, described TEXT, evaluated TEXT, analyzed TEXT)"
+            )
+            if reset:
+                conn.execute("DELETE FROM tasks")
+                conn.execute("DELETE FROM results")
+            if conn.execute("SELECT COUNT(*) FROM tasks").fetchone()[0] == 0:
+                conn.executemany(
+                    "INSERT INTO tasks (task_id, indices, status) VALUES (?, ?, ?)",
+                    [(task_id, json.dumps(indices), PENDING) for task_id, indices in enumerate(groups)],
+                )
+                conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('fingerprint', ?)", (fingerprint,))
+            else:
+                self._check_fingerprint(conn, fingerprint)
+
+    def _check_fingerprint(self, conn: sqlite3.Connection, fingerprint: Optional[str]) -> None:
+        if fingerprint is None:
+            return
+        row = conn.execute("SELECT value FROM meta WHERE key = 'fingerprint'").fetchone()
+        if row is None or row[0] != fingerprint:
+            raise ValueError(
+                f"❌ 队列 {self.file_path} 中的任务由不同的测试集生成，请使用 --reset 重新生成任务"
+            )
+
+    def check_fingerprint(self, fingerprint: str) -> None:
+        """
+        确认队列由当前测试集生成，加入已有队列的 worker 与合并结果前调用。
+        Raises:
+            ValueError: 队列尚未初始化，或由不同的测试集生成。
+        """
+        with self._transaction() as conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+            self._check_fingerprint(conn, fingerprint)
+
+    def claim(self, worker_id: str, lease_seconds: float) -> Optional[Tuple[int, List[int]]]:
+        """
+        领取一个待执行或租约已过期的任务。
+        Returns:
+            (任务 ID, 样本下标列表)，没有可领取的任务时返回 None。
+        """
+        now = time.time()
+        with self._transaction() as conn:
+            row = conn.execute(
+                "SELECT task_id, indices FROM tasks "
+                "WHERE (status = ? OR (status = ? AND lease_expires < ?)) AND attempts < ? "
+                "ORDER BY task_id LIMIT 1",
+                (PENDING, LEASED, now, self.max_attempts),
+            ).fetchone()
+            if row is None:
+                return None
+            conn.execute(
+                "UPDATE tasks SET status = ?, worker = ?, lease_expires = ?, attempts = attempts + 1 "
+                "WHERE task_id = ?",
+                (LEASED, worker_id, now + lease_seconds, row[0]),
+            )
+        return row[0], json.loads(row[1])
+
+    def renew(self, task_id: int, worker_id: str, lease_seconds: float) -> bool:
+        """续约，返回 False 表示租约已被其他 worker 接管。"""
+        with self._transaction() as conn:
+            cursor = conn.execute(
+                "UPDATE tasks SET lease_expires = ? WHERE task_id = ? AND worker = ? AND status = ?",
+                (time.time() + lease_seconds, task_id, worker_id, LEASED),
+            )
+            return cursor.rowcount == 1
+
+    def complete(self, task_id: int, worker_id: str) -> None:
+        with self._transaction() as conn:
+            conn.execute(
+                "UPDATE tasks SET status = ?, lease_expires = NULL, error = NULL WHERE task_id = ? AND worker = ?",
+                (DONE, task_id, worker_id),
+            )
+
+    def fail(self, task_id: int, worker_id: str, error: str) -> None:
+        """任务失败：未超过最大尝试次数时重新排队，否则标记为失败。"""
+        with self._transaction() as conn:
+            conn.execute(
+                "UPDATE tasks SET status = CASE WHEN attempts < ? THEN ? ELSE ? END, "
+                "lease_expires = NULL, error = ? WHERE task_id = ? AND worker = ?",
+                (self.max_attempts, PENDING, FAILED, error, task_id, worker_id),
+            )
+
+    def save_result(
+        self,
+        sample_index: int,
+        described: Any,
+        evaluated: Any,
+        analyzed: Any,
+        task_id: Optional[int] = None,
+        worker_id: Optional[str] = None,
+    ) -> None:
+        """
+        写入一个样本的结果。
+        Args:
+            task_id: 样本所属任务，与 worker_id 一起给出时，只有仍持有该任务的租约才写入。
+            worker_id: 写入结果的 worker。
+        Raises:
+            LeaseLost: 任务的租约已被其他 worker 接管，结果没有写入。
+        """
+        with self._transaction() as conn:
+            if task_id is not None and worker_id is not None:
+                held = conn.execute(
+                    "SELECT 1 FROM tasks WHERE task_id = ? AND worker = ? AND status = ?",
+                    (task_id, worker_id, LEASED),
+                ).fetchone()
+                if held is None:
+                    raise LeaseLost(f"任务 {task_id} 的租约已被其他 worker 接管")
+            conn.execute(
+                "INSERT OR REPLACE INTO results (sample_index, described, evaluated, analyzed) VALUES (?, ?, ?, ?)",
+                (
+                    sample_index,
+                    json.dumps(described, ensure_ascii=False),
+                    json.dumps(evaluated, ensure_ascii=False),
+                    json.dumps(analyzed, ensure_ascii=False),
+                ),
+            )
+
+    def finished_indices(self, indices: List[int]) -> List[int]:
+        """返回 indices 中已经有结果的样本下标。"""
+        with self._transaction() as conn:
+            rows = conn.execute(
+                f"SELECT sample_index FROM results WHERE sample_index IN ({','.join('?' * len(indices))})",
+                indices,
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def results(self) -> Dict[int, Dict[str, Any]]:
+        """返回已完成样本的结果，键为样本下标。"""
+        with self._transaction() as conn:
+            rows = conn.execute("SELECT sample_index, described, evaluated, analyzed FROM results").fetchall()
+        return {
+            row[0]: {"described": json.loads(row[1]), "evaluated": json.loads(row[2]), "analyzed": json.loads(row[3])}
+            for row in rows
+        }
+
+    def progress(self) -> Dict[str, int]:
+        """各状态的任务数量；租约已过期的任务计为 pending。"""
+        counts = {PENDING: 0, LEASED: 0, DONE: 0, FAILED: 0}
+        now = time.time()
+        with self._transaction() as conn:
+            rows = conn.execute("SELECT status, lease_expires, attempts FROM tasks").fetchall()
+        for status, lease_expires, attempts in rows:
+            if status == LEASED and lease_expires is not None and lease_expires < now:
+                status = PENDING if attempts < self.max_attempts else FAILED
+            counts[status] += 1
+        return counts
@@ -0,0 +1,153 @@
+"""
+离线聊天模型
+    用于基准测试：不访问网络、不消耗 token，按固定延迟返回确定性的结果。
+    - 绑定了普通工具时，按 tool_script 的顺序依次调用（对话中每出现一条工具结果前进一步），脚本走完后返回文本回复；
+    - 以 tool_choice="any" 绑定了结构化输出格式（create_agent 的 response_format）时，按其 JSON Schema 生成合法的参数，
+      数组字段的长度与打包消息中的样本数一致；
+    - usage 中的 token 数为估算值，系统提示词部分记为前缀缓存命中。
+"""
+import asyncio
+import re
+import time
+from typing import Any, Dict, List, Optional, Sequence
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, SystemMessage, ToolMessage
+from langchain_core.messages.utils import count_tokens_approximately
+from langchain_core.outputs import ChatGeneration, ChatResult
+
+from config import Configuration, load_config
+from src.utils.usage import openai_tool_schema
+
+# 打包消息中每个样本的标题，见 src.agents.packing.format_pack
+_PACK_ITEM = re.compile(r"^### 样本 \d+$", re.MULTILINE)
+
+
+class ScriptedChatModel(BaseChatModel):
+    """确定性的离线聊天模型。"""
+
+    model_name: str = "scripted-chat"
+    latency: float = 0.0
+    tool_script: List[str] = ["agent_chat_inference"]
+    tools: List[Dict[str, Any]] = []
+    response_formats: List[Dict[str, Any]] = []
+
+    @property
+    def _llm_type(self) -> str:
+        return "scripted-chat"
+
+    @property
+    def _identifying_params(self) -> Dict[str, Any]:
+        return {"model_name": self.model_name, "latency": self.latency}
+
+    def bind_tools(self, tools: Sequence[Any], *, tool_choice: Optional[Any] = None, **kwargs: Any) -> "ScriptedChatModel":
+        # create_agent 的结构化输出（ToolStrategy）以 tool_choice="any" 绑定，脚本之外的工具视为输出格式
+        converted = [openai_tool_schema(tool) for tool in tools]
+        if tool_choice != "any":
+            return self.model_copy(update={"tools": converted, "response_formats": []})
+        return self.model_copy(update={
+            "tools": [tool for tool in converted if tool["function"]["name"] in self.tool_script],
+            "response_formats": [tool for tool in converted if tool["function"]["name"] not in self.tool_script],
+        })
+
+    def _reply(self, messages: List[BaseMessage]) -> AIMessage:
+        tool_names = {tool["function"]["name"] for tool in self.tools}
+        script = [name for name in self.tool_script if name in tool_names]
+        step = sum(isinstance(message, ToolMessage) for message in messages)
+        last_human = next((message for message in reversed(messages) if isinstance(message, HumanMessage)), None)
+        last_text = str(last_human.content) if last_human is not None else ""
+
+        if step < len(script):
+            tool = next(tool for tool in self.tools if tool["function"]["name"] == script[step])
+            return self._tool_call(tool, step, 1)
+        if self.response_formats:
+            return self._tool_call(self.response_formats[0], step, pack_size(last_text))
+        return AIMessage(content=f"离线回复（第 {step} 次工具调用后）: {last_text[:40]}")
+
+    @staticmethod
+    def _tool_call(tool: Dict[str, Any], step: int, count: int) -> AIMessage:
+        function = tool["function"]
+        parameters = function.get("parameters") or {}
+        args = schema_example(parameters, parameters.get("$defs", {}), count)
+        return AIMessage(content="", tool_calls=[{"name": function["name"], "args": args, "id": f"call_{step}"}])
+
+    def _result(self, messages: List[BaseMessage]) -> ChatResult:
+        message = self._reply(messages)
+        prompt_tokens = count_tokens_approximately(messages)
+        completion_tokens = count_tokens_approximately([message])
+        cache_hit_tokens = count_tokens_approximately([m for m in messages if isinstance(m, SystemMessage)])
+        token_usage = {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+            "prompt_cache_hit_tokens": cache_hit_tokens,
+            "prompt_cache_miss_tokens": prompt_tokens - cache_hit_tokens,
+        }
+        message.response_metadata = {"token_usage": token_usage, "model_name": self.model_name}
+        message.usage_metadata = {
+            "input_tokens": prompt_tokens,
+            "output_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+            "input_token_details": {"cache_read": cache_hit_tokens},
+        }
+        return ChatResult(generations=[ChatGeneration(message=message)], llm_output={"token_usage": token_usage})
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager: Any = None,
+                  **kwargs: Any) -> ChatResult:
+        if self.latency > 0:
+            time.sleep(self.latency)
+        return self._result(messages)
+
+    async def _agenerate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager: Any = None,
+                         **kwargs: Any) -> ChatResult:
+        if self.latency > 0:
+            await asyncio.sleep(self.latency)
+        return self._result(messages)
+
+
+def pack_size(text: str) -> int:
+    """打包消息中的样本数，普通消息为 1。"""
+    return max(1, len(_PACK_ITEM.findall(text)))
+
+
+def schema_example(schema: Dict[str, Any], defs: Dict[str, Any], count: int) -> Any:
+    """按 JSON Schema 生成确定性的合法值，最外层对象中的数组生成 count 个元素，更深层的数组生成 1 个。"""
+    if "$ref" in schema:
+        return schema_example(defs[schema["$ref"].split("/")[-1]], defs, count)
+    if "enum" in schema:
+        return schema["enum"][0]
+    for key in ("anyOf", "oneOf", "allOf"):
+        if key in schema:
+            options = [option for option in schema[key] if option.get("type") != "null"]
+            return schema_example(options[0] if options else {}, defs, count)
+    kind = schema.get("type")
+    if kind == "object":
+        return {name: schema_example(field, defs, count) for name, field in schema.get("properties", {}).items()}
+    if kind == "array":
+        return [schema_example(schema.get("items", {}), defs, 1) for _ in range(count)]
+    if kind in ("number", "integer"):
+        low, high = schema.get("minimum"), schema.get("maximum")
+        value = (low + high) / 2 if low is not None and high is not None else (low if low is not None else 1)
+        return int(value) if kind == "integer" else float(value)
+    if kind == "boolean":
+        return True
+    return "benchmark"
+
+
+def create_scripted_chat_model(config: Configuration, callbacks: Optional[List[Any]] = None) -> ScriptedChatModel:
+    """
+    [llm] chat_model_factory 使用的工厂函数，延迟与工具脚本读取自 config.ini 的 [mock] 段。
+    Args:
+        config: LLM 配置，只使用其中的模型名称。
+        callbacks: 挂在模型上的回调。
+    Returns:
+        离线聊天模型。
+    """
+    config_ini = load_config()
+    tool_script = config_ini.get("mock", "tool_script", fallback="agent_chat_inference")
+    return ScriptedChatModel(
+        model_name=config.model or "scripted-chat",
+        latency=config_ini.getfloat("mock", "llm_latency", fallback=0.0),
+        tool_script=[name.strip() for name in tool_script.split(",") if name.strip()],
+        callbacks=callbacks,
+    )
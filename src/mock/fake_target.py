@@ -0,0 +1,45 @@
+"""
+离线待测智能体
+    与 src/mock/agent_api_inference.py 接口一致，但在进程内直接返回确定性的回复，不需要启动服务。
+    将 config.ini 的 [agent] target_api_module 设为 src.mock.fake_target 即可使用，回复延迟读取自 [mock] target_latency。
+    同时提供异步版本，异步版本的延迟不占用线程；流式版本把回复按 STREAM_CHUNK_CHARS 个字符分段，延迟平均分摊到各段。
+"""
+import asyncio
+import time
+from typing import AsyncIterator, Optional
+
+from config import load_config
+
+STREAM_CHUNK_CHARS = 4
+
+
+def agent_api_health_check() -> dict:
+    return {"status": 200, "message": "智能体正常"}
+
+
+def agent_api_inference(query: str, session_id: Optional[str] = None) -> str:
+    latency = load_config().getfloat("mock", "target_latency", fallback=0.0)
+    if latency > 0:
+        time.sleep(latency)
+    return f"[{session_id or 'default'}] 已收到查询：{query}"
+
+
+async def aagent_api_health_check() -> dict:
+    return agent_api_health_check()
+
+
+async def aagent_api_inference(query: str, session_id: Optional[str] = None) -> str:
+    latency = load_config().getfloat("mock", "target_latency", fallback=0.0)
+    if latency > 0:
+        await asyncio.sleep(latency)
+    return f"[{session_id or 'default'}] 已收到查询：{query}"
+
+
+async def aagent_api_stream(query: str, session_id: Optional[str] = None) -> AsyncIterator[str]:
+    latency = load_config().getfloat("mock", "target_latency", fallback=0.0)
+    reply = f"[{session_id or 'default'}] 已收到查询：{query}"
+    chunks = [reply[i:i + STREAM_CHUNK_CHARS] for i in range(0, len(reply), STREAM_CHUNK_CHARS)]
+    for chunk in chunks:
+        if latency > 0:
+            await asyncio.sleep(latency / len(chunks))
+        yield chunk
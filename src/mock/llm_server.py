@@ -0,0 +1,381 @@
+"""
+本地 OpenAI 兼容 LLM 桩服务
+    在本机提供与 DeepSeek / OpenAI 一致的 POST /chat/completions（以及 /v1/chat/completions）接口，
+    用于真实地测试连接池、限流、重试与超时：将 .env 中的 DS_BASE_URL 指向 http://127.0.0.1:<port> 即可。
+    回复逻辑与离线聊天模型（src/mock/chat_model.py）一致：按工具脚本调用工具，tool_choice 为 required 时
+    按 JSON Schema 生成结构化输出。以下行为可以按概率注入，并可在运行中通过 POST /_control 修改：
+    - 延迟：对数正态分布，latency 为中位数，latency_sigma 为 0 时固定；
+    - 429（带 Retry-After）与 5xx 错误；
+    - 挂起（超过客户端超时）；
+    - 流式输出时每个分片之间的延迟；
+    - 格式错误的结构化输出（缺少字段、打包条数不符）。
+    GET /_stats 返回各类响应的计数。
+
+用法:
+    python -m src.mock.llm_server --port 8765 --latency 0.2 --latency-sigma 0.5 --rate-429 0.05 --rate-5xx 0.02
+"""
+import argparse
+import json
+import math
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, Tuple
+
+from src.mock.chat_model import pack_size, schema_example
+
+DEFAULT_SETTINGS: Dict[str, Any] = {
+    # 延迟中位数（秒）与对数正态分布的 sigma
+    "latency": 0.0,
+    "latency_sigma": 0.0,
+    # 各类故障的注入概率
+    "rate_429": 0.0,
+    "rate_5xx": 0.0,
+    "rate_hang": 0.0,
+    "rate_malformed": 0.0,
+    # 429 响应的 Retry-After（秒）与挂起时长（秒）
+    "retry_after": 1.0,
+    "hang_seconds": 600.0,
+    # 流式输出的分片大小（字符）与分片间延迟（秒）
+    "stream_chunk_chars": 8,
+    "stream_chunk_delay": 0.0,
+    # 依次调用的工具
+    "tool_script": ["agent_chat_inference"],
+    "seed": None,
+}
+
+
+def _approx_tokens(value: Any) -> int:
+    text = value if isinstance(value, str) else json.dumps(value, ensure_ascii=False)
+    return max(1, len(text) // 4)
+
+
+class StubState:
+    """桩服务的设置、随机数与计数，在所有请求线程间共享。"""
+
+    def __init__(self, settings: Optional[Dict[str, Any]] = None):
+        self.lock = threading.Lock()
+        self.settings = dict(DEFAULT_SETTINGS)
+        self.stats: Dict[str, int] = {}
+        self.random = random.Random()
+        self.update(settings or {})
+
+    def update(self, settings: Dict[str, Any]) -> Dict[str, Any]:
+        unknown = set(settings) - set(DEFAULT_SETTINGS)
+        if unknown:
+            raise ValueError(f"未知的设置: {', '.join(sorted(unknown))}")
+        with self.lock:
+            self.settings.update(settings)
+            if "seed" in settings:
+                self.random.seed(settings["seed"])
+            return dict(self.settings)
+
+    def count(self, key: str) -> None:
+        with self.lock:
+            self.stats[key] = self.stats.get(key, 0) + 1
+
+    def draw(self) -> Tuple[Dict[str, Any], float, float]:
+        """返回本次请求使用的设置快照、故障随机数与延迟。"""
+        with self.lock:
+            settings = dict(self.settings)
+            roll = self.random.random()
+            latency = settings["latency"]
+            if latency > 0 and settings["latency_sigma"] > 0:
+                latency = math.exp(self.random.gauss(math.log(latency), settings["latency_sigma"]))
+            return settings, roll, latency
+
+    def chance(self, rate: float) -> bool:
+        with self.lock:
+            return self.random.random() < rate
+
+    def choice(self, options: Tuple[Any, ...]) -> Any:
+        with self.lock:
+            return self.random.choice(options)
+
+
+def completion_message(body: Dict[str, Any], state: StubState, settings: Dict[str, Any]) -> Dict[str, Any]:
+    """根据请求生成 assistant 消息（OpenAI 格式）。"""
+    messages: List[Dict[str, Any]] = body.get("messages", [])
+    tools = [tool for tool in body.get("tools") or [] if tool.get("type") == "function"]
+    step = sum(message.get("role") == "tool" for message in messages)
+    last_user = next((message for message in reversed(messages) if message.get("role") == "user"), {})
+    last_text = last_user.get("content") if isinstance(last_user.get("content"), str) else json.dumps(last_user.get("content"))
+    tool_choice = body.get("tool_choice")
+    script = [tool["function"]["name"] for tool in tools if tool["function"]["name"] in settings["tool_script"]]
+
+    if tools and tool_choice not in (None, "auto", "none"):
+        # create_agent 的结构化输出以 tool_choice 强制调用输出格式工具
+        candidates = [tool for tool in tools if tool["function"]["name"] not in settings["tool_script"]] or tools
+        return _tool_call_message(candidates[0], pack_size(last_text or ""), state, settings)
+    if step < len(script):
+        tool = next(tool for tool in tools if tool["function"]["name"] == script[step])
+        return _tool_call_message(tool, 1, state, settings)
+    response_format = body.get("response_format") or {}
+    if response_format.get("type") == "json_schema":
+        schema = response_format["json_schema"].get("schema", {})
+        content = _maybe_malformed(schema_example(schema, schema.get("$defs", {}), pack_size(last_text or "")),
+                                   state, settings)
+        return {"role": "assistant", "content": json.dumps(content, ensure_ascii=False)}
+    return {"role": "assistant", "content": f"桩服务回复（第 {step} 次工具调用后）: {(last_text or '')[:40]}"}
+
+
+def _maybe_malformed(value: Any, state: StubState, settings: Dict[str, Any]) -> Any:
+    """按概率破坏结构化输出：数组少一条，或者删掉第一个字段。"""
+    if not isinstance(value, dict) or not value or not state.chance(settings["rate_malformed"]):
+        return value
+    state.count("malformed")
+    value = dict(value)
+    for key, field in value.items():
+        if isinstance(field, list) and len(field) > 1:
+            value[key] = field[:-1]
+            return value
+    value.pop(next(iter(value)))
+    return value
+
+
+def _tool_call_message(tool: Dict[str, Any], count: int, state: StubState, settings: Dict[str, Any]) -> Dict[str, Any]:
+    parameters = tool["function"].get("parameters") or {}
+    args = schema_example(parameters, parameters.get("$defs", {}), count)
+    if tool["function"]["name"] not in settings["tool_script"]:
+        args = _maybe_malformed(args, state, settings)
+    return {
+        "role": "assistant",
+        "content": "",
+        "tool_calls": [{
+            "id": f"call_{uuid.uuid4().hex[:12]}",
+            "type": "function",
+            "function": {"name": tool["function"]["name"], "arguments": json.dumps(args, ensure_ascii=False)},
+        }],
+    }
+
+
+def usage_for(body: Dict[str, Any], message: Dict[str, Any]) -> Dict[str, int]:
+    """估算 usage，系统提示词与工具定义记为前缀缓存命中。"""
+    messages = body.get("messages", [])
+    prefix = [m for m in messages if m.get("role") == "system"] + [body.get("tools") or []]
+    prompt_tokens = _approx_tokens(messages) + _approx_tokens(body.get("tools") or [])
+    cache_hit_tokens = min(prompt_tokens, _approx_tokens(prefix))
+    completion_tokens = _approx_tokens(message)
+    return {
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "total_tokens": prompt_tokens + completion_tokens,
+        "prompt_cache_hit_tokens": cache_hit_tokens,
+        "prompt_cache_miss_tokens": prompt_tokens - cache_hit_tokens,
+    }
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """OpenAI chat-completions 协议的请求处理器，使用 HTTP/1.1 keep-alive。"""
+
+    protocol_version = "HTTP/1.1"
+    server: "StubHTTPServer"
+
+    def log_message(self, format: str, *args: Any) -> None:
+        # 不逐条打印访问日志
+        pass
+
+    def _read_json(self) -> Dict[str, Any]:
+        length = int(self.headers.get("Content-Length") or 0)
+        return json.loads(self.rfile.read(length) or b"{}")
+
+    def _send_json(self, status: int, payload: Any, headers: Optional[Dict[str, str]] = None) -> None:
+        data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _send_error(self, status: int, message: str, headers: Optional[Dict[str, str]] = None) -> None:
+        self._send_json(status, {"error": {"message": message, "type": "stub_error", "code": status}}, headers)
+
+    def do_GET(self) -> None:
+        state = self.server.state
+        if self.path.rstrip("/") in ("/_stats", "/v1/_stats"):
+            with state.lock:
+                self._send_json(200, {"stats": dict(state.stats), "settings": dict(state.settings)})
+        elif self.path.rstrip("/") in ("/models", "/v1/models"):
+            self._send_json(200, {"object": "list", "data": [{"id": "deepseek-chat", "object": "model"}]})
+        else:
+            self._send_error(404, f"未知路径: {self.path}")
+
+    def do_POST(self) -> None:
+        state = self.server.state
+        path = self.path.rstrip("/")
+        try:
+            body = self._read_json()
+        except json.JSONDecodeError as e:
+            self._send_error(400, f"请求体不是合法的 JSON: {e}")
+            return
+        if path in ("/_control", "/v1/_control"):
+            try:
+                self._send_json(200, {"settings": state.update(body)})
+            except ValueError as e:
+                self._send_error(400, str(e))
+            return
+        if path not in ("/chat/completions", "/v1/chat/completions"):
+            self._send_error(404, f"未知路径: {self.path}")
+            return
+
+        state.count("requests")
+        settings, roll, latency = state.draw()
+        if latency > 0:
+            time.sleep(latency)
+        rate_429, rate_5xx, rate_hang = settings["rate_429"], settings["rate_5xx"], settings["rate_hang"]
+        if roll < rate_429:
+            state.count("429")
+            self._send_error(429, "Rate limit reached (stub)", {"Retry-After": str(settings["retry_after"])})
+            return
+        if roll < rate_429 + rate_5xx:
+            status = state.choice((500, 502, 503))
+            state.count(str(status))
+            self._send_error(status, "Internal server error (stub)")
+            return
+        if roll < rate_429 + rate_5xx + rate_hang:
+            state.count("hang")
+            time.sleep(settings["hang_seconds"])
+            self._send_error(504, "Gateway timeout (stub)")
+            return
+
+        message = completion_message(body, state, settings)
+        usage = usage_for(body, message)
+        completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+        model = body.get("model", "deepseek-chat")
+        finish_reason = "tool_calls" if message.get("tool_calls") else "stop"
+        state.count("ok")
+        if body.get("stream"):
+            self._stream(completion_id, model, message, usage, finish_reason, body, settings)
+            return
+        self._send_json(200, {
+            "id": completion_id,
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{"index": 0, "message": message, "finish_reason": finish_reason, "logprobs": None}],
+            "usage": usage,
+        })
+
+    def _write_chunk(self, payload: str) -> None:
+        data = f"data: {payload}\n\n".encode("utf-8")
+        self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+        self.wfile.flush()
+
+    def _stream(self, completion_id: str, model: str, message: Dict[str, Any], usage: Dict[str, int],
+                finish_reason: str, body: Dict[str, Any], settings: Dict[str, Any]) -> None:
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        def chunk(delta: Dict[str, Any], finish: Optional[str] = None, **extra: Any) -> str:
+            return json.dumps({
+                "id": completion_id, "object": "chat.completion.chunk", "created": int(time.time()), "model": model,
+                "choices": [{"index": 0, "delta": delta, "finish_reason": finish}], **extra,
+            }, ensure_ascii=False)
+
+        self._write_chunk(chunk({"role": "assistant", "content": ""}))
+        content = message.get("content") or ""
+        size = max(1, int(settings["stream_chunk_chars"]))
+        for start in range(0, len(content), size):
+            if settings["stream_chunk_delay"] > 0:
+                time.sleep(settings["stream_chunk_delay"])
+            self._write_chunk(chunk({"content": content[start:start + size]}))
+        for index, tool_call in enumerate(message.get("tool_calls") or []):
+            self._write_chunk(chunk({"tool_calls": [{"index": index, **tool_call}]}))
+        self._write_chunk(chunk({}, finish_reason))
+        if (body.get("stream_options") or {}).get("include_usage"):
+            self._write_chunk(json.dumps({
+                "id": completion_id, "object": "chat.completion.chunk", "created": int(time.time()),
+                "model": model, "choices": [], "usage": usage,
+            }))
+        self._write_chunk("[DONE]")
+        self.wfile.write(b"0\r\n\r\n")
+        self.wfile.flush()
+
+
+class StubHTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address: Tuple[str, int], state: StubState):
+        super().__init__(address, StubHandler)
+        self.state = state
+
+
+class StubLLMServer:
+    """在后台线程中运行的桩服务，便于在测试或压测脚本中启动与停止。"""
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, settings: Optional[Dict[str, Any]] = None):
+        """
+        Args:
+            host: 监听地址。
+            port: 监听端口，0 表示随机选择空闲端口。
+            settings: 初始设置，见 DEFAULT_SETTINGS。
+        """
+        self.state = StubState(settings)
+        self.httpd = StubHTTPServer((host, port), self.state)
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "StubLLMServer":
+        self._thread = threading.Thread(target=self.httpd.serve_forever, name="stub-llm-server", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        if self._thread is not None:
+            self._thread.join()
+
+    def __enter__(self) -> "StubLLMServer":
+        return self.start()
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.stop()
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="本地 OpenAI 兼容 LLM 桩服务")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765, help="监听端口，0 表示随机选择")
+    parser.add_argument("--latency", type=float, default=0.0, help="延迟中位数（秒）")
+    parser.add_argument("--latency-sigma", type=float, default=0.0, help="对数正态延迟的 sigma，0 表示固定延迟")
+    parser.add_argument("--rate-429", type=float, default=0.0)
+    parser.add_argument("--rate-5xx", type=float, default=0.0)
+    parser.add_argument("--rate-hang", type=float, default=0.0)
+    parser.add_argument("--rate-malformed", type=float, default=0.0)
+    parser.add_argument("--retry-after", type=float, default=1.0)
+    parser.add_argument("--hang-seconds", type=float, default=600.0)
+    parser.add_argument("--stream-chunk-chars", type=int, default=8)
+    parser.add_argument("--stream-chunk-delay", type=float, default=0.0)
+    parser.add_argument("--tool-script", default="agent_chat_inference", help="依次调用的工具，以逗号分隔")
+    parser.add_argument("--seed", type=int, default=None)
+    return parser
+
+
+def main():
+    args = build_parser().parse_args()
+    settings = {key: getattr(args, key) for key in DEFAULT_SETTINGS if key != "tool_script"}
+    settings["tool_script"] = [name.strip() for name in args.tool_script.split(",") if name.strip()]
+    server = StubLLMServer(args.host, args.port, settings)
+    # 第一行输出监听地址，便于脚本在 --port 0 时读取
+    print(server.base_url, flush=True)
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.httpd.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,13 +1,103 @@
-from langchain_core.tools import tool
+import asyncio
+import json
+import time
+from contextlib import contextmanager
+from importlib import import_module
+from typing import Any, Dict, Iterator, Optional, Tuple
+
+from langchain_core.tools import StructuredTool
 from langchain_core.runnables import RunnableConfig
-# from src.mock.agent_api_inference import agent_api_inference, agent_api_health_check
-from examples.mcd_mcp_agent_test.target_agent_api.agent_api_inference import (
-    agent_api_inference,
-    agent_api_health_check,
-)
+from config import load_config
+from src.tools.target_stream import consume_stream, stream_limits
+from src.utils.cassette import Cassette, get_cassette, next_turn
 from src.utils.logger import logger
-@tool()
-def agent_chat_inference(query: str, config: RunnableConfig) -> str:
+from src.utils.metrics import get_metrics_collector
+
+# 待测智能体接口模块，需提供 agent_api_inference 与 agent_api_health_check；
+# 可选提供异步版本 aagent_api_inference 与 aagent_api_health_check，智能体异步执行时优先使用，
+# 未提供时在线程池中调用同步版本，不阻塞事件循环。
+# 还可选提供流式版本 aagent_api_stream（异步生成器，逐段产出回复），[agent] target_stream 开启时优先使用，
+# 见 src/tools/target_stream.py。
+# config.ini 的 [agent] target_api_module 不为空时以其为准
+# TARGET_API_MODULE = "src.mock.agent_api_inference"
+TARGET_API_MODULE = "examples.mcd_mcp_agent_test.target_agent_api.agent_api_inference"
+# agent_api_extras 中没有 session_id 时使用的会话
+DEFAULT_SESSION_ID = "test_default_session"
+# 健康检查在录制磁带中使用的查询名
+STATUS_QUERY = "<agent_chat_status>"
+
+
+def target_api():
+    """按需导入待测智能体接口模块：其依赖较重且导入时就需要连接配置，不应拖慢只运行其他阶段的进程。"""
+    module_name = load_config().get("agent", "target_api_module", fallback="").strip() or TARGET_API_MODULE
+    return import_module(module_name)
+
+
+def _extras(config: RunnableConfig) -> dict:
+    return config.get("configurable", {}).get("agent_api_extras", {}) or {}
+
+
+def _session_id(config: RunnableConfig) -> str:
+    """从 config 中的 agent_api_extras 读取 session_id，使并发评估的各个样本使用各自的会话。"""
+    return _extras(config).get("session_id", DEFAULT_SESSION_ID)
+
+
+def _replay(query: str, config: RunnableConfig) -> Tuple[Optional[Cassette], int, Optional[str]]:
+    """
+    录制 / 回放（见 src/utils/cassette.py）：分配本次调用的轮次，回放模式下查找录制的回复。
+    Returns:
+        (磁带, 轮次, 回放的回复)；未开启磁带或需要调用待测智能体时回复为 None。
+    """
+    cassette, turn = get_cassette(), next_turn()
+    if cassette is not None and cassette.mode == "replay":
+        return cassette, turn, cassette.lookup(query, _extras(config), turn)
+    return cassette, turn, None
+
+
+def _record(cassette: Optional[Cassette], query: str, config: RunnableConfig, turn: int, response: str) -> None:
+    if cassette is not None:
+        cassette.record(query, _extras(config), turn, response)
+
+
+async def _areplay(query: str, config: RunnableConfig) -> Tuple[Optional[Cassette], int, Optional[str]]:
+    """_replay 的异步版本：磁带的 SQLite 读写在线程池中执行，不阻塞其他会话。"""
+    cassette, turn = get_cassette(), next_turn()
+    if cassette is not None and cassette.mode == "replay":
+        return cassette, turn, await asyncio.to_thread(cassette.lookup, query, _extras(config), turn)
+    return cassette, turn, None
+
+
+async def _arecord(cassette: Optional[Cassette], query: str, config: RunnableConfig, turn: int, response: str) -> None:
+    if cassette is not None:
+        await asyncio.to_thread(cassette.record, query, _extras(config), turn, response)
+
+
+def failure_status(error: BaseException) -> str:
+    # httpx / requests 的超时异常不继承内置 TimeoutError，按类名识别
+    if isinstance(error, (TimeoutError, asyncio.TimeoutError)) or "Timeout" in type(error).__name__:
+        return "timeout"
+    return "error"
+
+
+@contextmanager
+def _timed(name: str) -> Iterator[Dict[str, Any]]:
+    """
+    计时一次待测智能体调用，记为 kind 为 target 的调用指标；超时记为 timeout，其他异常记为 error。
+    回放的调用不计时。产出的字典中的字段（例如流式调用的首字延迟）会并入记录。
+    """
+    fields: Dict[str, Any] = {}
+    start = time.perf_counter()
+    try:
+        yield fields
+    except Exception as e:
+        get_metrics_collector().record(
+            "target", name, time.perf_counter() - start, failure_status(e), error=type(e).__name__
+        )
+        raise
+    get_metrics_collector().record("target", name, time.perf_counter() - start, **fields)
+
+
+def _inference(query: str, config: RunnableConfig) -> str:
     """
     向待测试的智能体发送查询并返回响应。
     Args:
@@ -16,24 +106,81 @@ def agent_chat_inference(query: str, config: RunnableConfig) -> str:
     Returns:
         str: 智能体的响应内容。
     """
-    # 从 config 中获取 agent_api_extras 参数
-    agent_api_extras = config.get("configurable", {}).get("agent_api_extras", {})
-    return agent_api_inference(query=query)
+    cassette, turn, response = _replay(query, config)
+    if response is None:
+        with _timed("agent_chat_inference"):
+            response = target_api().agent_api_inference(query=query, session_id=_session_id(config))
+        _record(cassette, query, config, turn, response)
+    return response
+
 
-@tool()
-def agent_chat_status() -> dict:
+async def _ainference(query: str, config: RunnableConfig) -> str:
+    cassette, turn, response = await _areplay(query, config)
+    if response is not None:
+        return response
+    target = target_api()
+    session_id = _session_id(config)
+    with _timed("agent_chat_inference") as fields:
+        if hasattr(target, "aagent_api_stream") and load_config().getboolean("agent", "target_stream", fallback=False):
+            response = await _astream(target, query, session_id, fields)
+        elif hasattr(target, "aagent_api_inference"):
+            response = await target.aagent_api_inference(query=query, session_id=session_id)
+        else:
+            logger.debug(f"{target.__name__} 未提供 aagent_api_inference，在线程池中调用同步接口")
+            response = await asyncio.to_thread(target.agent_api_inference, query=query, session_id=session_id)
+    await _arecord(cassette, query, config, turn, response)
+    return response
+
+
+async def _astream(target, query: str, session_id: str, fields: Dict[str, Any]) -> str:
+    """流式调用待测智能体，首字延迟与字间延迟写入 fields，超过 [agent] 中的回复上限时提前中止。"""
+    max_chars, max_seconds = stream_limits()
+    response, stats = await consume_stream(
+        target.aagent_api_stream(query=query, session_id=session_id), max_chars, max_seconds
+    )
+    fields.update(stats)
+    if stats["truncated"]:
+        logger.info(f"待测智能体回复已提前中止（{stats['truncated']}，{stats['chars']} 字符）: {query[:80]}")
+    return response
+
+
+def _status(config: RunnableConfig) -> dict:
     """
     获取待测试智能体的当前状态信息。
     Returns:
         str: 智能体的状态描述。
     """
-    status = agent_api_health_check()
+    cassette, turn, response = _replay(STATUS_QUERY, config)
+    if response is not None:
+        return json.loads(response)
+    with _timed("agent_chat_status"):
+        status = target_api().agent_api_health_check()
+    _record(cassette, STATUS_QUERY, config, turn, json.dumps(status, ensure_ascii=False))
+    return status
 
+
+async def _astatus(config: RunnableConfig) -> dict:
+    cassette, turn, response = await _areplay(STATUS_QUERY, config)
+    if response is not None:
+        return json.loads(response)
+    target = target_api()
+    with _timed("agent_chat_status"):
+        if hasattr(target, "aagent_api_health_check"):
+            status = await target.aagent_api_health_check()
+        else:
+            status = await asyncio.to_thread(target.agent_api_health_check)
+    await _arecord(cassette, STATUS_QUERY, config, turn, json.dumps(status, ensure_ascii=False))
     return status
 
+
+agent_chat_inference = StructuredTool.from_function(
+    func=_inference, coroutine=_ainference, name="agent_chat_inference"
+)
+agent_chat_status = StructuredTool.from_function(func=_status, coroutine=_astatus, name="agent_chat_status")
+
 if __name__ == "__main__":
     answer = agent_chat_inference.invoke({"query": "介绍一下你自己。"})
     print(f"智能体响应: {answer}")
 
     status = agent_chat_status.invoke({})
-    print(f"智能体状态: {status}")
\ No newline at end of file
+    print(f"智能体状态: {status}")
@@ -0,0 +1,307 @@
+"""
+进程内待测智能体适配器
+    待测智能体与评估框架运行在同一进程时（例如 examples/mcd_mcp_agent_test），直接在评估所在的事件循环中
+    await 它的异步入口，不再为每次查询 asyncio.run 一个新的事件循环，多个样本可以并发评估。
+    - InProcessTarget 把异步函数 (query, session_id) -> str 包装为待测智能体接口模块需要提供的函数，
+      另给出逐段产出回复的异步生成器时同时提供流式接口 aagent_api_stream（见 src/tools/target_stream.py）；
+    - stream_tokens 在后台任务中执行智能体调用，逐个产出其中 LLM 输出的 token，智能体的模型需经 streaming_chat_model 包装；
+      某一轮 LLM 输出以工具调用结束（或调用失败后重试）时产出 STREAM_RESET，使流式回复与非流式的最终消息一致；
+    - MCPToolCache 按事件循环缓存 MCP 会话与工具列表，超过 refresh_interval 后重新列出工具，会话断开时重新连接。
+      工具集变化时 version 加一，调用方把 version 放进智能体缓存的 key 中即可复用编译好的智能体图。
+"""
+import asyncio
+import json
+import time
+import weakref
+from contextvars import ContextVar
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.language_models import BaseChatModel
+from langchain_core.outputs import LLMResult
+from langchain_core.tools import BaseTool
+
+from config import load_config
+from src.tools.target_stream import STREAM_RESET
+from src.utils.logger import logger
+
+
+# 当前 stream_tokens 调用接收 token 的队列
+_token_queue: ContextVar[Optional["asyncio.Queue[Any]"]] = ContextVar("inprocess_token_queue", default=None)
+# 流结束标记
+_END = object()
+
+
+class _TokenStreamHandler(BaseCallbackHandler):
+    """
+    把流式 LLM 调用输出的 token 放入当前 stream_tokens 的队列，不在 stream_tokens 中时忽略。
+    一轮输出以工具调用结束或调用失败时放入 STREAM_RESET：这一轮的文本不属于最终回复。
+    """
+
+    run_inline = True
+
+    def on_llm_new_token(self, token: str, **kwargs: Any) -> None:
+        queue = _token_queue.get()
+        if queue is not None and token:
+            queue.put_nowait(token)
+
+    def on_llm_end(self, response: LLMResult, **kwargs: Any) -> None:
+        queue = _token_queue.get()
+        if queue is None:
+            return
+        for generations in response.generations:
+            for generation in generations:
+                if getattr(getattr(generation, "message", None), "tool_calls", None):
+                    queue.put_nowait(STREAM_RESET)
+                    return
+
+    def on_llm_error(self, error: BaseException, **kwargs: Any) -> None:
+        # 失败的调用可能已输出部分 token，重试时会重新输出
+        queue = _token_queue.get()
+        if queue is not None:
+            queue.put_nowait(STREAM_RESET)
+
+
+_token_stream_handler = _TokenStreamHandler()
+
+
+def streaming_chat_model(llm: BaseChatModel) -> BaseChatModel:
+    """
+    返回以流式请求调用、并把 token 交给 stream_tokens 的模型副本（共享原模型的 HTTP 客户端）。
+    Python 3.10 下 LangGraph 节点内的模型调用拿不到外层 RunnableConfig，无法通过 astream 的 messages 模式
+    获得 token，因此由模型自身的回调转发。
+    """
+    update: Dict[str, Any] = {"callbacks": [*(llm.callbacks or []), _token_stream_handler]}  # type: ignore[misc]
+    for field in ("streaming", "stream_usage"):
+        if field in type(llm).model_fields:
+            update[field] = True
+    return llm.model_copy(update=update)
+
+
+async def stream_tokens(run: Callable[[], Awaitable[Any]]) -> AsyncIterator[Any]:
+    """
+    在后台任务中执行 run()，逐个产出其中（经 streaming_chat_model 包装的）LLM 调用输出的 token。
+    调用工具之前输出的文本之后跟着 STREAM_RESET，consume_stream 据此丢弃，得到的回复与最终消息的内容一致。
+    提前关闭时取消该任务。
+    Args:
+        run: 执行一次智能体调用的异步函数。
+    Returns:
+        token（或 STREAM_RESET）的异步迭代器；run() 抛出的异常在迭代结束时抛出。
+    """
+    queue: "asyncio.Queue[Any]" = asyncio.Queue()
+    context_token = _token_queue.set(queue)
+    try:
+        task = asyncio.create_task(run())
+    finally:
+        _token_queue.reset(context_token)
+    task.add_done_callback(lambda _: queue.put_nowait(_END))
+    emitted = False
+    try:
+        while True:
+            item = await queue.get()
+            if item is _END:
+                break
+            if item is STREAM_RESET:
+                # 自上次重置以来没有产出文本时不必重置
+                if not emitted:
+                    continue
+                emitted = False
+            else:
+                emitted = True
+            yield item
+        task.result()
+    finally:
+        if not task.done():
+            task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
+
+class InProcessTarget:
+    """
+    进程内待测智能体。在接口模块中导出其方法即可作为 [agent] target_api_module 使用：
+        target = InProcessTarget(my_agent.answer)
+        agent_api_inference = target.agent_api_inference
+        aagent_api_inference = target.aagent_api_inference
+        agent_api_health_check = target.agent_api_health_check
+        aagent_api_health_check = target.aagent_api_health_check
+        aagent_api_stream = target.aagent_api_stream  # 可选，仅在提供 stream 时导出
+    """
+
+    def __init__(
+        self,
+        answer: Callable[[str, Optional[str]], Awaitable[str]],
+        health_check: Optional[Callable[[], Awaitable[dict]]] = None,
+        stream: Optional[Callable[[str, Optional[str]], AsyncIterator[str]]] = None,
+    ):
+        """
+        Args:
+            answer: 异步函数，接收查询与 session_id，返回待测智能体的回复。
+            health_check: 异步健康检查函数，默认始终返回正常。
+            stream: 异步生成器函数，接收查询与 session_id，逐段产出回复；未提供时流式接口一次产出完整回复。
+        """
+        self.answer = answer
+        self.health_check = health_check
+        self.stream = stream
+
+    async def aagent_api_inference(self, query: str, session_id: Optional[str] = None) -> str:
+        return await self.answer(query, session_id)
+
+    async def aagent_api_stream(self, query: str, session_id: Optional[str] = None) -> AsyncIterator[str]:
+        if self.stream is None:
+            yield await self.answer(query, session_id)
+            return
+        chunks = self.stream(query, session_id)
+        try:
+            async for chunk in chunks:
+                yield chunk
+        finally:
+            # 提前中止时在同一任务中关闭内层生成器
+            await chunks.aclose()  # type: ignore[attr-defined]
+
+    async def aagent_api_health_check(self) -> dict:
+        if self.health_check is None:
+            return {"status": 200, "message": "智能体正常"}
+        return await self.health_check()
+
+    def agent_api_inference(self, query: str, session_id: Optional[str] = None) -> str:
+        """同步入口，供脚本调试或线程池中调用；不能在运行中的事件循环里调用。"""
+        return asyncio.run(self.aagent_api_inference(query, session_id))
+
+    def agent_api_health_check(self) -> dict:
+        return asyncio.run(self.aagent_api_health_check())
+
+
+class _LoopState:
+    """某个事件循环内的 MCP 会话与工具列表。"""
+
+    def __init__(self):
+        self.lock = asyncio.Lock()
+        # 服务名 → (会话, 持有会话的任务, 关闭信号)
+        self.sessions: Dict[str, Tuple[Any, asyncio.Task, asyncio.Event]] = {}
+        self.tools: Optional[List[BaseTool]] = None
+        self.signature: Optional[Tuple] = None
+        self.version = 0
+        self.fetched_at = 0.0
+
+
+class MCPToolCache:
+    """
+    MultiServerMCPClient 的工具列表与会话缓存。
+    client.get_tools() 每次都会新建会话列出工具，得到的工具每次调用也会再新建会话；这里为每个服务保持一个
+    长连接会话（由后台任务持有，会话的进入与退出发生在同一任务中），工具调用复用该会话。
+    """
+
+    def __init__(self, client: Any, refresh_interval: Optional[float] = None):
+        """
+        Args:
+            client: langchain_mcp_adapters 的 MultiServerMCPClient。
+            refresh_interval: 工具列表的缓存时长（秒），默认读取 config.ini 的 [agent] mcp_refresh_interval。
+        """
+        self.client = client
+        if refresh_interval is None:
+            refresh_interval = load_config().getfloat("agent", "mcp_refresh_interval", fallback=300.0)
+        self.refresh_interval = refresh_interval
+        self._states: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, _LoopState]" = weakref.WeakKeyDictionary()
+
+    def _state(self) -> _LoopState:
+        loop = asyncio.get_running_loop()
+        state = self._states.get(loop)
+        if state is None:
+            state = self._states[loop] = _LoopState()
+        return state
+
+    def _fresh(self, state: _LoopState) -> bool:
+        """工具列表未过期，且持有会话的任务都还在运行（会话断开后缓存的工具指向已关闭的会话，需立即重新连接）。"""
+        return (
+            state.tools is not None
+            and time.monotonic() - state.fetched_at < self.refresh_interval
+            and not any(task.done() for _, task, _ in state.sessions.values())
+        )
+
+    async def get_tools(self) -> Tuple[int, List[BaseTool]]:
+        """
+        获取当前事件循环内缓存的工具列表，过期或有会话断开时重新列出。
+        Returns:
+            (version, 工具列表)；工具集（名称、描述、参数或会话）不变时 version 与工具对象都保持不变。
+        """
+        state = self._state()
+        if self._fresh(state):
+            return state.version, state.tools  # type: ignore[return-value]
+        async with state.lock:
+            if not self._fresh(state):
+                await self._refresh(state)
+        return state.version, state.tools  # type: ignore[return-value]
+
+    async def _refresh(self, state: _LoopState) -> None:
+        from langchain_mcp_adapters.tools import load_mcp_tools
+
+        tools: List[BaseTool] = []
+        sessions = []
+        for name in self.client.connections:
+            try:
+                session = await self._session(state, name)
+                server_tools = await load_mcp_tools(session, **self._load_kwargs(name))
+            except Exception as e:
+                # 会话已断开：关闭后重新连接一次
+                logger.warning(f"MCP 服务 {name} 列出工具失败，重新连接: {e}")
+                await self._close_session(state, name)
+                session = await self._session(state, name)
+                server_tools = await load_mcp_tools(session, **self._load_kwargs(name))
+            tools.extend(server_tools)
+            sessions.append(id(session))
+
+        signature = (
+            tuple(sessions),
+            tuple((tool.name, tool.description, json.dumps(tool.args, sort_keys=True, default=str)) for tool in tools),
+        )
+        if signature != state.signature:
+            state.tools, state.signature = tools, signature
+            state.version += 1
+            logger.info(f"MCP 工具列表已更新（version {state.version}）：{[tool.name for tool in tools]}")
+        state.fetched_at = time.monotonic()
+
+    def _load_kwargs(self, name: str) -> Dict[str, Any]:
+        return {
+            "callbacks": self.client.callbacks,
+            "server_name": name,
+            "tool_interceptors": self.client.tool_interceptors,
+            "tool_name_prefix": self.client.tool_name_prefix,
+        }
+
+    async def _session(self, state: _LoopState, name: str) -> Any:
+        entry = state.sessions.get(name)
+        if entry is not None and not entry[1].done():
+            return entry[0]
+        ready: "asyncio.Future[Any]" = asyncio.get_running_loop().create_future()
+        stop = asyncio.Event()
+        task = asyncio.create_task(self._hold(name, ready, stop), name=f"mcp-session-{name}")
+        session = await ready
+        state.sessions[name] = (session, task, stop)
+        return session
+
+    async def _hold(self, name: str, ready: "asyncio.Future[Any]", stop: asyncio.Event) -> None:
+        """在同一个任务中打开并持有会话，直到收到关闭信号或连接断开。"""
+        try:
+            async with self.client.session(name) as session:
+                ready.set_result(session)
+                await stop.wait()
+        except Exception as e:
+            if not ready.done():
+                ready.set_exception(e)
+            else:
+                logger.warning(f"MCP 服务 {name} 的会话已断开: {e}")
+
+    async def _close_session(self, state: _LoopState, name: str) -> None:
+        entry = state.sessions.pop(name, None)
+        if entry is None:
+            return
+        _, task, stop = entry
+        stop.set()
+        await asyncio.gather(task, return_exceptions=True)
+
+    async def aclose(self) -> None:
+        """关闭当前事件循环内的全部会话。"""
+        state = self._state()
+        for name in list(state.sessions):
+            await self._close_session(state, name)
+        state.tools, state.signature = None, None
@@ -0,0 +1,42 @@
+"""
+待测智能体接口的 HTTP 客户端
+    HTTP 形式的待测智能体接口模块（例如 src/mock/agent_api_inference.py）共用的 keep-alive 连接池与超时配置，
+    读取自 config.ini 的 [agent] target_* 配置项。与 LLM 客户端的连接池（src/agents/cache.py）分开，
+    待测智能体响应慢时不会占满 LLM 请求的连接。httpx.AsyncClient 绑定事件循环，因此按事件循环分别创建。
+"""
+import asyncio
+import threading
+import weakref
+from typing import Tuple
+
+import httpx
+
+from config import load_config
+
+_lock = threading.Lock()
+_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, httpx.AsyncClient]" = weakref.WeakKeyDictionary()
+
+
+def target_timeouts() -> Tuple[float, float]:
+    """待测智能体接口的（连接超时, 读取超时）秒数，读取自 config.ini 的 [agent] 段。"""
+    config = load_config()
+    return (
+        config.getfloat("agent", "target_connect_timeout", fallback=10.0),
+        config.getfloat("agent", "target_read_timeout", fallback=600.0),
+    )
+
+
+def get_target_http_client() -> httpx.AsyncClient:
+    """获取当前事件循环内访问待测智能体接口共用的 httpx.AsyncClient（keep-alive 连接池），需在事件循环中调用。"""
+    loop = asyncio.get_running_loop()
+    with _lock:
+        client = _clients.get(loop)
+        if client is None:
+            config = load_config()
+            max_connections = config.getint("agent", "target_max_connections", fallback=100)
+            limits = httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections)
+            connect_timeout, read_timeout = target_timeouts()
+            client = _clients[loop] = httpx.AsyncClient(
+                limits=limits, timeout=httpx.Timeout(read_timeout, connect=connect_timeout)
+            )
+        return client
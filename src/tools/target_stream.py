@@ -0,0 +1,129 @@
+"""
+待测智能体的流式调用
+    待测智能体接口模块可选提供异步生成器 aagent_api_stream(query, session_id)，逐段产出回复文本
+    （HTTP 服务的 SSE / 分块响应，或进程内智能体的 token 流）。agent_chat_inference 优先以流式调用：
+    - 记录首字延迟（TTFT）与相邻两段之间的间隔（字间延迟），写入调用指标（kind 为 target）；
+    - 回复超过 [agent] target_max_response_chars 个字符或 target_max_response_seconds 秒时提前中止，
+      关闭流（HTTP 连接随之关闭），把已收到的部分加上截断说明返回给 evaluator；
+    - 流中产出 STREAM_RESET 时丢弃此前收到的文本（例如调用工具之前输出的文本），首字延迟从之后的第一段算起，
+      使流式回复与非流式调用返回的最终回复一致。
+"""
+import asyncio
+import time
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+from config import load_config
+from src.utils.metrics import percentile
+
+# 流结束标记
+_END = object()
+# 丢弃此前产出的文本，见 consume_stream
+STREAM_RESET = object()
+
+
+def stream_limits() -> Tuple[int, float]:
+    """读取 [agent] 中的回复大小与时长上限，0 表示不限制。"""
+    config = load_config()
+    return (
+        config.getint("agent", "target_max_response_chars", fallback=0),
+        config.getfloat("agent", "target_max_response_seconds", fallback=0.0),
+    )
+
+
+def truncation_note(reason: str, max_chars: int, max_seconds: float) -> str:
+    if reason == "chars":
+        return f"\n[回复超过 {max_chars} 个字符，已截断]"
+    return f"\n[回复超过 {max_seconds:g} 秒，已截断]"
+
+
+async def _pump(chunks: AsyncIterator[str], queue: "asyncio.Queue[Any]") -> None:
+    """在单独的任务中迭代流，使流的每一步都在同一上下文中执行，中止时取消该任务即可。"""
+    try:
+        async for chunk in chunks:
+            queue.put_nowait((time.perf_counter(), chunk))
+    except Exception as e:
+        queue.put_nowait(e)
+    finally:
+        aclose = getattr(chunks, "aclose", None)
+        if aclose is not None:
+            await aclose()
+    queue.put_nowait(_END)
+
+
+async def consume_stream(
+    chunks: AsyncIterator[str], max_chars: int = 0, max_seconds: float = 0.0
+) -> Tuple[str, Dict[str, Any]]:
+    """
+    读取流式回复并计时。
+    Args:
+        chunks: 逐段产出回复文本的异步迭代器，产出 STREAM_RESET 时丢弃此前收到的文本与计时。
+        max_chars: 回复的最大字符数，超过时中止，0 表示不限制。
+        max_seconds: 从开始调用算起的最长时长（秒），超过时中止，0 表示不限制。
+    Returns:
+        (回复文本, 指标)；指标包含 ttft、inter_token_p50、inter_token_max、chunks、chars 与 truncated
+        （未截断为 None，否则为 chars / seconds），回复被截断时文本末尾带有截断说明。
+    Raises:
+        流本身抛出的异常。
+    """
+    start = time.perf_counter()
+    queue: "asyncio.Queue[Any]" = asyncio.Queue()
+    pump = asyncio.create_task(_pump(chunks, queue))
+    parts: List[str] = []
+    gaps: List[float] = []
+    ttft: Optional[float] = None
+    last = start
+    size = 0
+    truncated: Optional[str] = None
+    try:
+        while True:
+            timeout = None
+            if max_seconds:
+                timeout = max_seconds - (time.perf_counter() - start)
+                if timeout <= 0:
+                    truncated = "seconds"
+                    break
+            try:
+                item = await asyncio.wait_for(queue.get(), timeout)
+            except asyncio.TimeoutError:
+                truncated = "seconds"
+                break
+            if item is _END:
+                break
+            if isinstance(item, Exception):
+                raise item
+            received_at, chunk = item
+            if chunk is STREAM_RESET:
+                parts.clear()
+                gaps.clear()
+                ttft, size = None, 0
+                continue
+            if not chunk:
+                continue
+            if ttft is None:
+                ttft = received_at - start
+            else:
+                gaps.append(received_at - last)
+            last = received_at
+            if max_chars and size + len(chunk) > max_chars:
+                parts.append(chunk[:max_chars - size])
+                size = max_chars
+                truncated = "chars"
+                break
+            parts.append(chunk)
+            size += len(chunk)
+    finally:
+        if not pump.done():
+            pump.cancel()
+        await asyncio.gather(pump, return_exceptions=True)
+
+    text = "".join(parts)
+    if truncated is not None:
+        text += truncation_note(truncated, max_chars, max_seconds)
+    return text, {
+        "ttft": ttft,
+        "inter_token_p50": percentile(gaps, 50),
+        "inter_token_max": max(gaps) if gaps else None,
+        "chunks": len(gaps) + (ttft is not None),
+        "chars": size,
+        "truncated": truncated,
+    }
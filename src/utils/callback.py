@@ -1,10 +1,25 @@
+"""
+智能体追踪回调模块
+    回调中只把结构化事件放入有界队列，由后台线程写入 loguru，事件循环中不做控制台 I/O。
+    事件按级别过滤，较大的内容按 [log] trace_max_chars 截断；队列满时丢弃事件并计数，不阻塞调用方。
+"""
 import ast
+import atexit
+import queue
+import threading
 from typing import Any, Dict, List, Optional
+from uuid import UUID
 
 from langchain_core.callbacks import BaseCallbackHandler
 from langchain_core.agents import AgentAction, AgentFinish
 from langchain_core.outputs import LLMResult
 
+from config import load_config
+from src.utils.logger import logger
+
+# 事件级别，数值与 loguru 一致
+_LEVELS = {"TRACE": 5, "DEBUG": 10, "INFO": 20, "SUCCESS": 25, "WARNING": 30, "ERROR": 40}
+
 
 def clean_log_of_ids(log_string: str) -> str:
     """
@@ -30,16 +45,130 @@ def clean_log_of_ids(log_string: str) -> str:
         return log_string
 
 
-class SyncCallbackHandler(BaseCallbackHandler):
-    """同步回调处理器"""
+def truncate(text: str, max_chars: int) -> str:
+    """截断过长的内容，max_chars 为 0 时不截断。"""
+    if max_chars <= 0 or len(text) <= max_chars:
+        return text
+    return f"{text[:max_chars]}...（共 {len(text)} 字符，已截断）"
+
+
+class TraceWriter:
+    """有界事件队列与后台写入线程，进程内共享一个实例。"""
+
+    def __init__(self, maxsize: int = 10000):
+        self._queue: "queue.Queue[Optional[Dict[str, Any]]]" = queue.Queue(maxsize=maxsize)
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self.dropped = 0
+
+    def put(self, event: Dict[str, Any]) -> None:
+        """放入一个事件，队列已满时丢弃。"""
+        self._ensure_started()
+        try:
+            self._queue.put_nowait(event)
+        except queue.Full:
+            with self._lock:
+                self.dropped += 1
+
+    def _ensure_started(self) -> None:
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="trace-writer", daemon=True)
+                self._thread.start()
+                atexit.register(self.close)
+
+    def _run(self) -> None:
+        while True:
+            event = self._queue.get()
+            try:
+                if event is None:
+                    return
+                level = event.pop("level")
+                message = event.pop("message")
+                logger.bind(trace=True, **event).log(level, message)
+            except Exception as e:
+                logger.error(f"追踪事件写入失败: {e}")
+            finally:
+                self._queue.task_done()
+
+    def flush(self) -> None:
+        """等待队列中已有的事件全部写出。"""
+        if self._thread is not None:
+            self._queue.join()
+
+    def close(self, timeout: float = 5.0) -> None:
+        """写出剩余事件并停止后台线程。"""
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is None:
+            return
+        self._queue.put(None)
+        thread.join(timeout)
+        if self.dropped:
+            logger.warning(f"追踪队列已满，共丢弃 {self.dropped} 条事件")
+
 
-    def __init__(self):
-        self.logs: List[str] = []
-        self.final_output: Optional[str] = None
+_trace_writer: Optional[TraceWriter] = None
+_trace_handler: Optional["TracingCallbackHandler"] = None
+_init_lock = threading.Lock()
 
-    def _log(self, text: str) -> None:
-        self.logs.append(text)
-        print(text)
+
+def get_trace_writer() -> TraceWriter:
+    """获取进程内共享的追踪写入器，队列容量由 [log] trace_queue_size 控制。"""
+    global _trace_writer
+    with _init_lock:
+        if _trace_writer is None:
+            _trace_writer = TraceWriter(load_config().getint("log", "trace_queue_size", fallback=10000))
+        return _trace_writer
+
+
+class TracingCallbackHandler(BaseCallbackHandler):
+    """
+    非阻塞的智能体追踪回调。
+    链的开始 / 结束与 LLM 开始为 DEBUG，LLM 输出、工具调用为 INFO，错误为 WARNING；
+    低于 level 的事件在回调中直接丢弃，quiet 模式下只保留 WARNING 及以上。
+    """
+
+    # 回调只做过滤与入队，直接在事件循环中执行，避免线程池调度开销
+    run_inline = True
+
+    def __init__(
+        self,
+        level: Optional[str] = None,
+        max_chars: Optional[int] = None,
+        quiet: Optional[bool] = None,
+        writer: Optional[TraceWriter] = None,
+    ):
+        """
+        Args:
+            level: 最低输出级别，默认读取 [log] trace_level。
+            max_chars: 单条内容的最大字符数，默认读取 [log] trace_max_chars，0 表示不截断。
+            quiet: 安静模式，默认读取 [log] trace_quiet。
+            writer: 事件写入器，默认使用进程内共享的实例。
+        """
+        config = load_config()
+        level = (level or config.get("log", "trace_level", fallback="INFO")).upper()
+        if quiet if quiet is not None else config.getboolean("log", "trace_quiet", fallback=False):
+            level = "WARNING"
+        self.level = level
+        self._min_level = _LEVELS.get(level, _LEVELS["INFO"])
+        self.max_chars = max_chars if max_chars is not None else config.getint("log", "trace_max_chars", fallback=500)
+        self.writer = writer or get_trace_writer()
+
+    def enabled(self, level: str) -> bool:
+        return _LEVELS[level] >= self._min_level
+
+    def _emit(self, level: str, message: str, run_id: Optional[UUID] = None, **fields: Any) -> None:
+        if not self.enabled(level):
+            return
+        self.writer.put({
+            "level": level,
+            "message": message,
+            "run_id": str(run_id) if run_id else None,
+            **fields,
+        })
 
     # ===== Chain =====
 
@@ -47,92 +176,122 @@ class SyncCallbackHandler(BaseCallbackHandler):
         self,
         serialized: Dict[str, Any],
         inputs: Dict[str, Any],
-        run_id: str,
-        parent_run_id: Optional[str] = None,
+        *,
+        run_id: UUID,
+        parent_run_id: Optional[UUID] = None,
         **kwargs: Any,
     ) -> None:
-        # 只在根 Runnable 打印一次
-        if parent_run_id is None:
-            user_input = inputs.get("input")
+        # 只记录根 Runnable
+        if parent_run_id is None and self.enabled("DEBUG"):
+            user_input = inputs.get("input") if isinstance(inputs, dict) else None
+            message = "🚀 开始处理"
             if isinstance(user_input, str):
-                self._log(f"\n🚀 **开始处理**: {user_input}")
+                message += f": {truncate(user_input, self.max_chars)}"
+            self._emit("DEBUG", message, run_id, event="chain_start")
 
     def on_chain_end(
         self,
         outputs: Dict[str, Any],
-        run_id: str,
-        parent_run_id: Optional[str] = None,
+        *,
+        run_id: UUID,
+        parent_run_id: Optional[UUID] = None,
         **kwargs: Any,
     ) -> None:
-        # 只在根 Runnable 打印一次
         if parent_run_id is None:
-            self._log("\n🏁 **处理完成**")
+            self._emit("DEBUG", "🏁 处理完成", run_id, event="chain_end")
+
+    def on_chain_error(
+        self,
+        error: BaseException,
+        *,
+        run_id: UUID,
+        parent_run_id: Optional[UUID] = None,
+        **kwargs: Any,
+    ) -> None:
+        if parent_run_id is None:
+            self._emit("WARNING", f"❌ 处理失败: {type(error).__name__}: {truncate(str(error), self.max_chars)}",
+                       run_id, event="chain_error")
 
     # ===== LLM =====
 
-    def on_llm_start(
+    def on_chat_model_start(
         self,
         serialized: Dict[str, Any],
-        prompts: List[str],
-        run_id: str,
-        parent_run_id: Optional[str] = None,
+        messages: List[List[Any]],
+        *,
+        run_id: UUID,
+        parent_run_id: Optional[UUID] = None,
         **kwargs: Any,
     ) -> None:
-        self._log("\n🤖 **LLM开始生成响应...**")
+        self._emit("DEBUG", "🤖 LLM开始生成响应", run_id, event="llm_start")
 
-    def on_llm_new_token(
+    def on_llm_start(
         self,
-        token: str,
-        run_id: str,
-        parent_run_id: Optional[str] = None,
+        serialized: Dict[str, Any],
+        prompts: List[str],
+        *,
+        run_id: UUID,
+        parent_run_id: Optional[UUID] = None,
         **kwargs: Any,
     ) -> None:
-        pass
+        self._emit("DEBUG", "🤖 LLM开始生成响应", run_id, event="llm_start")
 
     def on_llm_end(
         self,
         response: LLMResult,
-        run_id: str,
-        parent_run_id: Optional[str] = None,
+        *,
+        run_id: UUID,
+        parent_run_id: Optional[UUID] = None,
         **kwargs: Any,
     ) -> None:
+        if not self.enabled("INFO"):
+            return
+        need_content = ""
         for generation_list in response.generations:
-            need_content = ""
             for generation in generation_list:
                 # 优先从 generation.text 提取（标准 Generation 对象属性）
-                if hasattr(generation, 'text') and generation.text:
-                    # print(generation.text)
+                if getattr(generation, "text", None):
                     need_content = generation.text
                 # 兼容性写法：检查 message 属性
-                elif hasattr(generation, 'message'):  # type: ignore
-                    message = generation.message  # type: ignore
-                    if hasattr(message, 'content') and message.content:  # type: ignore
-                        need_content = str(message.content)  # type: ignore
-        self._log("\n✅ **LLM生成完成**" + need_content)
+                elif getattr(getattr(generation, "message", None), "content", None):
+                    need_content = str(generation.message.content)  # type: ignore
+        self._emit("INFO", f"✅ LLM生成完成: {truncate(need_content, self.max_chars)}", run_id, event="llm_end")
+
+    def on_llm_error(
+        self,
+        error: BaseException,
+        *,
+        run_id: UUID,
+        parent_run_id: Optional[UUID] = None,
+        **kwargs: Any,
+    ) -> None:
+        self._emit("WARNING", f"❌ LLM调用失败: {type(error).__name__}: {truncate(str(error), self.max_chars)}",
+                   run_id, event="llm_error")
 
     # ===== Agent =====
 
     def on_agent_action(
         self,
         action: AgentAction,
-        run_id: str,
-        parent_run_id: Optional[str] = None,
+        *,
+        run_id: UUID,
+        parent_run_id: Optional[UUID] = None,
         **kwargs: Any,
     ) -> None:
-        raw_string = action.log
-        final_log_string = clean_log_of_ids(raw_string)
-        self._log(f"\n🤔 **思考中**: {final_log_string}")
+        if self.enabled("INFO"):
+            log = truncate(clean_log_of_ids(action.log), self.max_chars)
+            self._emit("INFO", f"🤔 思考中: {log}", run_id, event="agent_action")
 
     def on_agent_finish(
         self,
         finish: AgentFinish,
-        run_id: str,
-        parent_run_id: Optional[str] = None,
+        *,
+        run_id: UUID,
+        parent_run_id: Optional[UUID] = None,
         **kwargs: Any,
     ) -> None:
-        output = finish.return_values.get("output", "")
-        self._log(f"\n🎉 **最终结果**: {output}")
-        self.final_output = output
+        output = str(finish.return_values.get("output", ""))
+        self._emit("INFO", f"🎉 最终结果: {truncate(output, self.max_chars)}", run_id, event="agent_finish")
 
     # ===== Tool =====
 
@@ -140,27 +299,55 @@ class SyncCallbackHandler(BaseCallbackHandler):
         self,
         serialized: Dict[str, Any],
         input_str: str,
-        run_id: str,
-        parent_run_id: Optional[str] = None,
+        *,
+        run_id: UUID,
+        parent_run_id: Optional[UUID] = None,
         **kwargs: Any,
     ) -> None:
-        tool_name = serialized.get("name", "未知工具")
-        final_input_str = clean_log_of_ids(input_str)
-        self._log(
-            f"\n🛠️ **开始调用工具**: `{tool_name}`\n📥 输入参数: `{final_input_str}`"
-        )
+        if self.enabled("INFO"):
+            tool_name = (serialized or {}).get("name", "未知工具")
+            final_input_str = truncate(clean_log_of_ids(input_str), self.max_chars)
+            self._emit("INFO", f"🛠️ 开始调用工具 `{tool_name}`，输入参数: {final_input_str}",
+                       run_id, event="tool_start", tool=tool_name)
 
     def on_tool_end(
         self,
-        output: str,
-        run_id: str,
-        parent_run_id: Optional[str] = None,
+        output: Any,
+        *,
+        run_id: UUID,
+        parent_run_id: Optional[UUID] = None,
         **kwargs: Any,
     ) -> None:
-        output_str = output.content if hasattr(output, 'content') else str(output)
-        self._log("\n✅ **工具执行完成**" + " 输出结果: " + output_str)
+        if self.enabled("INFO"):
+            output_str = output.content if hasattr(output, "content") else str(output)
+            self._emit("INFO", f"✅ 工具执行完成，输出结果: {truncate(str(output_str), self.max_chars)}",
+                       run_id, event="tool_end")
 
-    # ===== Utils =====
+    def on_tool_error(
+        self,
+        error: BaseException,
+        *,
+        run_id: UUID,
+        parent_run_id: Optional[UUID] = None,
+        **kwargs: Any,
+    ) -> None:
+        self._emit("WARNING", f"❌ 工具调用失败: {type(error).__name__}: {truncate(str(error), self.max_chars)}",
+                   run_id, event="tool_error")
 
-    def get_logs(self) -> str:
-        return "".join(self.logs)
\ No newline at end of file
+
+# 兼容旧名称
+SyncCallbackHandler = TracingCallbackHandler
+
+
+def get_trace_handler() -> TracingCallbackHandler:
+    """
+    获取进程内共享的追踪回调。
+    模型与智能体调用都挂载同一个实例，LangChain 会对同一回调去重，每个事件只记录一次。
+    """
+    global _trace_handler
+    if _trace_handler is None:
+        handler = TracingCallbackHandler()
+        with _init_lock:
+            if _trace_handler is None:
+                _trace_handler = handler
+    return _trace_handler
@@ -0,0 +1,174 @@
+"""
+待测智能体调用的录制与回放
+    修改 evaluator / analyst 的提示词后重新评估时，不必再次访问（可能每次查询要几分钟的）待测智能体：
+    - record：照常调用待测智能体，并把每次回复写入 SQLite 磁带文件；
+    - replay：直接从磁带返回回复，不访问待测智能体，未命中时按 [eval] cassette_on_miss 处理并计数。
+    磁带的键为 (查询, agent_api_extras, 轮次)，轮次是同一次智能体调用（一个样本的一次评估或一次 profile）中
+    第几次调用待测智能体，由 cassette_scope() 在 evaluator / profiler 的入口开启，因此重复的查询也能按顺序回放。
+    同一条模型回复中并行发出的多个待测智能体调用之间的轮次顺序不确定。
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Iterator, List, Optional
+
+from config import load_config
+from src.utils.logger import logger
+
+MODES = ("off", "record", "replay")
+
+# 当前智能体调用内的待测智能体调用次数；列表在工具运行的子上下文中共享
+_turns: ContextVar[Optional[List[int]]] = ContextVar("cassette_turns", default=None)
+
+
+class CassetteMiss(KeyError):
+    """回放模式下磁带中没有对应的录制。"""
+
+
+@contextmanager
+def cassette_scope() -> Iterator[None]:
+    """开启一次智能体调用的轮次计数。"""
+    token = _turns.set([0])
+    try:
+        yield
+    finally:
+        _turns.reset(token)
+
+
+def next_turn() -> int:
+    """返回当前调用的轮次并加一；不在 cassette_scope() 中时始终为 0。"""
+    turns = _turns.get()
+    if turns is None:
+        return 0
+    turn = turns[0]
+    turns[0] += 1
+    return turn
+
+
+class Cassette:
+    """SQLite 磁带文件，键为 (查询, agent_api_extras, 轮次) 的哈希。"""
+
+    def __init__(self, file_path: str, mode: str, on_miss: str = "error"):
+        """
+        Args:
+            file_path: 磁带文件路径。
+            mode: record 或 replay。
+            on_miss: 回放未命中时的处理方式，error 抛出 CassetteMiss，live 调用待测智能体并补录。
+        """
+        if mode not in ("record", "replay"):
+            raise ValueError(f"未知的磁带模式: {mode}，可选 {MODES}")
+        if on_miss not in ("error", "live"):
+            raise ValueError(f"未知的 cassette_on_miss: {on_miss}，可选 error / live")
+        self.file_path = file_path
+        self.mode = mode
+        self.on_miss = on_miss
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "recorded": 0}
+        output_dir = os.path.dirname(file_path)
+        if output_dir:
+            os.makedirs(output_dir, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "key TEXT PRIMARY KEY, query TEXT NOT NULL, extras TEXT NOT NULL, turn INTEGER NOT NULL, "
+                "response TEXT NOT NULL, recorded_at REAL NOT NULL)"
+            )
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        # 每次操作使用独立连接，工具可能在线程池中调用
+        conn = sqlite3.connect(self.file_path, timeout=60)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    @staticmethod
+    def key(query: str, extras: Dict[str, Any], turn: int) -> str:
+        payload = json.dumps([query, extras, turn], ensure_ascii=False, sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            self._stats[name] += 1
+
+    def lookup(self, query: str, extras: Dict[str, Any], turn: int) -> Optional[str]:
+        """
+        回放模式下查找录制的回复。
+        Returns:
+            录制的回复；未命中且 on_miss 为 live 时返回 None，调用方应调用待测智能体后 record()。
+        Raises:
+            CassetteMiss: 未命中且 on_miss 为 error。
+        """
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT response FROM responses WHERE key = ?", (self.key(query, extras, turn),)
+            ).fetchone()
+        if row is not None:
+            self._count("hits")
+            return row[0]
+        self._count("misses")
+        logger.warning(f"磁带未命中（第 {turn} 轮，extras={extras}）: {query[:80]}")
+        if self.on_miss == "error":
+            raise CassetteMiss(f"磁带 {self.file_path} 中没有第 {turn} 轮查询的录制: {query[:80]}")
+        return None
+
+    def record(self, query: str, extras: Dict[str, Any], turn: int, response: str) -> None:
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO responses (key, query, extras, turn, response, recorded_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (self.key(query, extras, turn), query, json.dumps(extras, ensure_ascii=False, sort_keys=True,
+                                                                  default=str), turn, response, time.time()),
+            )
+        self._count("recorded")
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats: Dict[str, Any] = dict(self._stats)
+        stats["mode"] = self.mode
+        return stats
+
+
+_cassette: Optional[Cassette] = None
+_configured = False
+_init_lock = threading.Lock()
+
+
+def _build(mode: str, file_path: Optional[str] = None) -> Optional[Cassette]:
+    if mode not in MODES:
+        raise ValueError(f"未知的磁带模式: {mode}，可选 {MODES}")
+    if mode == "off":
+        return None
+    config = load_config()
+    return Cassette(
+        file_path or config.get("eval", "cassette_file", fallback="./data/eval_results/target_cassette.sqlite"),
+        mode,
+        config.get("eval", "cassette_on_miss", fallback="error").strip(),
+    )
+
+
+def get_cassette() -> Optional[Cassette]:
+    """获取进程内的磁带，[eval] cassette_mode 为 off 时返回 None。首次调用时读取配置。"""
+    global _cassette, _configured
+    if not _configured:
+        with _init_lock:
+            if not _configured:
+                _cassette = _build(load_config().get("eval", "cassette_mode", fallback="off").strip() or "off")
+                _configured = True
+    return _cassette
+
+
+def set_cassette_mode(mode: str, file_path: Optional[str] = None) -> Optional[Cassette]:
+    """覆盖 config.ini 中的磁带模式（例如命令行参数），需在第一次调用待测智能体之前调用。"""
+    global _cassette, _configured
+    with _init_lock:
+        _cassette = _build(mode, file_path)
+        _configured = True
+        return _cassette
@@ -1,6 +1,8 @@
 from loguru import logger
 import os
 
+from config import load_config
+
 LOG_FORMAT = (
     "<green>{time:YYYY-MM-DD HH:mm:ss.SSS}</green> | "
     "<level>{level: <8}</level> | "
@@ -22,8 +24,11 @@ logger.add(
     format=LOG_FORMAT,
     level="INFO"
 )
-logger.add(
-    sink=lambda msg: print(msg, end=""),  # 同时输出到控制台
-    format=LOG_FORMAT,
-    level="INFO"
-)
\ No newline at end of file
+# 控制台输出可通过 [log] console 关闭，关闭后日志只写入文件
+if load_config().getboolean("log", "console", fallback=True):
+    logger.add(
+        sink=lambda msg: print(msg, end=""),  # 同时输出到控制台
+        format=LOG_FORMAT,
+        enqueue=True,
+        level=load_config().get("log", "console_level", fallback="INFO")
+    )
\ No newline at end of file
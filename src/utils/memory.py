@@ -1,14 +1,43 @@
 import os
 import json
-from langchain_core.messages import HumanMessage, AIMessage, BaseMessage
-from typing import List, Dict, Any
+import re
+from langchain_core.messages import HumanMessage, AIMessage, BaseMessage, ToolMessage
+from langchain_core.messages.utils import count_tokens_approximately
+from langchain.agents.middleware import AgentMiddleware, ModelRequest, ModelResponse
+from typing import Any, Awaitable, Callable, Dict, List, Optional
 import time
 from config import load_config
+from src.utils.logger import logger
+from src.utils.usage import openai_tool_schema
 
 _config = load_config()
 DEFAULT_MEMORY_DIR = _config["agent"]["memory_dir"]
 BACKUP_MEMORY_DIR = _config["agent"].get("backup_memory_dir")
 
+SUMMARY_HEADER = "[以下为已省略的早期对话摘要，完整内容不再提供]"
+
+# 中日韩文字与全角标点：按每字约 1 个 token 计
+_CJK = re.compile(r"[\u3000-\u303f\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uf900-\ufaff\uff00-\uffef]")
+
+
+def estimate_text_tokens(text: str) -> int:
+    """估算文本的 token 数：中日韩字符每字 1 个 token，其余按 4 字符 / token。"""
+    cjk = len(_CJK.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+def estimate_tokens(messages: List[BaseMessage]) -> int:
+    """
+    估算消息列表的 token 数。count_tokens_approximately 按 4 字符 / token 估算，对以中文为主的对话低估约 2 倍，
+    这里把其中的中日韩字符补足为每字 1 个 token。
+    """
+    cjk = 0
+    for msg in messages:
+        cjk += len(_CJK.findall(str(msg.content)))
+        if isinstance(msg, AIMessage) and msg.tool_calls:
+            cjk += len(_CJK.findall(json.dumps([call["args"] for call in msg.tool_calls], ensure_ascii=False)))
+    return count_tokens_approximately(messages) + cjk * 3 // 4
+
 
 class FileMemory:
     """
@@ -91,14 +120,142 @@ class FileMemory:
         except Exception as e:
             print(f"[Error] 无法保存 memory 文件 {self.file_path}: {e}")
 
-    def summary(self, history_list: list) -> str:
-        return ""
-    
-    # 截断历史记录，只保留最近的 N 次 OC 计算工具调用及其之后的对话
+    def summary(self, history_list: list, max_chars: int = 200) -> str:
+        """
+        将历史消息压缩为逐条要点：工具调用的名称与参数、工具结果与回复的开头部分。
+        Args:
+            history_list: 需要压缩的 BaseMessage 列表。
+            max_chars: 每条要点保留的最大字符数。
+        Returns:
+            摘要文本。
+        """
+        def clip(text: Any) -> str:
+            text = " ".join(str(text).split())
+            return text if len(text) <= max_chars else text[:max_chars] + "…"
+
+        lines: List[str] = []
+        for msg in history_list:
+            if isinstance(msg, AIMessage) and msg.tool_calls:
+                for tool_call in msg.tool_calls:
+                    lines.append(f"- 调用 {tool_call['name']}({clip(json.dumps(tool_call['args'], ensure_ascii=False))})")
+            elif isinstance(msg, ToolMessage):
+                lines.append(f"  - {msg.name or '工具'} 返回: {clip(msg.content)}")
+            elif isinstance(msg, BaseMessage) and msg.content:
+                lines.append(f"- {msg.type}: {clip(msg.content)}")
+        return "\n".join(lines)
+
+    # 截断历史记录，只保留最近的 N 次工具调用及其之后的对话
     def trim(self, history_list: list, max_oc_comp_count: int) -> list:
-        return []
+        """
+        Args:
+            history_list: BaseMessage 列表。
+            max_oc_comp_count: 保留的工具调用次数（发起调用的 AI 消息及其工具结果算一次）。
+        Returns:
+            从倒数第 max_oc_comp_count 次工具调用开始的消息；工具调用次数不足时返回全部消息。
+            截断点总在发起调用的 AI 消息处，不会拆开工具调用与其结果。
+        """
+        if max_oc_comp_count <= 0:
+            return []
+        count = 0
+        for index in range(len(history_list) - 1, -1, -1):
+            msg = history_list[index]
+            if isinstance(msg, AIMessage) and msg.tool_calls:
+                count += 1
+                if count == max_oc_comp_count:
+                    return history_list[index:]
+        return list(history_list)
 
     def clear(self) -> None:
         """删除对应的历史文件"""
         if os.path.exists(self.file_path):
-            os.remove(self.file_path)
\ No newline at end of file
+            os.remove(self.file_path)
+
+
+class MemoryCompactionMiddleware(AgentMiddleware):
+    """
+    对话记忆压缩：每次模型调用前估算上下文 token 数（中文按每字 1 个 token），超过模型窗口的 compact_threshold 比例时，
+    保留任务输入与最近 keep_tool_exchanges 次工具调用原文，更早的对话替换为 FileMemory.summary() 生成的摘要。
+    只改写发送给模型的消息，智能体状态中的完整对话不变；压缩不额外调用模型，每轮耗时不随对话长度增长。
+    """
+
+    def __init__(
+        self,
+        agent_type: str,
+        context_window: Optional[int] = None,
+        compact_threshold: Optional[float] = None,
+        keep_tool_exchanges: Optional[int] = None,
+        summary_max_tokens: Optional[int] = None,
+    ):
+        """
+        Args:
+            agent_type: 智能体类型，用于日志与 FileMemory。
+            其余参数为 None 时读取 config.ini 的 [memory] 段。
+        """
+        super().__init__()
+        config = load_config()
+        self.agent_type = agent_type
+        self.memory = FileMemory(agent_type=agent_type)
+        if context_window is None:
+            context_window = config.getint("memory", "context_window", fallback=65536)
+        if compact_threshold is None:
+            compact_threshold = config.getfloat("memory", "compact_threshold", fallback=0.6)
+        if keep_tool_exchanges is None:
+            keep_tool_exchanges = config.getint("memory", "keep_tool_exchanges", fallback=3)
+        if summary_max_tokens is None:
+            summary_max_tokens = config.getint("memory", "summary_max_tokens", fallback=1024)
+        self.context_window = context_window
+        self.compact_threshold = compact_threshold
+        self.keep_tool_exchanges = keep_tool_exchanges
+        self.summary_max_tokens = summary_max_tokens
+
+    def _summary_message(self, elided: List[BaseMessage]) -> HumanMessage:
+        lines = self.memory.summary(elided).splitlines()
+        # 摘要本身超出预算时优先丢弃最早的要点
+        while lines and estimate_tokens([HumanMessage("\n".join(lines))]) > self.summary_max_tokens:
+            lines.pop(0)
+        return HumanMessage(SUMMARY_HEADER + "\n" + "\n".join(lines))
+
+    def compact(self, messages: List[BaseMessage], budget: int, fixed_tokens: int = 0) -> List[BaseMessage]:
+        """
+        Args:
+            messages: 不含系统提示词的对话消息。
+            budget: 压缩后的 token 上限。
+            fixed_tokens: 系统提示词与工具定义等不可压缩部分的 token 数。
+        Returns:
+            压缩后的消息；无法继续压缩时尽量保留最近的工具调用。
+        """
+        # 第一条用户消息是测试任务本身，始终原样保留
+        head_length = next((i + 1 for i, msg in enumerate(messages) if isinstance(msg, HumanMessage)), 0)
+        head, body = messages[:head_length], messages[head_length:]
+        compacted = messages
+        for keep in range(self.keep_tool_exchanges, 0, -1):
+            recent = self.memory.trim(body, keep)
+            elided = body[:len(body) - len(recent)]
+            if not elided:
+                continue
+            compacted = head + [self._summary_message(elided)] + recent
+            if fixed_tokens + estimate_tokens(compacted) <= budget:
+                break
+        return compacted
+
+    async def awrap_model_call(
+        self,
+        request: ModelRequest,
+        handler: Callable[[ModelRequest], Awaitable[ModelResponse]],
+    ) -> ModelResponse:
+        budget = int(self.context_window * self.compact_threshold)
+        messages = list(request.messages)
+        fixed = [request.system_message] if request.system_message is not None else []
+        tools = [openai_tool_schema(tool) for tool in request.tools]
+        # 工具定义按与消息相同的规则估算（描述多为中文）
+        fixed_tokens = estimate_tokens(fixed) + estimate_text_tokens(json.dumps(tools, ensure_ascii=False, default=str))
+        total_tokens = fixed_tokens + estimate_tokens(messages)
+        if total_tokens <= budget:
+            return await handler(request)
+        compacted = self.compact(messages, budget, fixed_tokens)
+        if len(compacted) < len(messages):
+            logger.info(
+                f"{self.agent_type}: 上下文约 {total_tokens} tokens 超过阈值 {budget}，"
+                f"压缩为 {fixed_tokens + estimate_tokens(compacted)} tokens"
+            )
+        return await handler(request.override(messages=compacted))
@@ -0,0 +1,281 @@
+"""
+调用指标收集模块
+    通过 LangChain 回调记录每次 LLM 调用与工具调用的智能体类型、样本 ID、token 用量（含缓存命中）、耗时与失败重试，
+    按阶段汇总为总量与 p50 / p95 / p99 耗时，用于估算运行成本、定位热点。
+    每次（非回放的）待测智能体调用另记为 kind 为 target 的记录，status 为 ok / timeout / error，
+    流式调用（src/tools/target_stream.py）还包含首字延迟与字间延迟。
+"""
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Iterator, List, Optional, Sequence
+from uuid import UUID
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.messages import AIMessage
+from langchain_core.outputs import LLMResult
+
+from config import load_config
+from src.utils.usage import prompt_cache_usage
+
+# 当前正在处理的样本 ID，由编排器在执行单个样本（或一个包）时设置
+_current_sample_id: ContextVar[Optional[str]] = ContextVar("metrics_sample_id", default=None)
+# 当前调用的智能体类型。Python 3.10 下 LangGraph 节点内的模型调用拿不到外层 RunnableConfig，
+# LLM 回调只能通过模型自身的 callbacks 触发，此时从该变量读取智能体类型
+_current_agent_type: ContextVar[Optional[str]] = ContextVar("metrics_agent_type", default=None)
+
+
+@contextmanager
+def sample_scope(sample_id: Optional[str]) -> Iterator[None]:
+    """在该上下文内发起的 LLM / 工具调用都会记录为属于 sample_id。"""
+    token = _current_sample_id.set(sample_id)
+    try:
+        yield
+    finally:
+        _current_sample_id.reset(token)
+
+
+def current_sample_id() -> Optional[str]:
+    """当前上下文所属的样本 ID。"""
+    return _current_sample_id.get()
+
+
+def percentile(values: Sequence[float], q: float) -> Optional[float]:
+    """最近秩法计算分位数，q 取值 0~100。"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(1, min(len(ordered), int(-(-q * len(ordered) // 100))))
+    return ordered[rank - 1]
+
+
+def _latency_summary(values: List[float]) -> Dict[str, Any]:
+    return {
+        "wall_seconds": round(sum(values), 3),
+        "p50": _round(percentile(values, 50)),
+        "p95": _round(percentile(values, 95)),
+        "p99": _round(percentile(values, 99)),
+        "max": _round(max(values) if values else None),
+    }
+
+
+def _round(value: Optional[float]) -> Optional[float]:
+    return round(value, 3) if value is not None else None
+
+
+class MetricsCollector(BaseCallbackHandler):
+    """
+    进程内共享的指标回调。智能体类型取自 RunnableConfig 的 metadata["agent_type"]，样本 ID 取自 sample_scope()。
+    每条记录包含 kind（llm / tool）、name、agent_type、sample_id、token 用量、wall_seconds 与 status（ok / error），
+    LLM 调用失败后由限流器重试时，失败的那次记为一条 error 记录。
+    """
+
+    # 回调只做字典操作，直接在事件循环中执行，避免线程池调度开销
+    run_inline = True
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._running: Dict[UUID, Dict[str, Any]] = {}
+        self._records: List[Dict[str, Any]] = []
+
+    def _start(self, run_id: UUID, kind: str, name: str, metadata: Optional[Dict[str, Any]]) -> None:
+        with self._lock:
+            self._running[run_id] = {
+                "kind": kind,
+                "name": name,
+                "agent_type": (metadata or {}).get("agent_type") or _current_agent_type.get(),
+                "sample_id": _current_sample_id.get(),
+                "started_at": time.time(),
+                "_start": time.perf_counter(),
+            }
+
+    def _end(self, run_id: UUID, status: str, **fields: Any) -> None:
+        with self._lock:
+            record = self._running.pop(run_id, None)
+            if record is None:
+                return
+            record["wall_seconds"] = time.perf_counter() - record.pop("_start")
+            record["status"] = status
+            record.update(fields)
+            self._records.append(record)
+
+    # ===== LLM =====
+
+    def on_chat_model_start(self, serialized: Dict[str, Any], messages: List[List[Any]], *, run_id: UUID,
+                            metadata: Optional[Dict[str, Any]] = None, **kwargs: Any) -> None:
+        name = (metadata or {}).get("ls_model_name") or (serialized or {}).get("name") or "llm"
+        self._start(run_id, "llm", name, metadata)
+
+    def on_llm_start(self, serialized: Dict[str, Any], prompts: List[str], *, run_id: UUID,
+                     metadata: Optional[Dict[str, Any]] = None, **kwargs: Any) -> None:
+        self._start(run_id, "llm", (serialized or {}).get("name") or "llm", metadata)
+
+    def on_llm_end(self, response: LLMResult, *, run_id: UUID, **kwargs: Any) -> None:
+        usage = {"prompt_tokens": 0, "completion_tokens": 0, "cache_hit_tokens": 0, "cache_miss_tokens": 0}
+        for generation_list in response.generations:
+            for generation in generation_list:
+                message = getattr(generation, "message", None)
+                if isinstance(message, AIMessage):
+                    usage = prompt_cache_usage(message)
+                    break
+        self._end(run_id, "ok", **usage)
+
+    def on_llm_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> None:
+        self._end(run_id, "error", error=type(error).__name__)
+
+    # ===== Tool =====
+
+    def on_tool_start(self, serialized: Dict[str, Any], input_str: str, *, run_id: UUID,
+                      metadata: Optional[Dict[str, Any]] = None, **kwargs: Any) -> None:
+        self._start(run_id, "tool", (serialized or {}).get("name") or kwargs.get("name") or "tool", metadata)
+
+    def on_tool_end(self, output: Any, *, run_id: UUID, **kwargs: Any) -> None:
+        self._end(run_id, "ok")
+
+    def on_tool_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> None:
+        self._end(run_id, "error", error=type(error).__name__)
+
+    # ===== 待测智能体 =====
+
+    def record(self, kind: str, name: str, wall_seconds: float, status: str = "ok", **fields: Any) -> None:
+        """直接追加一条不经过回调的记录（例如待测智能体调用），智能体类型与样本 ID 取自当前上下文。"""
+        record = {
+            "kind": kind,
+            "name": name,
+            "agent_type": _current_agent_type.get(),
+            "sample_id": _current_sample_id.get(),
+            "started_at": time.time() - wall_seconds,
+            "wall_seconds": wall_seconds,
+            "status": status,
+            **fields,
+        }
+        with self._lock:
+            self._records.append(record)
+
+    # ===== 汇总 =====
+
+    def drain(self) -> List[Dict[str, Any]]:
+        """取出并清空已完成的记录。"""
+        with self._lock:
+            records, self._records = self._records, []
+        return records
+
+    def records(self, since: int = 0) -> List[Dict[str, Any]]:
+        """返回已完成的记录（不清空），since 为起始下标，配合 count() 只取某一时刻之后完成的记录。"""
+        with self._lock:
+            return self._records[since:]
+
+    def count(self) -> int:
+        with self._lock:
+            return len(self._records)
+
+    @staticmethod
+    def summarize(records: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        汇总一批记录。
+        Returns:
+            {"llm": {智能体类型: 统计}, "tool": {工具名: 统计}, "target": {工具名: 统计}, "totals": 总计}；
+            LLM 统计包含调用数、失败重试数、各类 token 与按 [llm] 单价估算的费用，耗时只统计成功的调用；
+            target 统计另含超时次数（errors 中包含超时）、首字延迟（ttft）与字间延迟的分位数以及被截断的次数。
+        """
+        prices = _prices()
+        summary: Dict[str, Any] = {"llm": {}, "tool": {}, "target": {}}
+        groups: Dict[tuple, List[Dict[str, Any]]] = {}
+        for record in records:
+            key = (record.get("agent_type") or "unknown") if record["kind"] == "llm" else record["name"]
+            groups.setdefault((record["kind"], key), []).append(record)
+
+        for (kind, key), group in sorted(groups.items()):
+            ok = [record for record in group if record["status"] == "ok"]
+            stats: Dict[str, Any] = {"calls": len(ok), "errors": len(group) - len(ok)}
+            if kind == "llm":
+                for field in ("prompt_tokens", "completion_tokens", "cache_hit_tokens", "cache_miss_tokens"):
+                    stats[field] = sum(record.get(field, 0) for record in ok)
+                stats["cost"] = round(_cost(stats, prices), 6)
+            stats.update(_latency_summary([record["wall_seconds"] for record in ok]))
+            if kind == "target":
+                stats["timeouts"] = sum(1 for record in group if record["status"] == "timeout")
+                stats["ttft"] = _latency_summary([record["ttft"] for record in ok if record.get("ttft") is not None])
+                gaps = [record["inter_token_p50"] for record in ok if record.get("inter_token_p50") is not None]
+                stats["inter_token_p50"] = _round(percentile(gaps, 50))
+                stats["inter_token_max"] = _round(
+                    max((record["inter_token_max"] for record in ok if record.get("inter_token_max") is not None),
+                        default=None)
+                )
+                stats["truncated"] = sum(1 for record in ok if record.get("truncated"))
+            summary[kind][key] = stats
+
+        llm_stats = summary["llm"].values()
+        summary["totals"] = {
+            # 打包调用的样本 ID 以逗号分隔
+            "samples": len({
+                sample_id for record in records if record.get("sample_id")
+                for sample_id in record["sample_id"].split(",")
+            }),
+            "llm_calls": sum(stats["calls"] for stats in llm_stats),
+            "llm_retries": sum(stats["errors"] for stats in llm_stats),
+            "tool_calls": sum(stats["calls"] for stats in summary["tool"].values()),
+            "target_calls": sum(stats["calls"] for stats in summary["target"].values()),
+            "prompt_tokens": sum(stats["prompt_tokens"] for stats in llm_stats),
+            "completion_tokens": sum(stats["completion_tokens"] for stats in llm_stats),
+            "cache_hit_tokens": sum(stats["cache_hit_tokens"] for stats in llm_stats),
+            "cost": round(sum(stats["cost"] for stats in llm_stats), 6),
+        }
+        return summary
+
+
+def _prices() -> Dict[str, float]:
+    config = load_config()
+    return {
+        "cache_hit": config.getfloat("llm", "price_cache_hit_per_mtok", fallback=0.0),
+        "cache_miss": config.getfloat("llm", "price_cache_miss_per_mtok", fallback=0.0),
+        "output": config.getfloat("llm", "price_output_per_mtok", fallback=0.0),
+    }
+
+
+def _cost(stats: Dict[str, Any], prices: Dict[str, float]) -> float:
+    return (
+        stats["cache_hit_tokens"] * prices["cache_hit"]
+        + stats["cache_miss_tokens"] * prices["cache_miss"]
+        + stats["completion_tokens"] * prices["output"]
+    ) / 1_000_000
+
+
+_metrics_collector = MetricsCollector()
+
+
+def get_metrics_collector() -> MetricsCollector:
+    """获取进程内共享的指标回调。"""
+    return _metrics_collector
+
+
+async def ainvoke_with_metrics(
+    graph: Any,
+    inputs: Dict[str, Any],
+    agent_type: str,
+    config: Optional[Dict[str, Any]] = None,
+    **runnable_config: Any,
+) -> Any:
+    """
+    调用智能体图并记录指标：追加指标回调，在 metadata 中标记智能体类型。
+    Args:
+        graph: 编译好的智能体。
+        inputs: 智能体输入。
+        agent_type: 智能体类型。
+        config: 调用方传入的配置，其中的 metadata（例如 sample_id）会被保留。
+        runnable_config: 其余 RunnableConfig 字段（callbacks、configurable、recursion_limit 等）。
+    Returns:
+        智能体的输出。
+    """
+    # 时间线模块依赖本模块的样本上下文，在此处导入以避免循环导入
+    from src.utils.timeline import timeline_callbacks
+
+    config = config or {}
+    callbacks = list(runnable_config.pop("callbacks", [])) + [get_metrics_collector()] + timeline_callbacks()
+    metadata = {**config.get("metadata", {}), "agent_type": agent_type}
+    token = _current_agent_type.set(agent_type)
+    try:
+        return await graph.ainvoke(inputs, config={**runnable_config, "callbacks": callbacks, "metadata": metadata})
+    finally:
+        _current_agent_type.reset(token)
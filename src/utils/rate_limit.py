@@ -0,0 +1,279 @@
+"""
+LLM 调用限流与重试模块
+    进程内所有智能体共享同一个限流器，同时限制每分钟请求数（RPM）与每分钟 token 数（TPM），
+    遇到 429 / 5xx / 连接错误时带抖动退避重试。重试耗尽或不可重试的错误照常抛出，
+    由编排器把该样本记为执行失败并继续其余样本（见 Coordinator._checkpointed），不会中断整批任务。
+"""
+import asyncio
+import random
+import threading
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from langchain.agents.middleware import AgentMiddleware, ModelRequest, ModelResponse
+from langchain_core.messages import AIMessage
+from langchain_core.messages.utils import count_tokens_approximately
+
+from config import load_config
+from src.utils.logger import logger
+from src.utils.timeline import record_wait, span
+
+# 可以安全重试的 HTTP 状态码
+RETRYABLE_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504}
+
+
+class TokenBucket:
+    """令牌桶：容量为每分钟配额，按秒匀速补充；允许透支，透支部分由后续请求等待偿还。"""
+
+    def __init__(self, per_minute: int):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.tokens = float(per_minute)
+        self.updated_at = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def reserve(self, amount: float, now: float) -> float:
+        """预留 amount 个令牌，返回需要等待的秒数（0 表示立即可用）。"""
+        self._refill(now)
+        # 单次请求超过桶容量时按容量计，避免永远无法满足
+        needed = min(amount, self.capacity)
+        if self.tokens >= needed:
+            self.tokens -= amount
+            return 0.0
+        return (needed - self.tokens) / self.rate
+
+    def adjust(self, delta: float) -> None:
+        """按实际用量修正预估值，delta 为正表示多扣。"""
+        self.tokens -= delta
+
+
+class RateLimiter:
+    """
+    进程级 RPM / TPM 限流器。
+    rpm、tpm 为 0 时不限制对应维度。收到 429 时所有调用方一起冷却，避免继续撞限。
+    """
+
+    def __init__(
+        self,
+        rpm: int = 0,
+        tpm: int = 0,
+        max_retries: int = 5,
+        backoff_base: float = 1.0,
+        backoff_max: float = 60.0,
+    ):
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self._requests = TokenBucket(rpm) if rpm > 0 else None
+        self._tokens = TokenBucket(tpm) if tpm > 0 else None
+        self._cooldown_until = 0.0
+        self._lock = threading.Lock()
+        self._stats: Dict[str, float] = {
+            "requests": 0,
+            "prompt_tokens_estimated": 0,
+            "tokens_used": 0,
+            "throttled": 0,
+            "wait_seconds": 0.0,
+            "retries": 0,
+            "rate_limited": 0,
+            "server_errors": 0,
+            "failures": 0,
+        }
+
+    async def acquire(self, estimated_tokens: int) -> float:
+        """
+        等待直到 RPM 与 TPM 都有余量，返回累计等待的秒数。
+        Args:
+            estimated_tokens: 本次请求预估消耗的 token 数。
+        """
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                delay = max(0.0, self._cooldown_until - now)
+                if delay == 0.0 and self._requests is not None:
+                    delay = self._requests.reserve(1, now)
+                if delay == 0.0 and self._tokens is not None:
+                    delay = self._tokens.reserve(estimated_tokens, now)
+                    if delay > 0.0 and self._requests is not None:
+                        # TPM 不足时归还已预留的请求配额
+                        self._requests.adjust(-1)
+                if delay == 0.0:
+                    self._stats["requests"] += 1
+                    self._stats["prompt_tokens_estimated"] += estimated_tokens
+                    self._stats["wait_seconds"] += waited
+                    if waited > 0:
+                        self._stats["throttled"] += 1
+                    return waited
+            await asyncio.sleep(delay)
+            waited += delay
+
+    def record_usage(self, estimated_tokens: int, actual_tokens: Optional[int]) -> None:
+        """用响应中的实际 token 用量修正 TPM 令牌桶。"""
+        with self._lock:
+            used = actual_tokens if actual_tokens is not None else estimated_tokens
+            self._stats["tokens_used"] += used
+            if self._tokens is not None and actual_tokens is not None:
+                self._tokens.adjust(actual_tokens - estimated_tokens)
+
+    def backoff_delay(self, attempt: int, retry_after: Optional[float] = None) -> float:
+        """计算第 attempt 次重试前的等待时间：优先遵循 Retry-After，否则指数退避加全抖动。"""
+        if retry_after is not None:
+            return min(self.backoff_max, retry_after) + random.uniform(0, self.backoff_base)
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    def record_retry(self, status_code: Optional[int], delay: float) -> None:
+        with self._lock:
+            self._stats["retries"] += 1
+            if status_code == 429:
+                self._stats["rate_limited"] += 1
+                # 429 说明已经超出服务端限额，所有调用方一起冷却
+                self._cooldown_until = max(self._cooldown_until, time.monotonic() + delay)
+            elif status_code is not None and status_code >= 500:
+                self._stats["server_errors"] += 1
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._stats["failures"] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        """返回限流统计，便于调整 rpm / tpm 配置。"""
+        with self._lock:
+            stats: Dict[str, Any] = dict(self._stats)
+            stats["wait_seconds"] = round(stats["wait_seconds"], 3)
+            stats["rpm_available"] = round(self._requests.tokens, 1) if self._requests else None
+            stats["tpm_available"] = round(self._tokens.tokens, 1) if self._tokens else None
+        return stats
+
+
+_rate_limiter: Optional[RateLimiter] = None
+_rate_limiter_lock = threading.Lock()
+
+
+def _build_rate_limiter(share: int) -> RateLimiter:
+    config = load_config()
+
+    def quota(option: str) -> int:
+        value = config.getint("llm", option, fallback=0)
+        return max(1, value // share) if value > 0 else 0
+
+    return RateLimiter(
+        rpm=quota("rpm"),
+        tpm=quota("tpm"),
+        max_retries=config.getint("llm", "max_retries", fallback=5),
+        backoff_base=config.getfloat("llm", "backoff_base", fallback=1.0),
+        backoff_max=config.getfloat("llm", "backoff_max", fallback=60.0),
+    )
+
+
+def get_rate_limiter() -> RateLimiter:
+    """获取进程内共享的限流器，配置读取自 config.ini 的 [llm] 段。"""
+    global _rate_limiter
+    with _rate_limiter_lock:
+        if _rate_limiter is None:
+            _rate_limiter = _build_rate_limiter(1)
+        return _rate_limiter
+
+
+def configure_rate_limiter(share: int = 1) -> RateLimiter:
+    """
+    重新创建进程内共享的限流器，rpm / tpm 取 [llm] 配置值的 1/share。
+    多个 worker 进程共用同一份配额时，每个进程在创建智能体之前调用，各进程的限额之和不超过配置值。
+    Args:
+        share: 共用配额的进程数。
+    Returns:
+        新的限流器。
+    """
+    global _rate_limiter
+    with _rate_limiter_lock:
+        _rate_limiter = _build_rate_limiter(max(1, share))
+        return _rate_limiter
+
+
+def _status_code(error: Exception) -> Optional[int]:
+    status_code = getattr(error, "status_code", None)
+    if status_code is None and getattr(error, "response", None) is not None:
+        status_code = getattr(error.response, "status_code", None)  # type: ignore[attr-defined]
+    return status_code
+
+
+def _retry_after(error: Exception) -> Optional[float]:
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+    try:
+        if headers.get("retry-after-ms") is not None:
+            return float(headers["retry-after-ms"]) / 1000
+        if headers.get("retry-after") is not None:
+            return float(headers["retry-after"])
+    except (TypeError, ValueError):
+        return None
+    return None
+
+
+def is_retryable(error: Exception) -> bool:
+    """判断异常是否为可重试的限流、服务端或网络错误。"""
+    status_code = _status_code(error)
+    if status_code is not None:
+        return status_code in RETRYABLE_STATUS_CODES
+    # openai.APIConnectionError / APITimeoutError 以及 httpx 的网络异常没有状态码
+    return isinstance(error, (ConnectionError, TimeoutError, asyncio.TimeoutError)) or any(
+        cls.__name__ in ("APIConnectionError", "APITimeoutError", "TransportError")
+        for cls in type(error).__mro__
+    )
+
+
+def _total_tokens(response: Any) -> Optional[int]:
+    messages = response.result if isinstance(response, ModelResponse) else [response]
+    for message in messages:
+        if isinstance(message, AIMessage) and message.usage_metadata:
+            return message.usage_metadata.get("total_tokens")
+    return None
+
+
+class RateLimitMiddleware(AgentMiddleware):
+    """
+    在每次模型调用前经过共享限流器，失败时按限流器配置退避重试。
+    模型调用本身是幂等的，重试不会影响待测智能体的会话状态（工具调用不经过此中间件）。
+    """
+
+    def __init__(self, limiter: Optional[RateLimiter] = None):
+        super().__init__()
+        self.limiter = limiter or get_rate_limiter()
+
+    async def awrap_model_call(
+        self,
+        request: ModelRequest,
+        handler: Callable[[ModelRequest], Awaitable[ModelResponse]],
+    ) -> ModelResponse:
+        messages = list(request.messages)
+        if request.system_message is not None:
+            messages.insert(0, request.system_message)
+        estimated_tokens = count_tokens_approximately(messages)
+
+        attempt = 0
+        while True:
+            record_wait("rate_limit_wait", await self.limiter.acquire(estimated_tokens))
+            try:
+                response = await handler(request)
+            except Exception as e:
+                if not is_retryable(e) or attempt >= self.limiter.max_retries:
+                    self.limiter.record_failure()
+                    raise
+                status_code = _status_code(e)
+                delay = self.limiter.backoff_delay(attempt, _retry_after(e))
+                self.limiter.record_retry(status_code, delay)
+                attempt += 1
+                logger.warning(
+                    f"LLM 调用失败（{type(e).__name__}, status={status_code}），"
+                    f"{delay:.1f}s 后第 {attempt} 次重试"
+                )
+                with span("retry_backoff", "wait", attempt=attempt):
+                    await asyncio.sleep(delay)
+                continue
+            self.limiter.record_usage(estimated_tokens, _total_tokens(response))
+            return response
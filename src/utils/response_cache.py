@@ -0,0 +1,320 @@
+"""
+LLM 响应缓存模块
+    重复运行同一测试集时，describer / analyst 等智能体会发出大量完全相同的请求。开启后，ResponseCacheMiddleware
+    以 (模型, 温度, 消息, 工具, 结构化输出格式, tool_choice) 为键把模型响应持久化到 SQLite 文件：
+    - 命中时直接返回缓存的响应，不经过限流器，也不计入 LLM 调用指标；
+    - 相同请求正在执行时，后到的请求等待第一个请求的结果，而不是重复调用（例如 test.json 中的重复样本）；
+    - 按总大小与存放时长淘汰，超出 max_mb 时先删除最久未使用的条目；
+    - 按智能体统计命中率，每个阶段结束时输出到日志。
+    默认关闭，由 config.ini 的 [llm] response_cache 控制。消息中由框架生成的 id 不参与计算键。
+    响应以 JSON 保存（消息经 messages_to_dict，结构化输出只还原为进程中已加载的 pydantic 模型），
+    缓存文件可以在多次运行间共享，读取外来或被改动的文件不会执行其中的代码。
+"""
+import asyncio
+import copy
+import hashlib
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Awaitable, Callable, Dict, Iterator, Optional, Tuple
+
+from langchain.agents.middleware import AgentMiddleware, ModelRequest, ModelResponse
+from langchain_core.messages import AIMessage, BaseMessage, messages_from_dict, messages_to_dict
+from pydantic import BaseModel
+
+from config import load_config
+from src.utils.logger import logger
+from src.utils.usage import openai_tool_schema
+
+# 每写入多少条检查一次是否需要淘汰
+_EVICT_EVERY = 100
+
+
+def _message_payload(message: BaseMessage) -> Dict[str, Any]:
+    payload: Dict[str, Any] = {"type": message.type, "content": message.content}
+    if isinstance(message, AIMessage) and message.tool_calls:
+        payload["tool_calls"] = [
+            {"name": call["name"], "args": call["args"], "id": call.get("id")} for call in message.tool_calls
+        ]
+    for field in ("tool_call_id", "name"):
+        value = getattr(message, field, None)
+        if value:
+            payload[field] = value
+    return payload
+
+
+def encode_response(response: ModelResponse) -> bytes:
+    """把模型响应编码为 JSON。结构化输出为 pydantic 模型时记录其类名，读取时按类名校验还原。"""
+    structured = response.structured_response
+    if isinstance(structured, BaseModel):
+        model = type(structured)
+        structured_payload = {
+            "model": f"{model.__module__}:{model.__qualname__}", "data": structured.model_dump(mode="json")
+        }
+    else:
+        structured_payload = {"data": structured}
+    payload = {"result": messages_to_dict(response.result), "structured_response": structured_payload}
+    return json.dumps(payload, ensure_ascii=False, default=str).encode("utf-8")
+
+
+def decode_response(value: bytes) -> ModelResponse:
+    """
+    从 JSON 还原模型响应。结构化输出的类只在已导入的模块中查找，不会因读取缓存而导入任何模块。
+    Raises:
+        ValueError: 内容不是 encode_response 的输出，或结构化输出的类不存在。
+    """
+    payload = json.loads(value)
+    structured = payload["structured_response"]
+    data = structured["data"]
+    if "model" in structured:
+        module_name, _, qualname = structured["model"].partition(":")
+        model: Any = sys.modules.get(module_name)
+        for part in qualname.split("."):
+            model = getattr(model, part, None)
+        if not (isinstance(model, type) and issubclass(model, BaseModel)):
+            raise ValueError(f"结构化输出的类型 {structured['model']} 不存在")
+        data = model.model_validate(data)
+    return ModelResponse(result=messages_from_dict(payload["result"]), structured_response=data)
+
+
+def _response_format_payload(response_format: Any) -> Any:
+    if response_format is None:
+        return None
+    schema = getattr(response_format, "schema", response_format)
+    if isinstance(schema, type) and hasattr(schema, "model_json_schema"):
+        schema = schema.model_json_schema()
+    return [type(response_format).__name__, schema]
+
+
+def request_key(request: ModelRequest) -> str:
+    """计算请求的缓存键。"""
+    model = request.model
+    messages = list(request.messages)
+    if request.system_message is not None:
+        messages.insert(0, request.system_message)
+    payload = {
+        "model": getattr(model, "model_name", None) or getattr(model, "model", None) or type(model).__name__,
+        "temperature": getattr(model, "temperature", None),
+        "messages": [_message_payload(message) for message in messages],
+        "tools": [openai_tool_schema(tool) for tool in request.tools],
+        "response_format": _response_format_payload(request.response_format),
+        "tool_choice": request.tool_choice,
+        "model_settings": request.model_settings,
+    }
+    encoded = json.dumps(payload, ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """SQLite 响应缓存，可在多个进程间共享同一文件。"""
+
+    def __init__(self, file_path: str, max_mb: float = 512.0, max_age_days: float = 30.0):
+        """
+        Args:
+            file_path: 缓存文件路径。
+            max_mb: 缓存总大小上限（MB），0 表示不限制。
+            max_age_days: 条目最长保留天数，0 表示不过期。
+        """
+        self.file_path = file_path
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self.max_age_seconds = max_age_days * 86400
+        self._lock = threading.Lock()
+        self._stats: Dict[str, Dict[str, int]] = {}
+        self._writes = 0
+        # (事件循环, 键) → 正在执行的请求
+        self._inflight: Dict[Tuple[int, str], "asyncio.Future[Optional[ModelResponse]]"] = {}
+        output_dir = os.path.dirname(file_path)
+        if output_dir:
+            os.makedirs(output_dir, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "key TEXT PRIMARY KEY, agent TEXT, value BLOB NOT NULL, size INTEGER NOT NULL, "
+                "created_at REAL NOT NULL, used_at REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS responses_used_at ON responses (used_at)")
+        self.evict()
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        # 每次操作使用独立连接，读写在线程池中执行
+        conn = sqlite3.connect(self.file_path, timeout=60)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def _count(self, agent: str, name: str) -> None:
+        with self._lock:
+            stats = self._stats.setdefault(agent, {"hits": 0, "misses": 0, "coalesced": 0, "stored": 0})
+            stats[name] += 1
+
+    def get(self, key: str) -> Optional[ModelResponse]:
+        now = time.time()
+        with self._connect() as conn:
+            row = conn.execute("SELECT value, created_at FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            if self.max_age_seconds and now - row[1] > self.max_age_seconds:
+                conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                return None
+            conn.execute("UPDATE responses SET used_at = ? WHERE key = ?", (now, key))
+        try:
+            return decode_response(row[0])
+        except Exception as e:
+            # 旧格式的条目、结构化输出的类已改名或删除等情况，视为未命中
+            logger.warning(f"LLM 响应缓存条目无法读取，已忽略: {e}")
+            return None
+
+    def put(self, key: str, agent: str, response: ModelResponse) -> None:
+        value = encode_response(response)
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO responses (key, agent, value, size, created_at, used_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (key, agent, value, len(value), now, now),
+            )
+        with self._lock:
+            self._writes += 1
+            evict = self._writes % _EVICT_EVERY == 0
+        if evict:
+            self.evict()
+
+    def evict(self) -> int:
+        """删除过期条目，总大小超出上限时按最久未使用的顺序删除，返回删除的条数。"""
+        removed = 0
+        with self._connect() as conn:
+            if self.max_age_seconds:
+                removed += conn.execute(
+                    "DELETE FROM responses WHERE created_at < ?", (time.time() - self.max_age_seconds,)
+                ).rowcount
+            if self.max_bytes:
+                total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+                if total > self.max_bytes:
+                    # 删到上限的 90%，避免每次写入都触发淘汰
+                    target = total - int(self.max_bytes * 0.9)
+                    freed = 0
+                    keys = []
+                    for key, size in conn.execute("SELECT key, size FROM responses ORDER BY used_at"):
+                        keys.append((key,))
+                        freed += size
+                        if freed >= target:
+                            break
+                    conn.executemany("DELETE FROM responses WHERE key = ?", keys)
+                    removed += len(keys)
+        if removed:
+            logger.info(f"LLM 响应缓存淘汰 {removed} 条")
+        return removed
+
+    async def fetch(
+        self, key: str, agent: str, compute: Callable[[], Awaitable[ModelResponse]]
+    ) -> ModelResponse:
+        """
+        返回缓存的响应；未命中时执行 compute 并写入缓存，相同键的并发请求只执行一次。
+        Args:
+            key: 请求的缓存键。
+            agent: 智能体名称，用于统计。
+            compute: 实际调用模型的函数。
+        Returns:
+            模型响应。
+        """
+        cached = await asyncio.to_thread(self.get, key)
+        if cached is not None:
+            self._count(agent, "hits")
+            return cached
+
+        inflight_key = (id(asyncio.get_running_loop()), key)
+        leader = self._inflight.get(inflight_key)
+        if leader is not None:
+            # 等待第一个请求；它失败时自己再调用一次
+            response = await asyncio.shield(leader)
+            if response is not None:
+                self._count(agent, "coalesced")
+                return copy.deepcopy(response)
+
+        future: "asyncio.Future[Optional[ModelResponse]]" = asyncio.get_running_loop().create_future()
+        self._inflight.setdefault(inflight_key, future)
+        self._count(agent, "misses")
+        response = None
+        try:
+            response = await compute()
+        finally:
+            if self._inflight.get(inflight_key) is future:
+                del self._inflight[inflight_key]
+            future.set_result(response)
+        try:
+            await asyncio.to_thread(self.put, key, agent, response)
+            self._count(agent, "stored")
+        except Exception as e:
+            logger.warning(f"LLM 响应缓存写入失败: {e}")
+        return response
+
+    def stats(self, agent: Optional[str] = None) -> Dict[str, Any]:
+        """
+        返回命中统计。
+        Args:
+            agent: 智能体名称，为 None 时返回所有智能体的统计。
+        Returns:
+            单个智能体的统计字典，或 智能体名称 → 统计字典。
+        """
+        with self._lock:
+            if agent is not None:
+                return self._summary(self._stats.get(agent, {"hits": 0, "misses": 0, "coalesced": 0, "stored": 0}))
+            return {name: self._summary(stats) for name, stats in self._stats.items()}
+
+    @staticmethod
+    def _summary(stats: Dict[str, int]) -> Dict[str, Any]:
+        summary: Dict[str, Any] = dict(stats)
+        total = stats["hits"] + stats["misses"] + stats["coalesced"]
+        summary["hit_rate"] = round((stats["hits"] + stats["coalesced"]) / total, 4) if total else None
+        return summary
+
+
+_response_cache: Optional[ResponseCache] = None
+_configured = False
+_init_lock = threading.Lock()
+
+
+def get_response_cache() -> Optional[ResponseCache]:
+    """获取进程内的响应缓存，[llm] response_cache 关闭时返回 None。首次调用时读取配置。"""
+    global _response_cache, _configured
+    if not _configured:
+        with _init_lock:
+            if not _configured:
+                config = load_config()
+                if config.getboolean("llm", "response_cache", fallback=False):
+                    _response_cache = ResponseCache(
+                        config.get("llm", "response_cache_file", fallback="./data/eval_results/llm_cache.sqlite"),
+                        config.getfloat("llm", "response_cache_max_mb", fallback=512.0),
+                        config.getfloat("llm", "response_cache_max_age_days", fallback=30.0),
+                    )
+                _configured = True
+    return _response_cache
+
+
+class ResponseCacheMiddleware(AgentMiddleware):
+    """
+    在限流之前查询响应缓存；放在记忆压缩之后，以压缩后的实际请求计算键。
+    缓存关闭时直接调用下一层。
+    """
+
+    def __init__(self, agent_name: str):
+        super().__init__()
+        self.agent_name = agent_name
+
+    async def awrap_model_call(
+        self,
+        request: ModelRequest,
+        handler: Callable[[ModelRequest], Awaitable[ModelResponse]],
+    ) -> ModelResponse:
+        cache = get_response_cache()
+        if cache is None:
+            return await handler(request)
+        return await cache.fetch(request_key(request), self.agent_name, lambda: handler(request))
@@ -0,0 +1,296 @@
+"""
+运行时间线模块
+    把编排器阶段、样本、智能体调用、LLM 调用、工具调用与限流等待记录为嵌套的时间区间（span），
+    父子关系取自 LangChain 的 run_id / parent_run_id，导出为 Chrome Trace Event JSON，可直接在 Perfetto
+    （https://ui.perfetto.dev）或 chrome://tracing 中打开，用于定位一次运行的耗时分布。
+    默认关闭：[eval] timeline_file 为空且未调用 enable_timeline() 时不挂载回调，span() 只多一次函数调用。
+"""
+import functools
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+from uuid import UUID
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.messages import AIMessage
+from langchain_core.outputs import LLMResult
+
+from config import load_config
+from src.utils.metrics import current_sample_id
+from src.utils.usage import prompt_cache_usage
+
+# 未归属任何样本的 span（阶段、profiler 等）所在的泳道
+COORDINATOR_LANE = 0
+
+
+class TimelineRecorder(BaseCallbackHandler):
+    """
+    记录 span 的回调。同一样本的 span 位于同一泳道（Chrome Trace 中的 tid），按时间区间嵌套显示；
+    LangChain 运行的泳道继承自父运行，没有父运行时取当前样本。
+    """
+
+    # 回调只做字典操作，直接在事件循环中执行
+    run_inline = True
+
+    def __init__(self, path: str):
+        """
+        Args:
+            path: 导出的 Chrome Trace JSON 文件路径。
+        """
+        self.path = path
+        self._lock = threading.Lock()
+        self._origin = time.perf_counter()
+        self._running: Dict[UUID, Dict[str, Any]] = {}
+        self._events: List[Dict[str, Any]] = []
+        self._lanes: Dict[Optional[str], int] = {None: COORDINATOR_LANE}
+
+    def now(self) -> float:
+        """相对记录开始时刻的微秒数。"""
+        return (time.perf_counter() - self._origin) * 1_000_000
+
+    def _lane(self, sample_id: Optional[str]) -> int:
+        with self._lock:
+            if sample_id not in self._lanes:
+                self._lanes[sample_id] = len(self._lanes)
+            return self._lanes[sample_id]
+
+    def add_span(self, name: str, cat: str, start: float, end: float, lane: Optional[int] = None, **args: Any) -> None:
+        """
+        记录一个已结束的 span。
+        Args:
+            name: span 名称。
+            cat: 类别（stage / sample / agent / chain / llm / tool / wait）。
+            start: 开始时刻，取自 now()。
+            end: 结束时刻，取自 now()。
+            lane: 泳道，默认取当前样本。
+            args: 附加信息，显示在 Perfetto 的详情面板中。
+        """
+        if lane is None:
+            lane = self._lane(current_sample_id())
+        event = {
+            "name": name, "cat": cat, "ph": "X", "pid": 1, "tid": lane,
+            "ts": round(start, 1), "dur": round(max(0.0, end - start), 1),
+            "args": {key: value for key, value in args.items() if value is not None},
+        }
+        with self._lock:
+            self._events.append(event)
+
+    # ===== LangChain 运行 =====
+
+    def _start(self, run_id: UUID, parent_run_id: Optional[UUID], name: str, cat: str, **args: Any) -> None:
+        with self._lock:
+            parent = self._running.get(parent_run_id) if parent_run_id else None
+        lane = parent["lane"] if parent else self._lane(current_sample_id())
+        record = {
+            "name": name, "cat": cat, "lane": lane, "start": self.now(),
+            "args": {"run_id": str(run_id), "parent_run_id": str(parent_run_id) if parent_run_id else None, **args},
+        }
+        with self._lock:
+            self._running[run_id] = record
+
+    def _end(self, run_id: UUID, **args: Any) -> None:
+        with self._lock:
+            record = self._running.pop(run_id, None)
+        if record is not None:
+            self.add_span(record["name"], record["cat"], record["start"], self.now(), record["lane"],
+                          **record["args"], **args)
+
+    def on_chain_start(self, serialized: Dict[str, Any], inputs: Dict[str, Any], *, run_id: UUID,
+                       parent_run_id: Optional[UUID] = None, metadata: Optional[Dict[str, Any]] = None,
+                       **kwargs: Any) -> None:
+        agent_type = (metadata or {}).get("agent_type")
+        if parent_run_id is None and agent_type:
+            self._start(run_id, parent_run_id, agent_type, "agent", sample_id=current_sample_id())
+        else:
+            name = kwargs.get("name") or (serialized or {}).get("name") or "chain"
+            self._start(run_id, parent_run_id, name, "chain")
+
+    def on_chain_end(self, outputs: Any, *, run_id: UUID, **kwargs: Any) -> None:
+        self._end(run_id)
+
+    def on_chain_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> None:
+        self._end(run_id, error=type(error).__name__)
+
+    def on_chat_model_start(self, serialized: Dict[str, Any], messages: List[List[Any]], *, run_id: UUID,
+                            parent_run_id: Optional[UUID] = None, metadata: Optional[Dict[str, Any]] = None,
+                            **kwargs: Any) -> None:
+        name = (metadata or {}).get("ls_model_name") or (serialized or {}).get("name") or "llm"
+        self._start(run_id, parent_run_id, name, "llm")
+
+    def on_llm_start(self, serialized: Dict[str, Any], prompts: List[str], *, run_id: UUID,
+                     parent_run_id: Optional[UUID] = None, **kwargs: Any) -> None:
+        self._start(run_id, parent_run_id, (serialized or {}).get("name") or "llm", "llm")
+
+    def on_llm_end(self, response: LLMResult, *, run_id: UUID, **kwargs: Any) -> None:
+        usage: Dict[str, int] = {}
+        for generation_list in response.generations:
+            for generation in generation_list:
+                message = getattr(generation, "message", None)
+                if isinstance(message, AIMessage):
+                    usage = prompt_cache_usage(message)
+                    break
+        self._end(run_id, **usage)
+
+    def on_llm_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> None:
+        self._end(run_id, error=type(error).__name__)
+
+    def on_tool_start(self, serialized: Dict[str, Any], input_str: str, *, run_id: UUID,
+                      parent_run_id: Optional[UUID] = None, **kwargs: Any) -> None:
+        name = (serialized or {}).get("name") or kwargs.get("name") or "tool"
+        self._start(run_id, parent_run_id, name, "tool")
+
+    def on_tool_end(self, output: Any, *, run_id: UUID, **kwargs: Any) -> None:
+        self._end(run_id)
+
+    def on_tool_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> None:
+        self._end(run_id, error=type(error).__name__)
+
+    # ===== 导出 =====
+
+    def trace_events(self) -> List[Dict[str, Any]]:
+        """
+        返回 Chrome Trace 事件列表，包含泳道名称元数据。
+        同一泳道内并发、部分重叠的 span（例如流水线模式下与样本并行的 profiler、并行的工具调用）无法嵌套显示，
+        导出时拆分到该泳道之后的子泳道，与样本各占一条泳道相同；LangChain 运行优先与父运行位于同一子泳道。
+        """
+        with self._lock:
+            events = [dict(event) for event in self._events]
+            lanes: List[Tuple[Optional[str], int]] = list(self._lanes.items())
+        events.sort(key=lambda event: (event["ts"], -event["dur"]))
+        sub_lanes = _split_overlapping(events, next_tid=len(lanes))
+
+        metadata = [{"name": "process_name", "ph": "M", "pid": 1, "args": {"name": "agenteval"}}]
+        for sample_id, lane in lanes:
+            label = "coordinator" if sample_id is None else f"sample {sample_id}"
+            for index, tid in enumerate([lane] + sub_lanes.get(lane, [])):
+                name = label if index == 0 else f"{label} #{index + 1}"
+                metadata.append({"name": "thread_name", "ph": "M", "pid": 1, "tid": tid, "args": {"name": name}})
+                metadata.append({
+                    "name": "thread_sort_index", "ph": "M", "pid": 1, "tid": tid,
+                    "args": {"sort_index": lane * 1000 + index},
+                })
+        return metadata + events
+
+    def save(self) -> str:
+        """把目前为止的全部 span 写入 path（覆盖），返回文件路径。"""
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"traceEvents": self.trace_events(), "displayTimeUnit": "ms"}, f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+        return self.path
+
+
+def _split_overlapping(events: List[Dict[str, Any]], next_tid: int) -> Dict[int, List[int]]:
+    """
+    把同一泳道内与已有 span 部分重叠的 span 移到子泳道，使每条泳道内的 span 只有嵌套、没有交叉。
+    Args:
+        events: 按 (ts, -dur) 排序的 span，原地修改其 tid（舍入误差导致子 span 略超出父 span 时截断 dur）。
+        next_tid: 第一个可用于子泳道的 tid。
+    Returns:
+        原泳道 → 新增子泳道 tid 列表。
+    """
+    # 每条（子）泳道上仍未结束的 span 的结束时刻，按嵌套顺序排列
+    open_spans: Dict[int, List[float]] = {}
+    sub_lanes: Dict[int, List[int]] = {}
+    run_lanes: Dict[str, int] = {}
+    for event in events:
+        lane = event["tid"]
+        candidates = [lane] + sub_lanes.get(lane, [])
+        parent_lane = run_lanes.get(event["args"].get("parent_run_id"))
+        if parent_lane in candidates:
+            candidates.remove(parent_lane)
+            candidates.insert(0, parent_lane)
+
+        start, end = event["ts"], event["ts"] + event["dur"]
+        for tid in candidates:
+            stack = open_spans.setdefault(tid, [])
+            while stack and stack[-1] <= start:
+                stack.pop()
+            if not stack or end <= stack[-1] + 1:
+                break
+        else:
+            tid = next_tid
+            next_tid += 1
+            sub_lanes.setdefault(lane, []).append(tid)
+            stack = open_spans.setdefault(tid, [])
+        if stack and end > stack[-1]:
+            event["dur"] = round(stack[-1] - start, 1)
+        stack.append(event["ts"] + event["dur"])
+        event["tid"] = tid
+        if event["args"].get("run_id"):
+            run_lanes[event["args"]["run_id"]] = tid
+    return sub_lanes
+
+
+_recorder: Optional[TimelineRecorder] = None
+_configured = False
+_init_lock = threading.Lock()
+
+
+def enable_timeline(path: str) -> TimelineRecorder:
+    """开启时间线记录，需在创建 LLM 客户端之前调用。"""
+    global _recorder, _configured
+    with _init_lock:
+        _recorder = TimelineRecorder(path)
+        _configured = True
+        return _recorder
+
+
+def get_timeline() -> Optional[TimelineRecorder]:
+    """获取进程内的时间线记录器，未开启时返回 None。首次调用时读取 [eval] timeline_file。"""
+    global _recorder, _configured
+    if not _configured:
+        with _init_lock:
+            if not _configured:
+                path = load_config().get("eval", "timeline_file", fallback="").strip()
+                _recorder = TimelineRecorder(path) if path else None
+                _configured = True
+    return _recorder
+
+
+def timeline_callbacks() -> List[BaseCallbackHandler]:
+    """开启时返回 [记录器]，否则返回空列表，便于直接拼接到 callbacks 中。"""
+    recorder = get_timeline()
+    return [recorder] if recorder is not None else []
+
+
+@contextmanager
+def span(name: str, cat: str, lane: Optional[int] = None, **args: Any) -> Iterator[None]:
+    """把上下文内的执行记录为一个 span；未开启时不做任何事。"""
+    recorder = get_timeline()
+    if recorder is None:
+        yield
+        return
+    start = recorder.now()
+    try:
+        yield
+    finally:
+        recorder.add_span(name, cat, start, recorder.now(), lane, **args)
+
+
+def record_wait(name: str, seconds: float) -> None:
+    """把刚刚结束的一段等待（限流、退避）记录为 span。"""
+    recorder = get_timeline()
+    if recorder is not None and seconds > 0:
+        end = recorder.now()
+        recorder.add_span(name, "wait", end - seconds * 1_000_000, end)
+
+
+def traced_stage(name: str) -> Callable:
+    """把编排器的某个阶段方法记录为 coordinator 泳道上的 span。"""
+
+    def decorator(func: Callable) -> Callable:
+        @functools.wraps(func)
+        async def wrapper(*args: Any, **kwargs: Any) -> Any:
+            with span(name, "stage", lane=COORDINATOR_LANE):
+                return await func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
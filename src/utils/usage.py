@@ -0,0 +1,168 @@
+"""
+LLM 用量统计模块
+    按智能体汇总每次模型调用的 token 用量、耗时与 DeepSeek 前缀缓存命中情况
+    （usage 中的 prompt_cache_hit_tokens / prompt_cache_miss_tokens），并检查由系统提示词与工具定义组成的
+    请求前缀在各次调用之间是否保持字节一致——前缀一旦变化，服务端缓存就无法命中。
+"""
+import hashlib
+import json
+import threading
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from langchain.agents.middleware import AgentMiddleware, ModelRequest, ModelResponse
+from langchain_core.messages import AIMessage
+from langchain_core.utils.function_calling import convert_to_openai_tool
+
+from src.utils.logger import logger
+
+_COUNTERS = (
+    "calls",
+    "prompt_tokens",
+    "completion_tokens",
+    "cache_hit_tokens",
+    "cache_miss_tokens",
+    "latency_seconds",
+    "prefix_changes",
+)
+
+
+def prompt_cache_usage(message: AIMessage) -> Dict[str, int]:
+    """
+    从模型响应中读取 token 用量。
+    优先使用 DeepSeek 原始 usage 中的 prompt_cache_hit_tokens / prompt_cache_miss_tokens，
+    其他 OpenAI 兼容服务退回到 usage_metadata 中的 cache_read。
+    """
+    token_usage = (message.response_metadata or {}).get("token_usage") or {}
+    usage_metadata = message.usage_metadata or {}
+    prompt_tokens = token_usage.get("prompt_tokens", usage_metadata.get("input_tokens", 0)) or 0
+    completion_tokens = token_usage.get("completion_tokens", usage_metadata.get("output_tokens", 0)) or 0
+    cache_hit_tokens = token_usage.get("prompt_cache_hit_tokens")
+    if cache_hit_tokens is None:
+        cache_hit_tokens = (usage_metadata.get("input_token_details") or {}).get("cache_read") or 0
+    cache_miss_tokens = token_usage.get("prompt_cache_miss_tokens")
+    if cache_miss_tokens is None:
+        cache_miss_tokens = max(0, prompt_tokens - cache_hit_tokens)
+    return {
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "cache_hit_tokens": cache_hit_tokens,
+        "cache_miss_tokens": cache_miss_tokens,
+    }
+
+
+# 工具对象 id → (工具, OpenAI 格式定义)。转换时会重新生成 pydantic 模型，每次模型调用都转换的开销比离线模型调用本身还大
+_tool_schemas: Dict[int, Tuple[Any, Dict[str, Any]]] = {}
+_TOOL_SCHEMA_CACHE_SIZE = 1024
+
+
+def openai_tool_schema(tool: Any) -> Dict[str, Any]:
+    """返回工具的 OpenAI 格式定义，按工具对象缓存。"""
+    if isinstance(tool, dict):
+        return tool
+    cached = _tool_schemas.get(id(tool))
+    if cached is None or cached[0] is not tool:
+        if len(_tool_schemas) >= _TOOL_SCHEMA_CACHE_SIZE:
+            _tool_schemas.clear()
+        cached = _tool_schemas[id(tool)] = (tool, convert_to_openai_tool(tool))
+    return cached[1]
+
+
+def prefix_fingerprint(request: ModelRequest) -> str:
+    """计算请求中稳定前缀（系统提示词 + 工具定义）的指纹。"""
+    system_prompt = request.system_message.content if request.system_message is not None else ""
+    tools = [openai_tool_schema(tool) for tool in request.tools]
+    payload = json.dumps([system_prompt, tools], ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class UsageTracker:
+    """进程内按智能体累计的 LLM 用量。"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats: Dict[str, Dict[str, float]] = {}
+        self._prefixes: Dict[str, str] = {}
+
+    def _agent_stats(self, agent: str) -> Dict[str, float]:
+        if agent not in self._stats:
+            self._stats[agent] = {counter: 0 for counter in _COUNTERS}
+        return self._stats[agent]
+
+    def check_prefix(self, agent: str, fingerprint: str) -> bool:
+        """记录本次请求的前缀指纹，返回 True 表示与该智能体上一次请求的前缀不同。"""
+        with self._lock:
+            previous = self._prefixes.get(agent)
+            self._prefixes[agent] = fingerprint
+            changed = previous is not None and previous != fingerprint
+            if changed:
+                self._agent_stats(agent)["prefix_changes"] += 1
+            return changed
+
+    def record(self, agent: str, usage: Dict[str, int], latency: float) -> None:
+        with self._lock:
+            stats = self._agent_stats(agent)
+            stats["calls"] += 1
+            stats["latency_seconds"] += latency
+            for key, value in usage.items():
+                stats[key] += value
+
+    def stats(self, agent: Optional[str] = None) -> Dict[str, Any]:
+        """
+        返回用量统计。
+        Args:
+            agent: 智能体名称，为 None 时返回所有智能体的统计。
+        Returns:
+            单个智能体的统计字典，或 智能体名称 → 统计字典。
+        """
+        with self._lock:
+            if agent is not None:
+                return self._summary(self._stats.get(agent, {counter: 0 for counter in _COUNTERS}))
+            return {name: self._summary(stats) for name, stats in self._stats.items()}
+
+    @staticmethod
+    def _summary(stats: Dict[str, float]) -> Dict[str, Any]:
+        summary: Dict[str, Any] = dict(stats)
+        cached_total = stats["cache_hit_tokens"] + stats["cache_miss_tokens"]
+        summary["cache_hit_rate"] = round(stats["cache_hit_tokens"] / cached_total, 4) if cached_total else None
+        summary["latency_seconds"] = round(stats["latency_seconds"], 3)
+        summary["avg_latency_seconds"] = round(stats["latency_seconds"] / stats["calls"], 3) if stats["calls"] else None
+        return summary
+
+    def reset(self) -> None:
+        with self._lock:
+            self._stats.clear()
+            self._prefixes.clear()
+
+
+_usage_tracker = UsageTracker()
+
+
+def get_usage_tracker() -> UsageTracker:
+    """获取进程内共享的用量统计。"""
+    return _usage_tracker
+
+
+class UsageMiddleware(AgentMiddleware):
+    """记录每次模型调用的用量与前缀缓存命中情况，前缀发生变化时输出警告。"""
+
+    def __init__(self, agent_name: str, tracker: Optional[UsageTracker] = None):
+        super().__init__()
+        self.agent_name = agent_name
+        self.tracker = tracker or get_usage_tracker()
+
+    async def awrap_model_call(
+        self,
+        request: ModelRequest,
+        handler: Callable[[ModelRequest], Awaitable[ModelResponse]],
+    ) -> ModelResponse:
+        if self.tracker.check_prefix(self.agent_name, prefix_fingerprint(request)):
+            logger.warning(f"{self.agent_name}: 系统提示词或工具定义与上一次调用不同，前缀缓存无法命中")
+        start = time.perf_counter()
+        response = await handler(request)
+        latency = time.perf_counter() - start
+        for message in response.result:
+            if isinstance(message, AIMessage):
+                self.tracker.record(self.agent_name, prompt_cache_usage(message), latency)
+                break
+        return response
@@ -0,0 +1,8 @@
+import os
+
+# config.ini 与数据文件按相对路径读取，测试从仓库根目录运行
+os.chdir(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# 测试不访问真实的 LLM，只需要能够构造 Configuration
+for name, value in (("DS_API_KEY", "sk-test"), ("DS_BASE_URL", "http://127.0.0.1:9"), ("DS_MODEL", "deepseek-chat")):
+    os.environ.setdefault(name, value)
@@ -0,0 +1,106 @@
+from src.eval.utils.analysis import (
+    failure_row,
+    get_csv_report,
+    parse_csv_report,
+    select_rerun_indices,
+    target_latency_by_sample,
+    target_latency_summary,
+)
+
+ROWS = [
+    {
+        "query": "调用工具生成 Fe-C 二元相图", "test_result": "通过", "score": 8, "reason": "完整, 准确",
+        "improvement_areas": [], "confidence": 0.9, "strengths": ["调用正确", "回复清晰"], "evaluation_time": "12.5",
+    },
+    {
+        "query": "计算等温截面", "test_result": "部分通过", "score": 6.5, "reason": "缺少坐标轴\n说明",
+        "improvement_areas": ["补充坐标轴"], "confidence": 1, "strengths": [], "evaluation_time": "",
+    },
+    {"query": "计算垂直截面", **failure_row("❌ 执行失败（evaluates）: RuntimeError: boom")},
+]
+
+
+def test_report_round_trip_preserves_values():
+    csv_report = get_csv_report(ROWS)
+    rows = parse_csv_report(csv_report)
+
+    assert [row["score"] for row in rows] == [8, 6.5, '']
+    assert isinstance(rows[0]["score"], int) and isinstance(rows[1]["confidence"], int)
+    assert rows[0]["strengths"] == ["调用正确", "回复清晰"] and rows[2]["improvement_areas"] == []
+    assert rows[1]["reason"] == "缺少坐标轴\n说明"
+    # rerun 把解析结果写回报告时，未重跑的行保持原样（"8" 不会变成 "8.0"）
+    assert get_csv_report(rows) == csv_report
+    assert ",8," in csv_report and "8.0" not in csv_report
+
+
+def test_parse_empty_report():
+    assert parse_csv_report("") == []
+    assert parse_csv_report(get_csv_report([])) == []
+
+
+def test_select_rerun_indices():
+    rows = parse_csv_report(get_csv_report(ROWS))
+    table = [
+        # (test_results, min_confidence, 期望选中的行)
+        (("失败", "部分通过", "未知"), None, [1, 2]),
+        (("失败",), None, []),
+        (("失败",), 0.95, [0, 2]),  # 置信度缺失的行也会被选中
+        (("失败",), 0.5, [2]),
+        ((), 1.5, [0, 1, 2]),
+    ]
+    for test_results, min_confidence, expected in table:
+        assert select_rerun_indices(rows, test_results, min_confidence) == expected, (test_results, min_confidence)
+
+
+def _target(sample_id, wall_seconds, status="ok", ttft=None, name="agent_chat_inference"):
+    return {"kind": "target", "name": name, "sample_id": sample_id, "wall_seconds": wall_seconds, "status": status, "ttft": ttft}
+
+
+def test_target_latency_by_sample():
+    table = [
+        # (记录, 期望的每样本耗时列)
+        ([], {}),
+        (
+            [_target("s1", 1.2345, ttft=0.5)],
+            {"s1": {"target_calls": 1, "target_errors": 0, "target_timeouts": 0,
+                    "target_seconds": 1.234, "target_max_seconds": 1.234, "target_ttft": 0.5}},
+        ),
+        (
+            # 超时也计入失败次数；首字延迟只对有值的调用取平均
+            [_target("s1", 1.0, ttft=0.2), _target("s1", 30.0, status="timeout"),
+             _target("s1", 2.0, status="error"), _target("s1", 3.0, ttft=0.4)],
+            {"s1": {"target_calls": 4, "target_errors": 2, "target_timeouts": 1,
+                    "target_seconds": 36.0, "target_max_seconds": 30.0, "target_ttft": 0.3}},
+        ),
+        (
+            # 非流式调用没有首字延迟；回放、其他工具与不属于任何样本的记录不计入
+            [_target("s2", 0.5), _target("s2", 9.0, name="agent_chat_replay"), _target(None, 9.0),
+             {"kind": "tool", "name": "agent_chat_inference", "sample_id": "s2", "wall_seconds": 9.0, "status": "ok"}],
+            {"s2": {"target_calls": 1, "target_errors": 0, "target_timeouts": 0,
+                    "target_seconds": 0.5, "target_max_seconds": 0.5, "target_ttft": ''}},
+        ),
+    ]
+    for records, expected in table:
+        assert target_latency_by_sample(records) == expected
+
+
+def test_target_latency_summary():
+    assert target_latency_summary([]) is None
+    # 没有调用待测智能体的行（例如执行失败的样本）不计入
+    assert target_latency_summary([{"query": "q", "target_calls": '', "target_seconds": ''}]) is None
+
+    single = target_latency_summary([{"query": "q1", "target_calls": 2, "target_seconds": 3.5,
+                                      "target_errors": 1, "target_timeouts": 1}])
+    assert (single["samples"], single["calls"], single["errors"], single["timeouts"]) == (1, 2, 1, 1)
+    assert single["error_rate"] == 0.5 and single["p50"] == single["p99"] == single["max"] == 3.5
+
+    # 从 CSV 还原的行中各列为字符串
+    rows = [
+        {"query": f"q{index}", "target_calls": "1", "target_seconds": str(index), "target_errors": "0",
+         "target_timeouts": "0"}
+        for index in range(1, 11)
+    ] + [{"query": "failed", "target_calls": "0", "target_seconds": "0"}]
+    summary = target_latency_summary(rows, slowest=2)
+    assert (summary["samples"], summary["calls"], summary["errors"], summary["error_rate"]) == (10, 10, 0, 0.0)
+    assert (summary["p50"], summary["p90"], summary["max"]) == (5.0, 9.0, 10.0)
+    assert summary["slowest"] == [{"query": "q10", "target_seconds": 10.0}, {"query": "q9", "target_seconds": 9.0}]
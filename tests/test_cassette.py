@@ -0,0 +1,71 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+import src.tools.agent_inference as agent_inference
+from src.utils.cassette import Cassette, CassetteMiss, cassette_scope, next_turn, set_cassette_mode
+
+
+@pytest.fixture
+def target(monkeypatch):
+    calls = []
+
+    async def aagent_api_inference(query, session_id=None):
+        calls.append(query)
+        return f"第 {len(calls)} 次回复: {query}"
+
+    monkeypatch.setattr(
+        agent_inference, "target_api", lambda: SimpleNamespace(aagent_api_inference=aagent_api_inference)
+    )
+    yield calls
+    set_cassette_mode("off")
+
+
+def _config(session_id="s1"):
+    return {"configurable": {"agent_api_extras": {"session_id": session_id}}}
+
+
+async def _session(queries, session_id="s1"):
+    with cassette_scope():
+        return [await agent_inference._ainference(query, _config(session_id)) for query in queries]
+
+
+def test_next_turn_counts_within_scope():
+    assert next_turn() == 0 and next_turn() == 0
+    with cassette_scope():
+        assert [next_turn() for _ in range(3)] == [0, 1, 2]
+        with cassette_scope():
+            assert next_turn() == 0
+        assert next_turn() == 3
+
+
+def test_record_then_replay_repeated_queries_in_order(tmp_path, target):
+    file_path = str(tmp_path / "cassette.sqlite")
+    set_cassette_mode("record", file_path)
+    recorded = asyncio.run(_session(["你好", "你好"]))
+    assert recorded == ["第 1 次回复: 你好", "第 2 次回复: 你好"]
+
+    cassette = set_cassette_mode("replay", file_path)
+    assert asyncio.run(_session(["你好", "你好"])) == recorded
+    assert len(target) == 2
+    assert cassette.stats() == {"hits": 2, "misses": 0, "recorded": 0, "mode": "replay"}
+
+
+def test_replay_miss_raises_or_goes_live(tmp_path, target):
+    file_path = str(tmp_path / "cassette.sqlite")
+    set_cassette_mode("record", file_path)
+    asyncio.run(_session(["你好"]))
+
+    set_cassette_mode("replay", file_path)
+    # 不同的 extras（session_id）与超出录制的轮次都不会命中
+    with pytest.raises(CassetteMiss):
+        asyncio.run(_session(["你好"], session_id="s2"))
+    with pytest.raises(CassetteMiss):
+        asyncio.run(_session(["你好", "你好"]))
+
+    live = Cassette(file_path, "replay", on_miss="live")
+    assert live.lookup("新的查询", {"session_id": "s1"}, 0) is None
+    live.record("新的查询", {"session_id": "s1"}, 0, "补录的回复")
+    assert live.lookup("新的查询", {"session_id": "s1"}, 0) == "补录的回复"
+    assert live.stats() == {"hits": 1, "misses": 1, "recorded": 1, "mode": "replay"}
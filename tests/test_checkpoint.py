@@ -0,0 +1,68 @@
+import multiprocessing
+
+from src.eval.utils.checkpoint import CheckpointJournal, input_hash, sample_ids
+
+
+def test_sample_ids_are_content_hashes_with_duplicate_suffixes():
+    ids = sample_ids([{"query": "a"}, {"query": "b"}, {"query": "a"}, {"query": "a"}])
+    assert ids[2] == f"{ids[0]}-1" and ids[3] == f"{ids[0]}-2"
+    assert len(set(ids)) == 4
+    # 位置变化不影响 ID，键的顺序也不影响
+    assert sample_ids([{"query": "b"}])[0] == ids[1]
+    assert sample_ids([{"x": 1, "y": 2}]) == sample_ids([{"y": 2, "x": 1}])
+
+
+def test_input_hash_changes_with_any_part():
+    assert input_hash("describes", {"q": 1}, "模板") == input_hash("describes", {"q": 1}, "模板")
+    assert input_hash("describes", {"q": 1}, "模板") != input_hash("describes", {"q": 1}, "模板 v2")
+
+
+def test_append_after_torn_line_keeps_both_records(tmp_path):
+    journal = CheckpointJournal(str(tmp_path / "describes.jsonl"))
+    journal.append("s1", "结果 1", "h1")
+    journal.append("s2", {"reason": "结果 2"}, "h2")
+    # 模拟写入 s2 时进程崩溃：最后一行只写了一半
+    with open(journal.file_path, "rb+") as f:
+        content = f.read()
+        f.seek(0)
+        f.truncate()
+        f.write(content[:-10])
+
+    assert set(journal.load()) == {"s1"}
+    journal.append("s3", "结果 3", "h3")
+    records = journal.load()
+    assert records == {"s1": {"result": "结果 1", "hash": "h1"}, "s3": {"result": "结果 3", "hash": "h3"}}
+
+
+def test_load_skips_corrupted_lines_and_keeps_last_record(tmp_path):
+    journal = CheckpointJournal(str(tmp_path / "analyze.jsonl"))
+    journal.append("s1", "旧结果", "h1")
+    with open(journal.file_path, "a", encoding="utf-8") as f:
+        f.write('{"id": "s2"}\nnot json\n\n[1, 2]\n')
+    journal.append("s1", "新结果", "h2")
+    assert journal.load() == {"s1": {"result": "新结果", "hash": "h2"}}
+
+    journal.reset()
+    assert journal.load() == {}
+
+
+def _append_many(file_path: str, worker: int, count: int) -> None:
+    journal = CheckpointJournal(file_path)
+    for index in range(count):
+        journal.append(f"w{worker}-{index}", "结果" * 500, "h")
+
+
+def test_concurrent_appends_from_processes(tmp_path):
+    file_path = str(tmp_path / "evaluates.jsonl")
+    context = multiprocessing.get_context("spawn")
+    processes = [context.Process(target=_append_many, args=(file_path, worker, 50)) for worker in range(4)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+        assert process.exitcode == 0
+
+    records = CheckpointJournal(file_path).load()
+    assert len(records) == 200
+    with open(file_path, encoding="utf-8") as f:
+        assert sum(1 for _ in f) == 200
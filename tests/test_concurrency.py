@@ -0,0 +1,94 @@
+import asyncio
+
+import pytest
+
+from src.eval.utils.analysis import analyze_one, failure_row, failure_text, is_failure
+from src.eval.utils.concurrency import bounded_gather, session_affine_gather
+
+
+def test_bounded_gather_keeps_order_and_limits_concurrency():
+    active, peak = 0, 0
+
+    async def worker(item):
+        nonlocal active, peak
+        active += 1
+        peak = max(peak, active)
+        await asyncio.sleep(0.01 * (5 - item))
+        active -= 1
+        return item * 2
+
+    assert asyncio.run(bounded_gather(range(5), worker, max_concurrency=2)) == [0, 2, 4, 6, 8]
+    assert peak == 2
+
+
+def test_bounded_gather_return_exceptions_keeps_other_items():
+    async def worker(item):
+        if item == 1:
+            raise ValueError("boom")
+        return item
+
+    results = asyncio.run(bounded_gather(range(3), worker, max_concurrency=3, return_exceptions=True))
+    assert results[0] == 0 and results[2] == 2
+    assert isinstance(results[1], ValueError)
+
+    with pytest.raises(ValueError):
+        asyncio.run(bounded_gather(range(3), worker, max_concurrency=3))
+
+
+def test_session_affine_gather_serializes_each_session():
+    order = []
+
+    async def worker(item):
+        session, index = item
+        order.append(("start", item))
+        await asyncio.sleep(0.01)
+        order.append(("end", item))
+        return index
+
+    items = [("a", 0), ("b", 1), ("a", 2)]
+    results = asyncio.run(session_affine_gather(items, worker, lambda item: item[0], max_concurrency=2))
+    assert results == [0, 1, 2]
+    # 同一会话的第二个样本在第一个结束后才开始
+    assert order.index(("end", ("a", 0))) < order.index(("start", ("a", 2)))
+
+
+def test_failed_samples_propagate_without_calling_analyst():
+    text = failure_text("evaluates", TimeoutError("slow"))
+    assert is_failure(text)
+
+    class Analyst:
+        async def ainvoke(self, input_data):
+            raise AssertionError("不应调用 analyst")
+
+    row = asyncio.run(analyze_one(Analyst(), text))
+    assert row == failure_row(text)
+    assert row["test_result"] == "未知" and is_failure(row)
+    assert not is_failure({"reason": "正常"})
+
+
+def test_checkpointed_records_failure_and_continues(tmp_path):
+    from src.eval.coordinator import Coordinator
+    from src.eval.utils.checkpoint import CheckpointJournal
+    from src.eval.utils.data_loader import DataLoader
+
+    coordinator = Coordinator(DataLoader())
+    journal = CheckpointJournal(str(tmp_path / "analyze.jsonl"))
+
+    async def bad():
+        raise RuntimeError("boom")
+
+    async def good():
+        return {"test_result": "通过", "reason": "ok"}
+
+    async def run():
+        return await asyncio.gather(
+            coordinator._checkpointed(journal, {}, "s1", "h1", bad),
+            coordinator._checkpointed(journal, {}, "s2", "h2", good),
+        )
+
+    failed, ok = asyncio.run(run())
+    assert failed["test_result"] == "未知" and is_failure(failed)
+    assert ok == {"test_result": "通过", "reason": "ok"}
+    # 失败的样本不写入检查点，--resume 时重新执行
+    assert set(journal.load()) == {"s2"}
+    assert [(stage, sample_id) for stage, sample_id, _ in coordinator._failures] == [("analyze", "s1")]
@@ -0,0 +1,109 @@
+import asyncio
+import json
+
+import pytest
+
+import src.eval.coordinator as coordinator_module
+from src.eval.coordinator import Coordinator
+from src.eval.utils.data_loader import DataLoader
+
+SAMPLES = [{"query": f"问题 {index}", "result": f"期望 {index}"} for index in range(3)]
+
+
+@pytest.fixture
+def coordinator(tmp_path, monkeypatch):
+    """产物、检查点与指标都写到 tmp_path，三个阶段的 LLM 调用替换为记录调用的桩函数。"""
+    data_loader = DataLoader()
+    config = data_loader.config
+    config.set("test", "test_data_file", str(tmp_path / "test.json"))
+    config.set("agent_api_extras", "evaluator", str(tmp_path / "extras_evaluator.json"))
+    for option, name in (
+        ("describer_output_file", "described_test_samples.json"),
+        ("evaluator_output_file", "evaluation_results.json"),
+        ("analysis_report_file", "analysis_report.csv"),
+        ("metrics_summary_file", "metrics_summary.json"),
+        ("metrics_calls_file", "metrics_calls.jsonl"),
+        ("target_latency_file", "target_latency.json"),
+        ("checkpoint_dir", "checkpoints"),
+    ):
+        config.set("eval", option, str(tmp_path / name))
+    (tmp_path / "extras_evaluator.json").write_text(
+        json.dumps([{"session_id": f"s{index}"} for index in range(len(SAMPLES))]), encoding="utf-8"
+    )
+
+    coordinator = Coordinator(data_loader, max_concurrency=2)
+    coordinator.calls = []
+
+    async def describe_one(item):
+        coordinator.calls.append(("describes", item["query"]))
+        return f"描述: {item['query']}"
+
+    async def evaluate_one(item_tuple):
+        coordinator.calls.append(("evaluates", item_tuple[0]))
+        return f"评估: {item_tuple[0]}"
+
+    async def analyze_one(analyst, item):
+        coordinator.calls.append(("analyze", item))
+        return {"test_result": "通过", "score": 8, "reason": item, "confidence": 0.9}
+
+    monkeypatch.setattr(coordinator, "_describe_one", describe_one)
+    monkeypatch.setattr(coordinator, "_evaluate_one", evaluate_one)
+    monkeypatch.setattr(coordinator_module, "analyze_one", analyze_one)
+    return coordinator
+
+
+def _write_samples(tmp_path, samples):
+    (tmp_path / "test.json").write_text(json.dumps(samples, ensure_ascii=False), encoding="utf-8")
+
+
+def test_build_recomputes_only_changed_row(tmp_path, coordinator):
+    _write_samples(tmp_path, SAMPLES)
+    asyncio.run(coordinator.build())
+    assert len(coordinator.calls) == 9
+
+    # 没有变化时三个阶段全部复用
+    coordinator.calls.clear()
+    first_report = asyncio.run(coordinator.build())
+    assert coordinator.calls == []
+
+    # 只修改第二条样本：每个阶段只重新计算这一行
+    changed = [dict(sample) for sample in SAMPLES]
+    changed[1]["query"] = "修改后的问题"
+    _write_samples(tmp_path, changed)
+    coordinator.calls.clear()
+    report = asyncio.run(coordinator.build())
+    assert coordinator.calls == [
+        ("describes", "修改后的问题"),
+        ("evaluates", "描述: 修改后的问题"),
+        ("analyze", "评估: 描述: 修改后的问题"),
+    ]
+    assert report.splitlines()[1] == first_report.splitlines()[1]
+    assert "修改后的问题" in report.splitlines()[2]
+
+    hashes = json.loads((tmp_path / "analysis_report.csv.hashes.json").read_text(encoding="utf-8"))
+    assert [row["id"] for row in hashes] == [
+        row["id"] for row in json.loads((tmp_path / "described_test_samples.json.hashes.json").read_text(encoding="utf-8"))
+    ]
+
+
+def test_build_detects_stale_upstream_hash(tmp_path, coordinator):
+    _write_samples(tmp_path, SAMPLES)
+    asyncio.run(coordinator.build())
+
+    # 上游 evaluates 某一行的哈希变化（例如该行被单独重跑）时，下游 analyze 只重算这一行
+    sidecar = tmp_path / "evaluation_results.json.hashes.json"
+    hashes = json.loads(sidecar.read_text(encoding="utf-8"))
+    hashes[2]["hash"] = "stale"
+    sidecar.write_text(json.dumps(hashes), encoding="utf-8")
+    coordinator.calls.clear()
+    asyncio.run(coordinator.analyze(resume=True))
+    assert coordinator.calls == [("analyze", "评估: 描述: 问题 2")]
+
+
+def test_build_subcommand_has_no_resume_flag():
+    from main import build_parser
+
+    parser = build_parser()
+    assert parser.parse_args(["describes", "--resume"]).resume
+    with pytest.raises(SystemExit):
+        parser.parse_args(["build", "--resume"])
@@ -0,0 +1,50 @@
+import asyncio
+
+import pytest
+from langchain.agents import create_agent
+from langchain_deepseek import ChatDeepSeek
+
+from src.mock.llm_server import StubLLMServer
+from src.utils.rate_limit import RateLimiter, RateLimitMiddleware
+
+FAULTS = {"rate_429": 0.2, "rate_5xx": 0.2, "retry_after": 0.01, "tool_script": [], "seed": 7}
+
+
+@pytest.fixture
+def server():
+    with StubLLMServer(port=0, settings=FAULTS) as server:
+        yield server
+
+
+def _run(server, queries: int):
+    limiter = RateLimiter(max_retries=10, backoff_base=0.001, backoff_max=0.01)
+    model = ChatDeepSeek(model="deepseek-chat", api_key="sk-test", api_base=server.base_url, max_retries=0)
+    agent = create_agent(model=model, middleware=[RateLimitMiddleware(limiter)])
+
+    async def run():
+        return [
+            await agent.ainvoke({"messages": [{"role": "user", "content": f"问题 {index}"}]})
+            for index in range(queries)
+        ]
+
+    return asyncio.run(run()), limiter.stats()
+
+
+def test_injected_faults_are_retried_by_middleware(server):
+    responses, stats = _run(server, 5)
+
+    assert all(response["messages"][-1].content.startswith("桩服务回复") for response in responses)
+    server_stats = dict(server.state.stats)
+    server_errors = sum(server_stats.get(status, 0) for status in ("500", "502", "503"))
+    assert server_stats["429"] > 0 and server_errors > 0 and server_stats["ok"] == 5
+    assert (stats["rate_limited"], stats["server_errors"]) == (server_stats["429"], server_errors)
+    assert stats["retries"] == server_stats["429"] + server_errors
+
+
+def test_seed_reproduces_fault_sequence():
+    runs = []
+    for _ in range(2):
+        with StubLLMServer(port=0, settings=FAULTS) as server:
+            _run(server, 3)
+            runs.append(dict(server.state.stats))
+    assert runs[0] == runs[1]
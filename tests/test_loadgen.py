@@ -0,0 +1,88 @@
+import asyncio
+import json
+from types import SimpleNamespace
+
+import pytest
+
+import src.eval.loadgen as loadgen
+from src.eval.loadgen import LoadGenerator, ramp_levels
+
+
+def _target(latency: float, calls: list):
+    async def aagent_api_inference(query, session_id=None):
+        calls.append(session_id)
+        await asyncio.sleep(latency)
+        return "ok"
+
+    return SimpleNamespace(aagent_api_inference=aagent_api_inference)
+
+
+def test_ramp_levels():
+    assert ramp_levels(1, 9, 5) == [1.0, 3.0, 5.0, 7.0, 9.0]
+    assert ramp_levels(1, 9, 1) == [9]
+
+
+def test_concurrency_mode_ignores_max_inflight(monkeypatch):
+    calls = []
+    monkeypatch.setattr(loadgen, "target_api", lambda: _target(0.05, calls))
+    generator = LoadGenerator(["q1", "q2"], mode="concurrency", levels=[1, 3], step_seconds=0.3, max_inflight=1)
+    results = asyncio.run(generator.run())
+
+    assert all(result["status"] == "ok" for result in results)
+    # 每个客户端依次完成请求：第一阶梯 1 个客户端，第二阶梯 3 个，数量受延迟限制
+    by_step = [sum(result["step"] == step for result in results) for step in range(2)]
+    assert 3 <= by_step[0] <= 8 and 12 <= by_step[1] <= 22
+    assert len(calls) == len(results)
+
+
+def test_rps_mode_drops_over_max_inflight(monkeypatch):
+    calls = []
+    monkeypatch.setattr(loadgen, "target_api", lambda: _target(0.5, calls))
+    generator = LoadGenerator(["q"], mode="rps", levels=[20], step_seconds=0.25, sessions=2, max_inflight=2)
+    results = asyncio.run(generator.run())
+
+    statuses = [result["status"] for result in results]
+    assert len(results) == 5
+    assert statuses.count("ok") == 2 and statuses.count("dropped") == 3
+    assert len(calls) == 2 and calls[0] != calls[1] and all(call.startswith("loadgen-") for call in calls)
+
+
+def test_summarize_finds_saturation_step():
+    generator = LoadGenerator(["q"], mode="rps", levels=[2, 4], step_seconds=1.0)
+    ok = {"status": "ok", "latency": 0.1, "lag": 0.0}
+    generator.results = (
+        [{**ok, "step": 0, "finished_at": 0.5}] * 2
+        + [{**ok, "step": 1, "finished_at": 1.5}] * 2
+        + [{"status": "timeout", "error": "ReadTimeout", "step": 1, "finished_at": 1.9}] * 2
+    )
+    summary = generator.summarize()
+
+    first, second = summary["steps"]
+    assert (first["sent"], first["ok"], first["throughput"], first["error_rate"]) == (2, 2, 2.0, 0.0)
+    assert second["errors"] == {"timeout:ReadTimeout": 2} and second["error_rate"] == 0.5
+    saturation = summary["saturation"]
+    assert (saturation["step"], saturation["level"], saturation["sustained_level"]) == (1, 4, 2)
+    assert len(saturation["reasons"]) == 2
+    assert summary["totals"] == {"sent": 6, "ok": 4, "error_rate": 0.3333, "p50": 0.1, "p99": 0.1}
+
+
+def test_run_load_rejects_invalid_steps_and_duration(tmp_path):
+    report_file = str(tmp_path / "loadgen_report.json")
+    for kwargs in ({"steps": 0}, {"duration": 0}, {"duration": -1.0}, {"max_inflight": 0}):
+        with pytest.raises(ValueError):
+            asyncio.run(loadgen.run_load(report_file=report_file, **kwargs))
+
+
+def test_run_load_defaults_to_described_queries(tmp_path, monkeypatch):
+    calls, sources = [], []
+    monkeypatch.setattr(loadgen, "target_api", lambda: _target(0.01, calls))
+    monkeypatch.setattr(loadgen, "load_queries", lambda source: sources.append(source) or ["描述后的查询"])
+    report_file = tmp_path / "loadgen_report.json"
+    asyncio.run(loadgen.run_load(
+        mode="concurrency", start=1, end=1, steps=1, duration=0.1, sessions=0, report_file=str(report_file)
+    ))
+
+    assert sources == ["described"] and calls
+    report = json.loads(report_file.read_text(encoding="utf-8"))
+    # 显式传入的参数不会被配置覆盖
+    assert report["params"]["step_seconds"] == 0.1 and report["params"]["source"] == "described"
@@ -0,0 +1,135 @@
+import asyncio
+from contextlib import asynccontextmanager
+
+from mcp.types import CallToolResult, ListToolsResult, TextContent, Tool
+
+from src.tools.inprocess_target import MCPToolCache
+
+SCHEMA = {"type": "object", "properties": {"x": {"type": "number"}}, "required": ["x"]}
+
+
+class FakeSession:
+    def __init__(self, client, number):
+        self.client = client
+        self.number = number
+        self.holder = asyncio.current_task()
+        self.dropped = False
+
+    async def list_tools(self, cursor=None):
+        self.client.list_calls += 1
+        return ListToolsResult(tools=[Tool(name=name, description=f"{name} 工具", inputSchema=SCHEMA) for name in self.client.tools])
+
+    async def call_tool(self, name, arguments, **kwargs):
+        assert not self.dropped, "调用了已断开的会话"
+        return CallToolResult(content=[TextContent(type="text", text=f"会话 {self.number}: {name}({arguments['x']})")])
+
+    def drop(self):
+        """模拟连接断开：与 mcp 的 anyio 任务组一样取消持有会话的任务，会话以异常退出。"""
+        self.dropped = True
+        self.holder.cancel()
+
+
+async def _call(tool, x):
+    blocks = await tool.ainvoke({"x": x})
+    return "".join(block["text"] for block in blocks)
+
+
+class FakeClient:
+    """只实现 MCPToolCache 用到的 MultiServerMCPClient 接口。"""
+
+    def __init__(self, tools):
+        self.connections = {"calc": {}}
+        self.callbacks = None
+        self.tool_interceptors = []
+        self.tool_name_prefix = False
+        self.tools = list(tools)
+        self.sessions = []
+        self.list_calls = 0
+
+    @asynccontextmanager
+    async def session(self, name):
+        session = FakeSession(self, len(self.sessions) + 1)
+        self.sessions.append(session)
+        try:
+            yield session
+        except asyncio.CancelledError:
+            if session.dropped:
+                raise ConnectionError("连接已断开")
+            raise
+        finally:
+            session.dropped = True
+
+
+def test_tools_are_cached_until_refresh_interval():
+    client = FakeClient(["add"])
+    cache = MCPToolCache(client, refresh_interval=300)
+
+    async def run():
+        first = await cache.get_tools()
+        second = await cache.get_tools()
+        await cache.aclose()
+        return first, second
+
+    (version, tools), (again_version, again_tools) = asyncio.run(run())
+    assert (version, again_version) == (1, 1)
+    assert again_tools is tools and [tool.name for tool in tools] == ["add"]
+    assert (len(client.sessions), client.list_calls) == (1, 1)
+
+
+def test_refresh_keeps_version_until_tool_set_changes():
+    client = FakeClient(["add"])
+    cache = MCPToolCache(client, refresh_interval=0)
+
+    async def run():
+        versions = []
+        _, tools = await cache.get_tools()
+        # 工具集未变：重新列出后 version 与工具对象保持不变，会话复用
+        version, unchanged = await cache.get_tools()
+        versions.append(version)
+        assert unchanged is tools
+        client.tools.append("mul")
+        version, tools = await cache.get_tools()
+        versions.append(version)
+        result = await _call(tools[1], 2)
+        await cache.aclose()
+        return versions, [tool.name for tool in tools], result
+
+    versions, names, result = asyncio.run(run())
+    assert versions == [1, 2] and names == ["add", "mul"]
+    assert result == "会话 1: mul(2)"
+    assert (len(client.sessions), client.list_calls) == (1, 3)
+
+
+def test_dropped_session_reconnects_before_refresh_interval():
+    client = FakeClient(["add"])
+    cache = MCPToolCache(client, refresh_interval=300)
+
+    async def run():
+        _, tools = await cache.get_tools()
+        assert await _call(tools[0], 1) == "会话 1: add(1)"
+        client.sessions[0].drop()
+        await asyncio.sleep(0)
+        # 缓存未过期，但持有会话的任务已经结束：立即重新连接并更新工具
+        version, tools = await cache.get_tools()
+        result = await _call(tools[0], 2)
+        await cache.aclose()
+        return version, result
+
+    version, result = asyncio.run(run())
+    assert version == 2
+    assert result == "会话 2: add(2)"
+    assert len(client.sessions) == 2
+
+
+def test_event_loops_do_not_share_sessions():
+    client = FakeClient(["add"])
+    cache = MCPToolCache(client, refresh_interval=300)
+
+    async def run():
+        version, tools = await cache.get_tools()
+        result = await _call(tools[0], 3)
+        await cache.aclose()
+        return version, result
+
+    assert asyncio.run(run()) == (1, "会话 1: add(3)")
+    assert asyncio.run(run()) == (1, "会话 2: add(3)")
@@ -0,0 +1,90 @@
+import asyncio
+
+from langchain.agents.middleware import ModelRequest
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage, ToolMessage
+
+from src.mock.chat_model import ScriptedChatModel
+from src.utils.memory import (
+    SUMMARY_HEADER,
+    FileMemory,
+    MemoryCompactionMiddleware,
+    estimate_text_tokens,
+    estimate_tokens,
+)
+
+
+def _exchange(number: int, size: int = 10):
+    call = AIMessage("", tool_calls=[{"name": "agent_chat_inference", "args": {"query": f"第 {number} 轮"}, "id": f"c{number}"}])
+    return [call, ToolMessage("回复" * size, tool_call_id=f"c{number}", name="agent_chat_inference")]
+
+
+def _history(exchanges: int, size: int = 10):
+    messages = [HumanMessage("测试任务")]
+    for number in range(1, exchanges + 1):
+        messages += _exchange(number, size)
+    return messages + [AIMessage("结论")]
+
+
+def test_trim_keeps_whole_tool_exchanges(tmp_path):
+    memory = FileMemory("evaluator", base_dir=str(tmp_path))
+    history = _history(4)
+    assert memory.trim(history, 2) == history[5:]
+    assert isinstance(memory.trim(history, 2)[0], AIMessage)
+    assert memory.trim(history, 9) == history
+    assert memory.trim(history, 0) == []
+
+
+def test_summary_lists_calls_and_clips_results(tmp_path):
+    memory = FileMemory("evaluator", base_dir=str(tmp_path))
+    lines = memory.summary(_history(1, size=200), max_chars=20).splitlines()
+    assert lines[0] == "- human: 测试任务"
+    assert lines[1] == '- 调用 agent_chat_inference({"query": "第 1 轮"})'
+    assert lines[2] == "  - agent_chat_inference 返回: " + "回复" * 10 + "…"
+    assert lines[3] == "- ai: 结论"
+
+
+def test_estimate_counts_cjk_characters_as_one_token():
+    assert estimate_text_tokens("abcd" * 100) == 100
+    assert estimate_text_tokens("你好世界" * 100) == 400
+    assert estimate_tokens([HumanMessage("你好世界" * 100)]) > 400
+
+
+def test_explicit_zero_is_not_replaced_by_config():
+    middleware = MemoryCompactionMiddleware("evaluator", compact_threshold=0.0, keep_tool_exchanges=0)
+    assert (middleware.compact_threshold, middleware.keep_tool_exchanges) == (0.0, 0)
+
+
+def _request(messages):
+    return ModelRequest(model=ScriptedChatModel(), messages=messages, system_message=SystemMessage("系统提示词"), tools=[])
+
+
+def _run(middleware, request):
+    seen = []
+
+    async def handler(request):
+        seen.append(request.messages)
+        return "response"
+
+    assert asyncio.run(middleware.awrap_model_call(request, handler)) == "response"
+    return seen[0]
+
+
+def test_middleware_leaves_short_context_untouched():
+    middleware = MemoryCompactionMiddleware("evaluator", context_window=100000, compact_threshold=0.5)
+    history = _history(6)
+    assert _run(middleware, _request(history)) == history
+
+
+def test_middleware_compacts_chinese_context_and_keeps_recent_exchanges():
+    history = _history(6, size=300)
+    # 按 4 字符 / token 估算不到 2000，按中文每字 1 个 token 约 3600
+    middleware = MemoryCompactionMiddleware(
+        "evaluator", context_window=4000, compact_threshold=0.5, keep_tool_exchanges=2, summary_max_tokens=200
+    )
+    compacted = _run(middleware, _request(history))
+
+    assert compacted[0] == history[0]
+    assert compacted[1].content.startswith(SUMMARY_HEADER)
+    # 保留最近 2 次工具调用的原文与最后的回复
+    assert compacted[2:] == history[-5:]
+    assert estimate_tokens(compacted) <= 2000
@@ -0,0 +1,100 @@
+import pytest
+
+import src.utils.metrics as metrics
+from src.utils.metrics import MetricsCollector, percentile, sample_scope
+
+
+@pytest.mark.parametrize(
+    "values, q, expected",
+    [
+        ([], 50, None),
+        ([0.7], 50, 0.7),
+        ([0.7], 99, 0.7),
+        ([3, 1, 2], 0, 1),
+        ([3, 1, 2], 50, 2),
+        (list(range(1, 11)), 50, 5),
+        (list(range(1, 11)), 95, 10),
+        (list(range(1, 101)), 99, 99),
+    ],
+)
+def test_percentile_nearest_rank(values, q, expected):
+    assert percentile(values, q) == expected
+
+
+def _record(kind, name, wall_seconds, status="ok", agent_type=None, sample_id="s1", **fields):
+    return {
+        "kind": kind, "name": name, "agent_type": agent_type, "sample_id": sample_id,
+        "wall_seconds": wall_seconds, "status": status, **fields,
+    }
+
+
+@pytest.fixture(autouse=True)
+def prices(monkeypatch):
+    monkeypatch.setattr(metrics, "_prices", lambda: {"cache_hit": 1.0, "cache_miss": 2.0, "output": 4.0})
+
+
+def test_summarize_empty():
+    summary = MetricsCollector.summarize([])
+    assert (summary["llm"], summary["tool"], summary["target"]) == ({}, {}, {})
+    assert summary["totals"] == {
+        "samples": 0, "llm_calls": 0, "llm_retries": 0, "tool_calls": 0, "target_calls": 0,
+        "prompt_tokens": 0, "completion_tokens": 0, "cache_hit_tokens": 0, "cost": 0,
+    }
+
+
+def test_summarize_single_llm_call():
+    tokens = {"prompt_tokens": 1000, "completion_tokens": 500, "cache_hit_tokens": 800, "cache_miss_tokens": 200}
+    summary = MetricsCollector.summarize([_record("llm", "deepseek-chat", 1.5, agent_type="evaluator", **tokens)])
+
+    stats = summary["llm"]["evaluator"]
+    assert (stats["calls"], stats["errors"]) == (1, 0)
+    assert stats["p50"] == stats["p99"] == stats["max"] == stats["wall_seconds"] == 1.5
+    # 800 * 1 + 200 * 2 + 500 * 4 个百万分之一元
+    assert stats["cost"] == 0.0032
+    assert summary["totals"]["llm_calls"] == 1 and summary["totals"]["cost"] == 0.0032
+
+
+def test_summarize_groups_and_excludes_failures_from_latency():
+    records = [
+        _record("llm", "deepseek-chat", 1.0, agent_type="describer", sample_id="s1,s2"),
+        _record("llm", "deepseek-chat", 9.0, status="error", agent_type="describer", error="RateLimitError"),
+        _record("llm", "deepseek-chat", 2.0, agent_type=None, sample_id="s3"),
+        _record("tool", "agent_chat_inference", 0.5),
+        _record("tool", "agent_chat_inference", 0.1, status="error"),
+    ]
+    summary = MetricsCollector.summarize(records)
+
+    assert set(summary["llm"]) == {"describer", "unknown"}
+    describer = summary["llm"]["describer"]
+    assert (describer["calls"], describer["errors"], describer["max"]) == (1, 1, 1.0)
+    assert summary["tool"]["agent_chat_inference"]["calls"] == 1
+    assert summary["tool"]["agent_chat_inference"]["errors"] == 1
+    # 打包调用的样本 ID 以逗号分隔
+    assert summary["totals"]["samples"] == 3
+    assert (summary["totals"]["llm_calls"], summary["totals"]["llm_retries"]) == (2, 1)
+
+
+def test_summarize_target_counts_timeouts_and_ignores_missing_ttft():
+    records = [
+        _record("target", "agent_chat_inference", 2.0, ttft=0.2, inter_token_p50=0.01, inter_token_max=0.3),
+        _record("target", "agent_chat_inference", 4.0, ttft=0.6, inter_token_p50=0.03, inter_token_max=0.1, truncated=True),
+        _record("target", "agent_chat_inference", 1.0, ttft=None),
+        _record("target", "agent_chat_inference", 30.0, status="timeout", ttft=5.0),
+        _record("target", "agent_chat_inference", 0.1, status="error"),
+    ]
+    stats = MetricsCollector.summarize(records)["target"]["agent_chat_inference"]
+
+    assert (stats["calls"], stats["errors"], stats["timeouts"]) == (3, 2, 1)
+    assert stats["max"] == 4.0
+    assert stats["ttft"]["max"] == 0.6 and stats["ttft"]["wall_seconds"] == 0.8
+    assert (stats["inter_token_p50"], stats["inter_token_max"], stats["truncated"]) == (0.01, 0.3, 1)
+
+
+def test_collector_record_and_drain():
+    collector = MetricsCollector()
+    with sample_scope("s9"):
+        collector.record("target", "agent_chat_inference", 1.25, status="timeout")
+    assert collector.count() == 1
+    assert collector.records()[0]["sample_id"] == "s9"
+    assert [record["status"] for record in collector.drain()] == ["timeout"]
+    assert collector.drain() == [] and collector.count() == 0
@@ -0,0 +1,63 @@
+import asyncio
+
+import pytest
+
+from src.agents.packing import PackError, check_pack_size, make_packs, run_pack
+
+
+def test_make_packs_respects_sample_limit_and_token_budget():
+    texts = ["短样本"] * 5 + ["很长的样本" * 400]
+    packs = make_packs(list(range(6)), texts, token_budget=200, max_samples=2)
+    assert packs == [[0, 1], [2, 3], [4], [5]]
+
+
+def test_run_pack_splits_malformed_pack_down_to_single_samples():
+    calls = []
+
+    async def invoke_pack(items):
+        calls.append(list(items))
+        # 只有不超过 2 个样本的包能正确返回
+        return check_pack_size([item * 10 for item in items], len(items) if len(items) <= 2 else 0)
+
+    async def invoke_one(item):
+        calls.append([item])
+        return item * 10
+
+    assert asyncio.run(run_pack([1, 2, 3, 4, 5], invoke_pack, invoke_one)) == [10, 20, 30, 40, 50]
+    assert calls == [[1, 2, 3, 4, 5], [1, 2], [3, 4, 5], [3], [4, 5]]
+
+
+def test_check_pack_size_raises_on_mismatch():
+    with pytest.raises(PackError):
+        check_pack_size([1], 2)
+
+
+def test_packed_analyze_skips_failed_samples(tmp_path, monkeypatch):
+    from src.eval.coordinator import Coordinator
+    from src.eval.utils.analysis import analyze_one, failure_row, failure_text
+    from src.eval.utils.checkpoint import CheckpointJournal
+    from src.eval.utils.data_loader import DataLoader
+
+    coordinator = Coordinator(DataLoader())
+    monkeypatch.setattr(Coordinator, "_pack_config", staticmethod(lambda: (8, 4000)))
+    journal = CheckpointJournal(str(tmp_path / "analyze.jsonl"))
+    failed = failure_text("evaluates", RuntimeError("boom"))
+    packed = []
+
+    async def invoke_pack(items):
+        packed.append(list(items))
+        return [{"test_result": "通过", "reason": item} for item in items]
+
+    async def invoke_one(item):
+        return (await invoke_pack([item]))[0]
+
+    inputs = ["评估 1", failed, "评估 3"]
+    results = asyncio.run(coordinator._packed_gather(
+        journal, {}, ["s1", "s2", "s3"], ["h1", "h2", "h3"], inputs, invoke_pack, invoke_one, desc="Analyzing",
+    ))
+
+    assert packed == [["评估 1", "评估 3"]]
+    # 与逐个调用 analyze_one 得到的行一致，且不写入检查点
+    assert results[1] == failure_row(failed) == asyncio.run(analyze_one(None, failed))
+    assert results[1]["test_result"] == "未知"
+    assert set(journal.load()) == {"s1", "s3"}
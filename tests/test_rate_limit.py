@@ -0,0 +1,123 @@
+import asyncio
+import time
+from types import SimpleNamespace
+
+import pytest
+from langchain_core.messages import AIMessage, HumanMessage
+
+from src.utils.rate_limit import RateLimiter, RateLimitMiddleware, TokenBucket
+
+
+class StatusError(Exception):
+    def __init__(self, status_code: int):
+        super().__init__(f"status {status_code}")
+        self.status_code = status_code
+
+
+def test_token_bucket_allows_burst_then_waits():
+    bucket = TokenBucket(60)
+    for _ in range(60):
+        assert bucket.reserve(1, now=bucket.updated_at) == 0.0
+    # 每秒补充 1 个令牌
+    assert bucket.reserve(1, now=bucket.updated_at) == pytest.approx(1.0)
+    assert bucket.reserve(1, now=bucket.updated_at + 1.0) == 0.0
+
+
+def test_token_bucket_caps_oversized_request_and_allows_overdraft():
+    bucket = TokenBucket(100)
+    # 超过容量的请求在桶满时可以透支，之后的请求等待偿还
+    assert bucket.reserve(150, now=bucket.updated_at) == 0.0
+    assert bucket.tokens == -50
+    assert bucket.reserve(10, now=bucket.updated_at) == pytest.approx(60 / (100 / 60))
+
+
+def test_token_bucket_adjust_corrects_estimate():
+    bucket = TokenBucket(100)
+    bucket.reserve(40, now=bucket.updated_at)
+    bucket.adjust(-30)
+    assert bucket.tokens == 90
+
+
+def test_rate_limiter_waits_for_tpm():
+    limiter = RateLimiter(tpm=600)
+
+    async def run():
+        assert await limiter.acquire(600) == 0.0
+        return await limiter.acquire(5)
+
+    # 每秒补充 10 个 token
+    assert asyncio.run(run()) == pytest.approx(0.5, abs=0.05)
+    stats = limiter.stats()
+    assert stats["requests"] == 2
+    assert stats["throttled"] == 1
+
+
+def test_rate_limiter_returns_rpm_when_tpm_exhausted():
+    limiter = RateLimiter(rpm=60, tpm=600)
+    asyncio.run(limiter.acquire(600))
+    before = limiter._requests.tokens
+
+    async def run():
+        task = asyncio.create_task(limiter.acquire(300))
+        await asyncio.sleep(0.05)
+        task.cancel()
+
+    asyncio.run(run())
+    # 被 TPM 挡住的请求不占用 RPM 配额
+    assert limiter._requests.tokens >= before
+
+
+def test_rate_limiter_cools_down_after_429():
+    limiter = RateLimiter()
+    limiter.record_retry(429, 0.2)
+    start = time.monotonic()
+    asyncio.run(limiter.acquire(1))
+    assert time.monotonic() - start >= 0.15
+    assert limiter.stats()["rate_limited"] == 1
+
+
+def _request():
+    return SimpleNamespace(messages=[HumanMessage("hi")], system_message=None)
+
+
+def test_middleware_retries_retryable_errors():
+    middleware = RateLimitMiddleware(RateLimiter(max_retries=3, backoff_base=0.0))
+    errors = [StatusError(503), StatusError(429)]
+
+    async def handler(request):
+        if errors:
+            raise errors.pop(0)
+        return AIMessage("ok")
+
+    response = asyncio.run(middleware.awrap_model_call(_request(), handler))
+    assert response.content == "ok"
+    stats = middleware.limiter.stats()
+    assert (stats["retries"], stats["server_errors"], stats["rate_limited"]) == (2, 1, 1)
+
+
+@pytest.mark.parametrize("error, calls", [(StatusError(400), 1), (StatusError(503), 3)])
+def test_middleware_raises_non_retryable_or_exhausted(error, calls):
+    middleware = RateLimitMiddleware(RateLimiter(max_retries=2, backoff_base=0.0))
+    attempts = []
+
+    async def handler(request):
+        attempts.append(1)
+        raise error
+
+    with pytest.raises(StatusError):
+        asyncio.run(middleware.awrap_model_call(_request(), handler))
+    assert len(attempts) == calls
+    assert middleware.limiter.stats()["failures"] == 1
+
+
+def test_configure_rate_limiter_splits_quota_between_workers():
+    from src.utils.rate_limit import configure_rate_limiter, get_rate_limiter
+
+    try:
+        limiter = configure_rate_limiter(4)
+        assert get_rate_limiter() is limiter
+        # config.ini: rpm = 120, tpm = 400000
+        assert (limiter._requests.capacity, limiter._tokens.capacity) == (30, 100000)
+    finally:
+        configure_rate_limiter(1)
+    assert get_rate_limiter()._requests.capacity == 120
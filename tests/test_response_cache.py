@@ -0,0 +1,120 @@
+import asyncio
+import json
+import pickle
+import sqlite3
+import time
+
+import pytest
+from langchain.agents.middleware import ModelResponse
+from langchain_core.messages import AIMessage
+from pydantic import BaseModel
+
+from src.utils.response_cache import ResponseCache
+
+
+def _response(text: str) -> ModelResponse:
+    return ModelResponse(result=[AIMessage(text)])
+
+
+def test_fetch_coalesces_concurrent_requests_and_hits_afterwards(tmp_path):
+    cache = ResponseCache(str(tmp_path / "cache.sqlite"))
+    calls = []
+
+    async def compute():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return _response("answer")
+
+    async def run():
+        return await asyncio.gather(*(cache.fetch("k", "describer", compute) for _ in range(5)))
+
+    responses = asyncio.run(run())
+    assert len(calls) == 1
+    assert [response.result[0].content for response in responses] == ["answer"] * 5
+    # 等待者拿到的是副本，修改不影响其他调用方
+    assert len({id(response) for response in responses}) == 5
+
+    again = asyncio.run(cache.fetch("k", "describer", compute))
+    assert again.result[0].content == "answer" and len(calls) == 1
+    stats = cache.stats("describer")
+    assert (stats["misses"], stats["coalesced"], stats["hits"], stats["stored"]) == (1, 4, 1, 1)
+    assert stats["hit_rate"] == pytest.approx(5 / 6, abs=1e-4)
+
+
+def test_waiters_retry_when_leader_fails(tmp_path):
+    cache = ResponseCache(str(tmp_path / "cache.sqlite"))
+    attempts = []
+
+    async def compute():
+        attempts.append(1)
+        await asyncio.sleep(0.02)
+        if len(attempts) == 1:
+            raise RuntimeError("boom")
+        return _response("second")
+
+    async def run():
+        return await asyncio.gather(
+            cache.fetch("k", "analyst", compute), cache.fetch("k", "analyst", compute), return_exceptions=True
+        )
+
+    # 两个请求都先在线程中查缓存，哪一个成为第一个请求不确定
+    failed, waited = sorted(asyncio.run(run()), key=lambda result: not isinstance(result, RuntimeError))
+    assert isinstance(failed, RuntimeError)
+    assert waited.result[0].content == "second"
+    assert len(attempts) == 2
+
+
+def test_evict_removes_least_recently_used_entries(tmp_path):
+    cache = ResponseCache(str(tmp_path / "cache.sqlite"), max_mb=0.001)
+    for index in range(5):
+        cache.put(f"k{index}", "describer", _response("x" * 300))
+    cache.get("k0")
+    assert cache.evict() > 0
+    assert cache.get("k0") is not None
+    assert cache.get("k1") is None
+
+
+class _Verdict(BaseModel):
+    test_result: str
+    score: int
+
+
+def test_responses_round_trip_as_json(tmp_path):
+    cache = ResponseCache(str(tmp_path / "cache.sqlite"))
+    message = AIMessage("", tool_calls=[{"name": "_Verdict", "args": {"test_result": "通过", "score": 8}, "id": "c1"}])
+    cache.put("k", "analyst", ModelResponse(result=[message], structured_response=_Verdict(test_result="通过", score=8)))
+
+    with sqlite3.connect(cache.file_path) as conn:
+        stored = conn.execute("SELECT value FROM responses WHERE key = 'k'").fetchone()[0]
+    assert json.loads(stored)["structured_response"]["data"] == {"test_result": "通过", "score": 8}
+
+    response = cache.get("k")
+    assert response.structured_response == _Verdict(test_result="通过", score=8)
+    assert response.result[0].tool_calls[0]["args"] == {"test_result": "通过", "score": 8}
+
+
+def test_pickled_entries_are_not_unpickled(tmp_path):
+    cache = ResponseCache(str(tmp_path / "cache.sqlite"))
+    payload = pickle.dumps(_Exploit())
+    with sqlite3.connect(cache.file_path) as conn:
+        conn.execute(
+            "INSERT INTO responses (key, agent, value, size, created_at, used_at) VALUES ('k', 'a', ?, ?, ?, ?)",
+            (payload, len(payload), time.time(), time.time()),
+        )
+    assert cache.get("k") is None
+    assert _UNPICKLED == []
+    # 确认载荷本身确实会执行代码
+    pickle.loads(payload)
+    assert _UNPICKLED == [True]
+
+
+_UNPICKLED = []
+
+
+def _mark():
+    _UNPICKLED.append(True)
+
+
+class _Exploit:
+    def __reduce__(self):
+        return (_mark, ())
@@ -0,0 +1,16 @@
+import asyncio
+
+from src.tools.target_client import get_target_http_client, target_timeouts
+
+
+def test_target_client_is_shared_within_a_loop_and_uses_agent_timeouts():
+    async def clients():
+        return get_target_http_client(), get_target_http_client()
+
+    first, same = asyncio.run(clients())
+    other, _ = asyncio.run(clients())
+    assert first is same
+    # httpx.AsyncClient 绑定事件循环，每个事件循环各自创建
+    assert first is not other
+    connect_timeout, read_timeout = target_timeouts()
+    assert (first.timeout.connect, first.timeout.read) == (connect_timeout, read_timeout)
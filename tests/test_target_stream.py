@@ -0,0 +1,116 @@
+import asyncio
+from typing import Any, AsyncIterator, List, Optional
+
+import pytest
+from langchain.agents import create_agent
+from langchain_core.messages import AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGenerationChunk
+from langchain_core.tools import tool
+
+from src.mock.chat_model import ScriptedChatModel
+from src.tools.inprocess_target import stream_tokens, streaming_chat_model
+from src.tools.target_stream import STREAM_RESET, consume_stream
+
+
+async def _chunks(items: List[Any], delay: float = 0.0) -> AsyncIterator[Any]:
+    for item in items:
+        if delay:
+            await asyncio.sleep(delay)
+        yield item
+
+
+def test_consume_stream_joins_chunks_and_times_them():
+    text, stats = asyncio.run(consume_stream(_chunks(["你好", "", "，世界"], delay=0.01)))
+    assert text == "你好，世界"
+    assert stats["ttft"] > 0 and stats["inter_token_max"] is not None
+    assert (stats["chunks"], stats["chars"], stats["truncated"]) == (2, 5, None)
+
+
+def test_consume_stream_truncates_by_chars():
+    text, stats = asyncio.run(consume_stream(_chunks(["abc", "defg", "hij"]), max_chars=5))
+    assert text.startswith("abcde\n[回复超过 5 个字符")
+    assert (stats["chars"], stats["truncated"]) == (5, "chars")
+
+
+def test_consume_stream_truncates_by_seconds_and_closes_stream():
+    closed = []
+
+    async def slow():
+        try:
+            yield "开头"
+            await asyncio.sleep(10)
+            yield "不会收到"
+        finally:
+            closed.append(True)
+
+    async def run():
+        started = asyncio.get_running_loop().time()
+        result = await consume_stream(slow(), max_seconds=0.1)
+        return result, asyncio.get_running_loop().time() - started
+
+    (text, stats), elapsed = asyncio.run(run())
+    assert text.startswith("开头\n[回复超过 0.1 秒")
+    assert stats["truncated"] == "seconds" and elapsed < 1
+    assert closed == [True]
+
+
+def test_consume_stream_raises_stream_errors():
+    async def broken():
+        yield "部分"
+        raise ConnectionError("断开")
+
+    with pytest.raises(ConnectionError):
+        asyncio.run(consume_stream(broken()))
+
+
+def test_consume_stream_reset_discards_earlier_text():
+    text, stats = asyncio.run(consume_stream(_chunks(["先查一下", STREAM_RESET, "答", "案"]), max_chars=5))
+    assert text == "答案"
+    assert (stats["chunks"], stats["chars"], stats["truncated"]) == (2, 2, None)
+
+
+class _StreamingScriptedModel(ScriptedChatModel):
+    """逐字流式输出的脚本模型，调用工具之前先输出一段说明文字。"""
+
+    streaming: bool = False
+    preamble: str = "我先查一下。"
+
+    async def _astream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager: Any = None,
+                       **kwargs: Any) -> AsyncIterator[ChatGenerationChunk]:
+        message = self._reply(messages)
+        tokens = list(str(message.content) or (self.preamble if message.tool_calls else ""))
+        chunks = [ChatGenerationChunk(message=AIMessageChunk(content=token)) for token in tokens]
+        if message.tool_calls:
+            chunks.append(ChatGenerationChunk(message=AIMessageChunk(content="", tool_call_chunks=[
+                {"name": call["name"], "args": str(call["args"]).replace("'", '"'), "id": call["id"], "index": 0}
+                for call in message.tool_calls
+            ])))
+        for chunk in chunks:
+            if run_manager is not None:
+                await run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+            yield chunk
+
+
+@tool
+def lookup(query: str) -> str:
+    """查询门店信息。"""
+    return f"门店信息: {query}"
+
+
+def test_inprocess_stream_matches_final_message():
+    model = streaming_chat_model(_StreamingScriptedModel(tool_script=["lookup", "lookup"]))
+    agent = create_agent(model=model, tools=[lookup])
+    payload = {"messages": [{"role": "user", "content": "附近有哪些门店"}]}
+
+    async def run():
+        response = await agent.ainvoke(payload)
+        text, stats = await consume_stream(stream_tokens(lambda: agent.ainvoke(payload)))
+        return response, text, stats
+
+    response, text, stats = asyncio.run(run())
+    final = response["messages"][-1].content
+    # 两轮工具调用之前的说明文字都已输出过，又被 STREAM_RESET 丢弃
+    assert sum(message.content == "我先查一下。" for message in response["messages"]) == 2
+    assert final.startswith("离线回复（第 2 次工具调用后）")
+    assert text == final
+    assert stats["chars"] == len(final) and stats["truncated"] is None
@@ -0,0 +1,89 @@
+import asyncio
+import json
+from uuid import uuid4
+
+import pytest
+
+import src.utils.timeline as timeline
+from src.utils.metrics import sample_scope
+from src.utils.timeline import COORDINATOR_LANE, enable_timeline, record_wait, span, traced_stage
+
+
+@pytest.fixture
+def recorder(tmp_path, monkeypatch):
+    monkeypatch.setattr(timeline, "_recorder", None)
+    monkeypatch.setattr(timeline, "_configured", False)
+    return enable_timeline(str(tmp_path / "timeline.json"))
+
+
+def _load(recorder):
+    with open(recorder.save(), encoding="utf-8") as f:
+        events = json.load(f)["traceEvents"]
+    names = {event["tid"]: event["args"]["name"] for event in events if event["name"] == "thread_name"}
+    return [event for event in events if event["ph"] == "X"], names
+
+
+def _assert_nested_within_tid(spans):
+    lanes = {}
+    for event in spans:
+        lanes.setdefault(event["tid"], []).append(event)
+    for tid, events in lanes.items():
+        stack = []
+        for event in sorted(events, key=lambda event: (event["ts"], -event["dur"])):
+            while stack and stack[-1] <= event["ts"]:
+                stack.pop()
+            end = event["ts"] + event["dur"]
+            assert not stack or end <= stack[-1], f"tid {tid} 中 {event['name']} 与外层 span 交叉"
+            stack.append(end)
+
+
+def test_overlapping_spans_are_split_into_sub_lanes(recorder):
+    recorder.add_span("pipeline", "stage", 0, 1000, lane=COORDINATOR_LANE)
+    # 与样本并行的 profiler 与另一段未归属样本的等待在 coordinator 泳道上交叉
+    recorder.add_span("profile", "stage", 100, 600, lane=COORDINATOR_LANE)
+    recorder.add_span("rate_limit_wait", "wait", 500, 800, lane=COORDINATOR_LANE)
+    # 同一样本内并行的两个工具调用，第二个工具的子运行时间上也落在第一个工具之内
+    first, second = str(uuid4()), str(uuid4())
+    with sample_scope("s1"):
+        recorder.add_span("tool_a", "tool", 100, 400, run_id=first)
+        recorder.add_span("tool_b", "tool", 200, 900, run_id=second)
+        recorder.add_span("llm", "llm", 250, 350, run_id=str(uuid4()), parent_run_id=second)
+
+    spans, names = _load(recorder)
+    _assert_nested_within_tid(spans)
+    by_name = {event["name"]: event for event in spans}
+    assert by_name["profile"]["tid"] == COORDINATOR_LANE
+    assert names[by_name["rate_limit_wait"]["tid"]] == "coordinator #2"
+    assert by_name["tool_a"]["tid"] != by_name["tool_b"]["tid"]
+    assert names[by_name["tool_b"]["tid"]] == "sample s1 #2"
+    # 子运行与父运行位于同一子泳道
+    assert by_name["llm"]["tid"] == by_name["tool_b"]["tid"]
+
+
+def test_concurrent_stage_and_samples_do_not_overlap(recorder):
+    @traced_stage("profile")
+    async def profile():
+        for _ in range(3):
+            with span("profiler_llm", "llm"):
+                await asyncio.sleep(0.01)
+
+    @traced_stage("pipeline")
+    async def pipeline():
+        profile_task = asyncio.create_task(profile())
+
+        async def sample(index):
+            with sample_scope(f"s{index}"), span("evaluates", "sample"):
+                await asyncio.sleep(0.005 * index)
+                record_wait("rate_limit_wait", 0.002)
+
+        async def unattributed():
+            await asyncio.sleep(0.015)
+            with span("describe_buffer", "wait"):
+                await asyncio.sleep(0.02)
+
+        await asyncio.gather(profile_task, unattributed(), *(sample(index) for index in range(4)))
+
+    asyncio.run(pipeline())
+    spans, _ = _load(recorder)
+    assert len(spans) == 1 + 1 + 3 + 1 + 4 * 2
+    _assert_nested_within_tid(spans)
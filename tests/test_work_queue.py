@@ -0,0 +1,100 @@
+import time
+
+import pytest
+
+from src.eval.utils.work_queue import DONE, FAILED, LEASED, PENDING, LeaseLost, WorkQueue
+
+
+@pytest.fixture
+def queue(tmp_path):
+    queue = WorkQueue(str(tmp_path / "queue.sqlite"), max_attempts=2)
+    queue.initialize([[0, 2], [1]], fingerprint="a")
+    return queue
+
+
+def test_claim_hands_out_each_task_once(queue):
+    assert queue.claim("w1", 60) == (0, [0, 2])
+    assert queue.claim("w2", 60) == (1, [1])
+    assert queue.claim("w3", 60) is None
+    assert queue.progress()[LEASED] == 2
+
+
+def test_expired_lease_is_taken_over(queue):
+    task_id, _ = queue.claim("w1", 0.05)
+    queue.claim("w1", 60)
+    time.sleep(0.1)
+    assert queue.progress()[PENDING] == 1
+    assert queue.claim("w2", 60) == (task_id, [0, 2])
+    # 原持有者续约失败，也不能再写入结果或完成任务
+    assert not queue.renew(task_id, "w1", 60)
+    with pytest.raises(LeaseLost):
+        queue.save_result(0, "d", "e", {"test_result": "通过"}, task_id, "w1")
+    queue.complete(task_id, "w1")
+    assert queue.progress()[DONE] == 0
+
+    assert queue.renew(task_id, "w2", 60)
+    queue.save_result(0, "d", "e", {"test_result": "通过"}, task_id, "w2")
+    assert queue.finished_indices([0, 2]) == [0]
+    queue.complete(task_id, "w2")
+    assert queue.progress()[DONE] == 1
+    assert queue.results()[0]["analyzed"] == {"test_result": "通过"}
+
+
+def test_failed_task_is_retried_until_max_attempts(queue):
+    task_id, _ = queue.claim("w1", 60)
+    queue.fail(task_id, "w1", "boom")
+    assert queue.claim("w1", 60)[0] == task_id
+    queue.fail(task_id, "w1", "boom")
+    assert queue.progress()[FAILED] == 1
+    assert queue.claim("w1", 60)[0] != task_id
+
+
+def test_existing_queue_requires_matching_fingerprint(queue):
+    queue.claim("w1", 60)
+    with pytest.raises(ValueError):
+        queue.initialize([[0], [1], [2]], fingerprint="b")
+    with pytest.raises(ValueError):
+        queue.check_fingerprint("b")
+    queue.check_fingerprint("a")
+    # 相同的测试集继续使用已有任务
+    queue.initialize([[0, 2], [1]], fingerprint="a")
+    assert queue.progress()[LEASED] == 1
+
+    queue.initialize([[0], [1], [2]], reset=True, fingerprint="b")
+    assert queue.progress()[PENDING] == 3
+    queue.check_fingerprint("b")
+
+
+def test_run_worker_records_failed_sample_without_requeueing(tmp_path, monkeypatch):
+    import asyncio
+
+    from src.eval import runner
+    from src.eval.utils.analysis import failure_row, is_failure
+
+    test_data = [{"query": "q0"}, {"query": "q1"}, {"query": "q2"}]
+    monkeypatch.setattr(runner.DataLoader, "load_test_data", lambda self: test_data)
+    monkeypatch.setattr(runner.Coordinator, "_load_evaluator_extras", lambda self, count: [{}] * count)
+
+    async def describe(self, item):
+        if item["query"] == "q1":
+            raise RuntimeError("boom")
+        return f"描述 {item['query']}"
+
+    async def evaluate(self, item_tuple):
+        return item_tuple[0] if is_failure(item_tuple[0]) else f"评估 {item_tuple[0]}"
+
+    async def analyze(analyst, item):
+        return failure_row(item) if is_failure(item) else {"test_result": "通过", "reason": item}
+
+    monkeypatch.setattr(runner.Coordinator, "_describe_one", describe)
+    monkeypatch.setattr(runner.Coordinator, "_evaluate_one", evaluate)
+    monkeypatch.setattr(runner, "analyze_one", analyze)
+
+    queue = WorkQueue(str(tmp_path / "queue.sqlite"))
+    assert runner.prepare_queue(queue) == 1
+    assert asyncio.run(runner.run_worker(queue, worker_id="w", concurrency=1, lease_seconds=60)) == 1
+
+    results = queue.results()
+    assert queue.progress()[DONE] == 1
+    assert [results[index]["analyzed"]["test_result"] for index in range(3)] == ["通过", "未知", "通过"]
+    assert is_failure(results[1]["described"]) and "RuntimeError: boom" in results[1]["analyzed"]["reason"]